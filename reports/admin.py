@@ -5,14 +5,16 @@ from django.http.response import HttpResponseRedirect
 from django.urls import reverse
 from django.utils.translation import gettext as _
 
+from . import fairshare
 from .models import Report, ReportSchedule
-from .tasks import generate_document
 
 
 @admin.register(Report)
 class ReportAdmin(admin.ModelAdmin):
-    list_display = ('id', 'report', 'typ', 'created_by',)
-    list_filter = ('organization',)
+    list_display = ('id', 'report', 'typ', 'created_by', 'generation_state',
+                    'attempts',)
+    list_filter = ('organization', 'generation_state',)
+    actions = ('regenerate',)
 
     @property
     def generated(self):
@@ -45,8 +47,17 @@ class ReportAdmin(admin.ModelAdmin):
             {'preserved_filters': preserved_filters, 'opts': opts}, obj_url)
         return HttpResponseRedirect(redirect_url)
 
+    def regenerate(self, request, queryset):
+        reports = fairshare.interleave(queryset)
+        for report in reports:
+            report.schedule_document_generation(force=True, countdown=0)
+        msg = _('%d reports scheduled for regeneration' % len(reports))
+        self.message_user(request, msg, messages.SUCCESS)
+    regenerate.short_description = _('Regenerate selected reports')
+
     def rerun_view(self, request, object_id, extra_context=None):
-        generate_document.apply_async(args=(object_id, ))
+        report = self.get_object(request, object_id)
+        report.schedule_document_generation(force=True, countdown=0)
         msg = _('Report Id: %s scheduled for regeneration' % (object_id, ))
         self.message_user(request, msg, messages.SUCCESS)
         return self._redirect_to_change_view(object_id, request)
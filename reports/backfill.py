@@ -0,0 +1,130 @@
+"""
+Historical backfill of a ``ReportSchedule``.
+
+Creates the reports of past windows in one bulk insert, lets the report class
+load the data of the whole range at once through ``BaseReport.prefetch`` and
+generates the documents with a bounded number of threads::
+
+    schedule.backfill(12, progress=lambda done, total, report: ...)
+
+Windows that already have a report are skipped. Backfilled reports are not
+emailed. They are created queued, without ``queued_at``, so that neither the
+cost-aware dispatch nor the reconciler send them to the workers while this
+process generates them.
+"""
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.db import connections
+
+from . import fairshare, metrics
+from .conf import BACKFILL_CONCURRENCY
+from .models import Report
+
+logger = logging.getLogger(__name__)
+
+Result = namedtuple('Result', ['created', 'skipped', 'failed'])
+
+
+def create_reports(schedule, windows):
+    """
+    :return: (created reports, number of windows that already had one)
+    """
+
+    qs = Report.objects.filter(
+        organization_id=schedule.organization_id, report=schedule.report,
+        typ=schedule.typ,
+        start_datetime__in=[start for start, __ in windows])
+    existing = set(qs.values_list('start_datetime', 'end_datetime'))
+
+    reports = []
+    for start_datetime, end_datetime in windows:
+        if (start_datetime, end_datetime) in existing:
+            continue
+        report = Report(
+            report=schedule.report, typ=schedule.typ,
+            organization=schedule.organization,
+            created_by=schedule.created_by, config=schedule.config,
+            start_datetime=start_datetime, end_datetime=end_datetime,
+            name=schedule.name, schedule=schedule,
+            generation_state=Report.STATE_QUEUED)
+        if not report.name:
+            # bulk_create does not call save
+            report.name = report._run_instance_method('get_report_name')
+        reports.append(report)
+
+    return Report.objects.bulk_create(reports), len(windows) - len(reports)
+
+
+def _generate(report, threaded):
+    try:
+        report.generate_document()
+        return True
+    except Exception:
+        logger.exception('Error generating backfilled report %s', report.pk)
+        return False
+    finally:
+        if threaded:
+            connections.close_all()
+
+
+def generate(reports, concurrency=BACKFILL_CONCURRENCY, progress=None):
+    """
+    Generates the documents with up to ``concurrency`` threads
+    :param progress: called with (done, total, report) after each report
+    :return: list of reports that failed
+    """
+
+    failed = []
+    total = len(reports)
+
+    def finished(done, report, ok):
+        if not ok:
+            failed.append(report)
+        metrics.incr('reports.backfill.generated' if ok else
+                     'reports.backfill.failed', report=report.report)
+        if progress is not None:
+            progress(done, total, report)
+
+    if concurrency <= 1:
+        for done, report in enumerate(reports, 1):
+            finished(done, report, _generate(report, False))
+        return failed
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = dict((pool.submit(_generate, report, True), report)
+                       for report in reports)
+        for done, future in enumerate(as_completed(futures), 1):
+            finished(done, futures[future], future.result())
+    return failed
+
+
+def backfill(schedule, windows, concurrency=BACKFILL_CONCURRENCY,
+             progress=None, dispatch=False):
+    """
+    :param windows: list of (start_datetime, end_datetime), oldest first
+    :param dispatch: schedule the generation on the Celery workers instead of
+        generating the documents in this process
+    :return: ``Result`` with the created reports, the number of skipped
+        windows and the reports that failed
+    """
+
+    created, skipped = create_reports(schedule, windows)
+    metrics.incr('reports.backfill.created', len(created),
+                 report=schedule.report)
+    if not created:
+        return Result(created, skipped, [])
+
+    if dispatch:
+        fairshare.dispatch(created)
+        return Result(created, skipped, [])
+
+    with metrics.timer('reports.backfill.prefetch', report=schedule.report):
+        created[0]._run_instance_method(
+            'prefetch',
+            windows=[(r.start_datetime, r.end_datetime) for r in created],
+            start_datetime=created[0].start_datetime,
+            end_datetime=created[-1].end_datetime)
+
+    return Result(created, skipped, generate(created, concurrency, progress))
@@ -1,30 +1,27 @@
-import base64
-import pychrome
-import sys
-import tempfile
-from django.conf import settings
-from django.core.files.base import ContentFile
-from pypandoc import convert_text
-from socket import gethostbyname
-
-# Syntax sugar.
-_ver = sys.version_info
-
-#: Python 2.x?
-is_py2 = (_ver[0] == 2)
-
-#: Python 3.x?
-is_py3 = (_ver[0] == 3)
-
-if is_py2:
-    from urlparse import urlparse
-elif is_py3:
-    from urllib.parse import urlparse
+from . import isolation, metrics
+from .chrome import get_pool
+from .conf import PDF_OPTIMIZE, PREVIEW_LIMIT
+from .html import get_template
+from .isolation import convert_markdown, print_pdf
+from .memo import data_provider  # NOQA
+from .pdf import optimize
 
 
 class BaseReport(object):
     id = ''
     name = ''
+    # Post-process PDF documents, defaults to ``REPORT_PDF_OPTIMIZE``
+    pdf_optimize = None
+    # Keyword arguments of ``reports.pdf.optimize``
+    pdf_options = {}
+    # Previews only cover the end of the window, e.g. ``timedelta(days=7)``
+    preview_window = None
+    # Rows ``sample`` keeps for a preview
+    preview_limit = PREVIEW_LIMIT
+    # Template rendered by the default ``generate_preview``
+    preview_template = None
+    # Read the data from ``REPORT_REPLICA_DATABASE`` if it is fresh enough
+    read_replica = True
 
     def get_report_name(self, **kwargs):
         return ' '.join([kwargs['organization'].name, self.id.capitalize(),
@@ -36,24 +33,102 @@ class BaseReport(object):
                                            kwargs['end_datetime'].date(),
                                            kwargs['typ'])
 
+    def prefetch(self, windows, **kwargs):
+        """
+        Called once before a backfill generates the reports of several
+        windows. Reports that can load the data of the whole range at once
+        override it, split the data per window and prime their data
+        providers with it.
+        :param windows: list of (start_datetime, end_datetime), oldest first
+        """
+
+        pass
+
+    def sample(self, queryset, preview=False, **kwargs):
+        """
+        Restricts a queryset to the first ``preview_limit`` rows when
+        previewing. Reports with a better sample, e.g. every n-th row or a
+        ``TABLESAMPLE`` query, override it.
+        """
+
+        if not preview:
+            return queryset
+        return queryset[:self.preview_limit]
+
+    def preview(self, **kwargs):
+        """
+        Renders a lightweight preview. The window is narrowed to
+        ``preview_window`` and ``generate_preview`` is called with
+        ``preview=True``.
+        :return: html document as a bytestring
+        """
+
+        start = kwargs['start_datetime']
+        if self.preview_window is not None:
+            start = max(start, kwargs['end_datetime'] - self.preview_window)
+        kwargs.update(start_datetime=start, preview=True)
+        return self.generate_preview(**kwargs)
+
+    def generate_preview(self, **kwargs):
+        """
+        Renders ``preview_template`` with the keyword arguments as context.
+        Reports override it to build their preview from sampled data.
+        """
+
+        if self.preview_template is None:
+            raise NotImplementedError(
+                'Report "{0}" does not support previews'.format(self.id))
+        return self.render_html(self.preview_template, kwargs)
+
+    def get_email_subject(self, **kwargs):
+        return self.get_report_name(**kwargs)
+
+    def get_email_body(self, link=None, **kwargs):
+        """
+        :param link: download url when the document is too large to attach
+        :return: plain text email body
+        """
+
+        if link:
+            return 'Your {0} is ready: {1}'.format(
+                self.get_report_name(**kwargs), link)
+        return 'Please find your {0} attached.'.format(
+            self.get_report_name(**kwargs))
+
     def markdown_to_doc(self, markdown, typ, reference=None):
         """
-        :param markdown: markdown document as a string
+        :param markdown: markdown document as a string or utf-8 bytes
         :param typ: document conversion output extension
         :param reference: path to the reference docx, if different from default
         :return: path to a temporary file
         """
 
-        with tempfile.NamedTemporaryFile(suffix='.{0}'.format(typ)) as temp:
-            extra_args = ['--dpi=180']
-            if typ == 'docx':
-                if reference:
-                    extra_args.append('--reference-doc={}'.format(reference))
-                extra_args.append('--toc')
-            convert_text(markdown, typ, 'markdown_phpextra',
-                         outputfile=temp.name, extra_args=extra_args)
-            with open(temp.name, 'rb') as document:
-                return ContentFile(document.read())
+        extra_args = ['--dpi=180']
+        if typ == 'docx':
+            if reference:
+                extra_args.append('--reference-doc={}'.format(reference))
+            extra_args.append('--toc')
+        if isinstance(markdown, str):
+            markdown = markdown.encode('utf-8')
+        return isolation.run(convert_markdown, markdown,
+                             suffix='.{0}'.format(typ), typ=typ,
+                             extra_args=extra_args)
+
+    def render_html(self, template_name, context):
+        """
+        :param template_name: template, compiled once per process
+        :param context: template context
+        :return: html document as a bytestring
+        """
+
+        with metrics.timer('reports.html.build', report=self.id):
+            html = get_template(template_name).render(context).encode('utf-8')
+        metrics.gauge('reports.html.size', len(html), report=self.id)
+        return html
+
+    def template_to_pdf(self, template_name, context, delay=5):
+        html = self.render_html(template_name, context)
+        return self.html_to_pdf(html, delay=delay)
 
     def html_to_pdf(self, html, delay=5):
         """
@@ -61,25 +136,30 @@ class BaseReport(object):
         :param delay: time to wait for javascript loading in seconds
         :return: path to a temporary file
         """
-        split = urlparse(settings.CHROME_URL)
-        ipaddr = gethostbyname(split.hostname)
-        # related to https://github.com/GoogleChrome/puppeteer/issues/2242
-        url = settings.CHROME_URL.replace(split.hostname, ipaddr)
-
-        browser = pychrome.Browser(url=url)
-        encoded_html = base64.b64encode(html)
-
-        data_url = "data:text/html;base64,{}".format(
-            encoded_html.decode('utf-8')
-        )
-        tab = browser.new_tab(data_url)
-        tab.start()
-
-        tab.wait(delay)
-        try:
-            data = tab.Page.printToPDF()
-            data = base64.b64decode(data['data'])
-            return ContentFile(data)
-        finally:
-            tab.stop()
-            browser.close_tab(tab)
+        with get_pool().connection() as url:
+            document = isolation.run(print_pdf, html, suffix='.pdf', url=url,
+                                     delay=delay)
+        return self.optimize_pdf(document)
+
+    def optimize_pdf(self, document):
+        """
+        Linearizes the PDF, downsamples large images and removes duplicate
+        ones when ``pdf_optimize`` is enabled
+        :param document: ContentFile with the PDF
+        :return: ContentFile with the optimized PDF
+        """
+
+        enabled = PDF_OPTIMIZE if self.pdf_optimize is None \
+            else self.pdf_optimize
+        if not enabled:
+            return document
+
+        document.seek(0)
+        with metrics.timer('reports.pdf.optimize', report=self.id):
+            optimized = isolation.run(optimize, document.read(),
+                                      suffix='.pdf', **self.pdf_options)
+        metrics.gauge('reports.pdf.size_before', document.size,
+                      report=self.id)
+        metrics.gauge('reports.pdf.size_after', optimized.size,
+                      report=self.id)
+        return optimized
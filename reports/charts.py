@@ -0,0 +1,266 @@
+"""
+Cached chart rendering for report figures.
+
+Charts are rendered to PNG or SVG bytes, cached by a hash of their kind,
+data and style, so identical charts across organizations, reruns and sibling
+reports are only rendered once. Renders can run in a thread pool while the
+rest of the report is built::
+
+    chart = Chart('bar', {'Alerts': counts}, labels=hosts, title='Alerts')
+    chart.render_async()
+    ...
+    markdown += chart.markdown('Alerts per host')
+
+The built-in renderers need matplotlib, others can be added with
+``@renderer('kind')``.
+"""
+import atexit
+import base64
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.html import escape
+
+from . import metrics
+from .conf import CHART_CACHE, CHART_CACHE_TIMEOUT, CHART_LOCAL_SIZE, \
+    CHART_WORKERS
+from .utils import LRUCache
+
+MIMETYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+renderers = {}
+local_cache = LRUCache(CHART_LOCAL_SIZE)
+
+_lock = threading.Lock()
+_pending = {}
+_executor = None
+_directory = None
+
+
+def renderer(kind):
+    """
+    Registers ``func(chart)`` returning the image bytes for a chart kind
+    """
+
+    def decorator(func):
+        renderers[kind] = func
+        return func
+
+    return decorator
+
+
+def _tolist(value):
+    return value.tolist() if hasattr(value, 'tolist') else list(value)
+
+
+class Chart(object):
+
+    def __init__(self, kind, series, labels=None, fmt='png', **style):
+        """
+        :param kind: registered renderer, e.g. 'line', 'bar' or 'pie'
+        :param series: dict of series name to values
+        :param labels: x axis or slice labels
+        :param fmt: 'png' or 'svg'
+        :param style: title, width, height, xlabel, ylabel, colors, dpi
+        """
+
+        if fmt not in MIMETYPES:
+            raise ValueError('Unknown chart format "{0}"'.format(fmt))
+        self.kind = kind
+        self.series = dict((name, _tolist(values))
+                           for name, values in series.items())
+        self.labels = _tolist(labels) if labels is not None else None
+        self.fmt = fmt
+        self.style = style
+
+    @property
+    def key(self):
+        data = json.dumps([self.kind, self.series, self.labels, self.fmt,
+                           self.style], sort_keys=True, default=str)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    @property
+    def mimetype(self):
+        return MIMETYPES[self.fmt]
+
+    def render(self):
+        """
+        :return: image bytes, from the cache when possible
+        """
+
+        return self.render_async().result()
+
+    def render_async(self):
+        """
+        :return: Future with the image bytes, rendered in the chart pool
+        """
+
+        key = self.key
+        with _lock:
+            data = local_cache.get(key)
+            if data is not None:
+                metrics.incr('reports.charts.hit', kind=self.kind)
+                future = Future()
+                future.set_result(data)
+                return future
+            if key in _pending:
+                return _pending[key]
+            future = _get_executor().submit(self._render, key)
+            _pending[key] = future
+            return future
+
+    def _render(self, key):
+        try:
+            shared = caches[CHART_CACHE] if CHART_CACHE else None
+            data = shared.get(key) if shared is not None else None
+            if data is None:
+                metrics.incr('reports.charts.miss', kind=self.kind)
+                if self.kind not in renderers:
+                    raise ValueError('Unknown chart kind "{0}"'.format(
+                        self.kind))
+                with metrics.timer('reports.charts.render', kind=self.kind):
+                    data = renderers[self.kind](self)
+                if shared is not None:
+                    shared.set(key, data, CHART_CACHE_TIMEOUT)
+            else:
+                metrics.incr('reports.charts.hit', kind=self.kind)
+            local_cache.set(key, data)
+            return data
+        finally:
+            with _lock:
+                _pending.pop(key, None)
+
+    def data_uri(self):
+        return 'data:{0};base64,{1}'.format(
+            self.mimetype, base64.b64encode(self.render()).decode('ascii'))
+
+    def html(self, alt=''):
+        """
+        :return: inline ``<img>`` tag for ``html_to_pdf`` documents
+        """
+
+        return '<img src="{0}" alt="{1}">'.format(self.data_uri(),
+                                                  escape(alt))
+
+    def path(self):
+        """
+        :return: path of a temporary file with the image, shared by all
+            identical charts of the process
+        """
+
+        path = os.path.join(_get_directory(),
+                            '{0}.{1}'.format(self.key, self.fmt))
+        if not os.path.exists(path):
+            with tempfile.NamedTemporaryFile(dir=_get_directory(),
+                                             delete=False) as temp:
+                temp.write(self.render())
+            os.rename(temp.name, path)
+        return path
+
+    def markdown(self, alt=''):
+        """
+        :return: image reference for ``markdown_to_doc`` documents
+        """
+
+        return '![{0}]({1})'.format(alt, self.path())
+
+
+def _get_executor():
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=CHART_WORKERS)
+    return _executor
+
+
+def _get_directory():
+    global _directory
+
+    with _lock:
+        if _directory is None:
+            _directory = tempfile.mkdtemp(prefix='reports-charts-')
+            atexit.register(shutil.rmtree, _directory, True)
+        return _directory
+
+
+def _figure(chart):
+    try:
+        from matplotlib.figure import Figure
+    except ImportError:
+        raise ImproperlyConfigured(
+            'matplotlib is required for the built-in charts, install it '
+            'with "pip install django-libreports[charts]"')
+
+    width = chart.style.get('width', 6.4)
+    height = chart.style.get('height', 4.8)
+    figure = Figure(figsize=(width, height))
+    axes = figure.add_subplot(1, 1, 1)
+    if chart.style.get('title'):
+        axes.set_title(chart.style['title'])
+    if chart.style.get('xlabel'):
+        axes.set_xlabel(chart.style['xlabel'])
+    if chart.style.get('ylabel'):
+        axes.set_ylabel(chart.style['ylabel'])
+    return figure, axes
+
+
+def _save(chart, figure):
+    buffer = BytesIO()
+    figure.savefig(buffer, format=chart.fmt, dpi=chart.style.get('dpi', 100),
+                   bbox_inches='tight')
+    return buffer.getvalue()
+
+
+def _colors(chart):
+    colors = chart.style.get('colors') or []
+    return lambda i: colors[i % len(colors)] if colors else None
+
+
+@renderer('line')
+def render_line(chart):
+    figure, axes = _figure(chart)
+    color = _colors(chart)
+    for i, (name, values) in enumerate(sorted(chart.series.items())):
+        x = chart.labels if chart.labels is not None else range(len(values))
+        axes.plot(x, values, label=name, color=color(i))
+    if len(chart.series) > 1:
+        axes.legend()
+    return _save(chart, figure)
+
+
+@renderer('bar')
+def render_bar(chart):
+    figure, axes = _figure(chart)
+    color = _colors(chart)
+    count = len(chart.series) or 1
+    width = 0.8 / count
+    for i, (name, values) in enumerate(sorted(chart.series.items())):
+        x = [j + i * width for j in range(len(values))]
+        axes.bar(x, values, width=width, label=name, color=color(i))
+    if chart.labels is not None:
+        axes.set_xticks([j + width * (count - 1) / 2.0
+                         for j in range(len(chart.labels))])
+        axes.set_xticklabels(chart.labels)
+    if count > 1:
+        axes.legend()
+    return _save(chart, figure)
+
+
+@renderer('pie')
+def render_pie(chart):
+    figure, axes = _figure(chart)
+    values = next(iter(chart.series.values()), [])
+    axes.pie(values, labels=chart.labels, colors=chart.style.get('colors'))
+    axes.axis('equal')
+    return _save(chart, figure)
@@ -0,0 +1,309 @@
+import logging
+import os
+import random
+import threading
+from contextlib import contextmanager
+from socket import gethostbyname
+from timeit import default_timer
+
+import requests
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+from .conf import (CHROME_CACHE, CHROME_HEALTH_INTERVAL, CHROME_MAX_TABS,
+                   CHROME_SLOT_TIMEOUT, CHROME_STRATEGY, CHROME_TIMEOUT,
+                   CHROME_URLS)
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+logger = logging.getLogger(__name__)
+
+LEAST_LOADED = 'least_loaded'
+ROUND_ROBIN = 'round_robin'
+
+KEY_PREFIX = 'reports:chrome'
+# Seconds between checks for slots freed by other processes
+POLL_INTERVAL = 0.5
+
+
+class ChromeUnavailable(Exception):
+    pass
+
+
+class Endpoint(object):
+    """
+    Chrome instance with remote debugging enabled
+    """
+
+    def __init__(self, url, max_tabs):
+        self.url = url
+        self.max_tabs = max_tabs
+        self.active = 0
+        self.healthy = True
+        self.checked_at = None
+
+    def __repr__(self):
+        return '<Endpoint {0} ({1}/{2})>'.format(self.url, self.active,
+                                                 self.max_tabs)
+
+    @property
+    def load(self):
+        return float(self.active) / self.max_tabs
+
+    def resolved_url(self):
+        split = urlparse(self.url)
+        ipaddr = gethostbyname(split.hostname)
+        # related to https://github.com/GoogleChrome/puppeteer/issues/2242
+        return self.url.replace(split.hostname, ipaddr)
+
+    def check(self, timeout=5):
+        """
+        :return: True if the DevTools endpoint answers
+        """
+
+        try:
+            response = requests.get(
+                '{0}/json/version'.format(self.url.rstrip('/')),
+                timeout=timeout)
+            return response.status_code == 200
+        except requests.RequestException:
+            return False
+
+
+class ChromePool(object):
+    """
+    Spreads PDF rendering over several Chrome instances. Endpoints whose
+    connection fails are taken out of rotation. A background thread, started
+    on first use in each process, checks them again every
+    ``health_interval`` seconds until they answer.
+
+    The renders per endpoint are counted in the ``cache`` alias, so the
+    load and the ``max_tabs`` limit cover every process sharing that cache,
+    e.g. all prefork children of the Celery workers. Without a cache, or
+    with a cache local to the process, they are counted per process.
+    """
+
+    def __init__(self, urls, strategy=LEAST_LOADED, max_tabs=CHROME_MAX_TABS,
+                 health_interval=CHROME_HEALTH_INTERVAL, cache=CHROME_CACHE):
+        if strategy not in (LEAST_LOADED, ROUND_ROBIN):
+            raise ValueError('Unknown strategy "{0}"'.format(strategy))
+        self.endpoints = [Endpoint(url, max_tabs) for url in urls]
+        self.strategy = strategy
+        self.health_interval = health_interval
+        self.cache = cache
+        self._next = 0
+        self._condition = threading.Condition()
+        self._monitor_pid = None
+        self._closed = threading.Event()
+
+    def check_health(self, force=False, unhealthy=False):
+        """
+        Checks endpoints that were not checked in the last
+        ``health_interval`` seconds.
+        :param unhealthy: only check the endpoints out of rotation
+        """
+
+        now = default_timer()
+        for endpoint in self.endpoints:
+            if unhealthy and endpoint.healthy:
+                continue
+            if not force and endpoint.checked_at is not None and \
+                    now - endpoint.checked_at < self.health_interval:
+                continue
+            healthy = endpoint.check()
+            with self._condition:
+                endpoint.checked_at = now
+                if healthy != endpoint.healthy:
+                    logger.warning('Chrome endpoint %s is %s', endpoint.url,
+                                   'back' if healthy else 'down')
+                endpoint.healthy = healthy
+                self._condition.notify_all()
+            metrics.gauge('reports.chrome.healthy', int(healthy),
+                          endpoint=endpoint.url)
+
+    def _monitor(self):
+        """
+        Starts the health checks of this process unless they are running,
+        threads do not survive the fork of a worker process
+        """
+
+        with self._condition:
+            if self._monitor_pid == os.getpid():
+                return
+            self._monitor_pid = os.getpid()
+        thread = threading.Thread(target=self._check_loop,
+                                  name='reports-chrome-health')
+        thread.daemon = True
+        thread.start()
+
+    def _check_loop(self):
+        interval = max(self.health_interval, POLL_INTERVAL)
+        while not self._closed.wait(interval):
+            try:
+                self.check_health(unhealthy=True)
+            except Exception:
+                logger.exception('Chrome health check failed')
+
+    def close(self):
+        """
+        Stops the health checks
+        """
+
+        self._closed.set()
+
+    def _key(self, endpoint):
+        return '{0}:{1}'.format(KEY_PREFIX, endpoint.url)
+
+    def _incr(self, key, delta=1):
+        cache = caches[self.cache]
+        try:
+            value = cache.incr(key, delta)
+        except ValueError:
+            # The counter expired
+            if delta < 0:
+                return 0
+            cache.add(key, 0, CHROME_SLOT_TIMEOUT)
+            value = cache.incr(key, delta)
+        # incr keeps the expiry set when the counter was added, slots that
+        # are in use must not expire with it
+        cache.touch(key, CHROME_SLOT_TIMEOUT)
+        return value
+
+    def _active(self):
+        """
+        :return: dict of endpoint -> renders running on it
+        """
+
+        if not self.cache:
+            return dict((e, e.active) for e in self.endpoints)
+        counts = caches[self.cache].get_many(
+            [self._key(e) for e in self.endpoints])
+        return dict((e, max(counts.get(self._key(e), 0), e.active))
+                    for e in self.endpoints)
+
+    def _rotate(self):
+        """
+        :return: index of the endpoint the next round starts at
+        """
+
+        if not self.cache:
+            start = self._next
+            self._next = (self._next + 1) % len(self.endpoints)
+            return start
+        return (self._incr('{0}:next'.format(KEY_PREFIX)) - 1) % \
+            len(self.endpoints)
+
+    def _candidates(self):
+        """
+        :return: healthy endpoints with a free slot in the order to try them
+        """
+
+        active = self._active()
+        available = [e for e in self.endpoints
+                     if e.healthy and active[e] < e.max_tabs]
+        if not available:
+            return []
+
+        if self.strategy == ROUND_ROBIN:
+            start = self._rotate()
+            ordered = self.endpoints[start:] + self.endpoints[:start]
+            return [e for e in ordered if e in available]
+
+        # Ties are broken randomly, processes that all see the same load
+        # would otherwise pick the same endpoint
+        random.shuffle(available)
+        return sorted(available, key=lambda e: float(active[e]) / e.max_tabs)
+
+    def _take(self, endpoint):
+        """
+        Takes a slot of the endpoint
+        :return: False if other processes took the last one first
+        """
+
+        if self.cache:
+            key = self._key(endpoint)
+            caches[self.cache].add(key, 0, CHROME_SLOT_TIMEOUT)
+            if self._incr(key) > endpoint.max_tabs:
+                self._incr(key, -1)
+                return False
+        endpoint.active += 1
+        return True
+
+    def acquire(self, timeout=CHROME_TIMEOUT):
+        """
+        Waits for an endpoint with a free tab slot
+        :param timeout: seconds to wait for a slot
+        :return: Endpoint
+        """
+
+        self._monitor()
+
+        deadline = default_timer() + timeout
+        with self._condition:
+            while True:
+                for endpoint in self._candidates():
+                    if self._take(endpoint):
+                        return endpoint
+
+                remaining = deadline - default_timer()
+                if not any(e.healthy for e in self.endpoints):
+                    raise ChromeUnavailable('No healthy Chrome endpoints')
+                if remaining <= 0:
+                    raise ChromeUnavailable(
+                        'Timed out waiting for a Chrome endpoint')
+                # Slots released by other processes are not notified
+                self._condition.wait(min(remaining, POLL_INTERVAL)
+                                     if self.cache else remaining)
+
+    def release(self, endpoint, failed=False):
+        with self._condition:
+            endpoint.active -= 1
+            if self.cache and self._incr(self._key(endpoint), -1) < 0:
+                caches[self.cache].set(self._key(endpoint), 0,
+                                       CHROME_SLOT_TIMEOUT)
+            if failed:
+                logger.warning('Chrome endpoint %s is down', endpoint.url)
+                endpoint.healthy = False
+                endpoint.checked_at = default_timer()
+            self._condition.notify_all()
+
+    @contextmanager
+    def connection(self, timeout=CHROME_TIMEOUT):
+        """
+        Context manager that yields the url of the selected endpoint
+        """
+
+        start = default_timer()
+        endpoint = self.acquire(timeout)
+        metrics.timing('reports.chrome.wait', default_timer() - start,
+                       endpoint=endpoint.url)
+        failed = False
+        try:
+            yield endpoint.resolved_url()
+        except (OSError, requests.RequestException):
+            failed = True
+            raise
+        finally:
+            self.release(endpoint, failed)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    :return: process wide ChromePool for ``CHROME_URLS`` or ``CHROME_URL``
+    """
+
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            urls = CHROME_URLS or [settings.CHROME_URL]
+            _pool = ChromePool(urls, strategy=CHROME_STRATEGY)
+        return _pool
@@ -7,3 +7,180 @@ TYPE_CHOICES = getattr(settings, 'REPORT_TYPE_CHOICES', (
     ('docx', 'Word Document'),
     ('xlsx', 'Excel Document'),
 ))
+
+# Storage used for ``Report.document``, defaults to ``default_storage``
+REPORT_STORAGE = getattr(settings, 'REPORT_STORAGE', None)
+COMPRESSION_CODEC = getattr(settings, 'REPORT_COMPRESSION_CODEC', 'gzip')
+COMPRESSION_LEVEL = getattr(settings, 'REPORT_COMPRESSION_LEVEL', 6)
+
+# Forwards metrics to a callable ``backend(kind, name, value, tags)``
+METRICS_BACKEND = getattr(settings, 'REPORT_METRICS_BACKEND', None)
+
+# Email delivery of generated documents to ``Report.emails``
+EMAIL_DELIVERY = getattr(settings, 'REPORT_EMAIL_DELIVERY', False)
+EMAIL_FROM = getattr(settings, 'REPORT_EMAIL_FROM', None)
+EMAIL_BATCH_SIZE = getattr(settings, 'REPORT_EMAIL_BATCH_SIZE', 50)
+EMAIL_BATCH_DELAY = getattr(settings, 'REPORT_EMAIL_BATCH_DELAY', 60)
+EMAIL_ATTACHMENT_MAX_SIZE = getattr(settings,
+                                    'REPORT_EMAIL_ATTACHMENT_MAX_SIZE',
+                                    10 * 1024 * 1024)
+EMAIL_LINK_BASE_URL = getattr(settings, 'REPORT_EMAIL_LINK_BASE_URL', '')
+EMAIL_RECIPIENT_INTERVAL = getattr(settings,
+                                   'REPORT_EMAIL_RECIPIENT_INTERVAL', 0)
+# Failed deliveries are retried after this many seconds, up to
+# ``REPORT_EMAIL_MAX_ATTEMPTS`` times
+EMAIL_RETRY_DELAY = getattr(settings, 'REPORT_EMAIL_RETRY_DELAY', 5 * 60)
+EMAIL_MAX_ATTEMPTS = getattr(settings, 'REPORT_EMAIL_MAX_ATTEMPTS', 5)
+
+# Chrome instances used for PDF rendering, defaults to ``[CHROME_URL]``
+CHROME_URLS = getattr(settings, 'REPORT_CHROME_URLS', None)
+CHROME_STRATEGY = getattr(settings, 'REPORT_CHROME_STRATEGY', 'least_loaded')
+CHROME_MAX_TABS = getattr(settings, 'REPORT_CHROME_MAX_TABS', 4)
+CHROME_HEALTH_INTERVAL = getattr(settings, 'REPORT_CHROME_HEALTH_INTERVAL', 30)
+CHROME_TIMEOUT = getattr(settings, 'REPORT_CHROME_TIMEOUT', 60)
+# Cache counting the renders per endpoint over all worker processes, None
+# counts them per process. Slots of processes that died expire.
+CHROME_CACHE = getattr(settings, 'REPORT_CHROME_CACHE', 'default')
+CHROME_SLOT_TIMEOUT = getattr(settings, 'REPORT_CHROME_SLOT_TIMEOUT',
+                              60 * 60)
+
+# Serving documents through ``reports.views.ReportDownloadView``, the backend
+# can be None (stream), 'x-accel-redirect', 'x-sendfile' or 'url'
+DOWNLOAD_BACKEND = getattr(settings, 'REPORT_DOWNLOAD_BACKEND', None)
+DOWNLOAD_ACCEL_PREFIX = getattr(settings, 'REPORT_DOWNLOAD_ACCEL_PREFIX',
+                                '/protected/')
+DOWNLOAD_CHUNK_SIZE = getattr(settings, 'REPORT_DOWNLOAD_CHUNK_SIZE',
+                              64 * 1024)
+
+# Memo layer for data shared between reports, ``REPORT_MEMO_CACHE`` is the
+# alias of a cache in ``CACHES`` shared by all workers
+MEMO_CACHE = getattr(settings, 'REPORT_MEMO_CACHE', None)
+MEMO_TIMEOUT = getattr(settings, 'REPORT_MEMO_TIMEOUT', 60 * 60)
+MEMO_LOCAL_SIZE = getattr(settings, 'REPORT_MEMO_LOCAL_SIZE',
+                          64 * 1024 * 1024)
+MEMO_MAX_ENTRY_SIZE = getattr(settings, 'REPORT_MEMO_MAX_ENTRY_SIZE',
+                              1024 * 1024)
+
+# Warm-up of new worker processes, optionally with a small test render
+WARMUP = getattr(settings, 'REPORT_WARMUP', True)
+WARMUP_RENDER = getattr(settings, 'REPORT_WARMUP_RENDER', False)
+
+# Celery queue for document generation, None uses the default routing
+QUEUE = getattr(settings, 'REPORT_QUEUE', None)
+
+# Memory accounting of document generation, 'tracemalloc', 'rss' or None.
+# Reports of an organization that went over ``REPORT_MEMORY_BUDGET`` bytes in
+# the last ``REPORT_MEMORY_HISTORY_DAYS`` are sent to the high memory queue.
+MEMORY_TRACKING = getattr(settings, 'REPORT_MEMORY_TRACKING', None)
+MEMORY_BUDGET = getattr(settings, 'REPORT_MEMORY_BUDGET', None)
+MEMORY_HISTORY_DAYS = getattr(settings, 'REPORT_MEMORY_HISTORY_DAYS', 30)
+HIGH_MEMORY_QUEUE = getattr(settings, 'REPORT_HIGH_MEMORY_QUEUE', None)
+
+# Profiling of document generation for the listed report ids, organization
+# ids and a random sample of the remaining reports
+PROFILE_REPORTS = getattr(settings, 'REPORT_PROFILE_REPORTS', ())
+PROFILE_ORGANIZATIONS = getattr(settings, 'REPORT_PROFILE_ORGANIZATIONS', ())
+PROFILE_SAMPLE_RATE = getattr(settings, 'REPORT_PROFILE_SAMPLE_RATE', 0)
+
+# Template engine used by ``BaseReport.render_html``
+HTML_TEMPLATE_ENGINE = getattr(settings, 'REPORT_HTML_TEMPLATE_ENGINE',
+                               'django')
+
+# Rendered charts are cached by a hash of their data and style
+CHART_CACHE = getattr(settings, 'REPORT_CHART_CACHE', None)
+CHART_CACHE_TIMEOUT = getattr(settings, 'REPORT_CHART_CACHE_TIMEOUT',
+                              24 * 60 * 60)
+CHART_LOCAL_SIZE = getattr(settings, 'REPORT_CHART_LOCAL_SIZE',
+                           32 * 1024 * 1024)
+CHART_WORKERS = getattr(settings, 'REPORT_CHART_WORKERS', 2)
+
+# Reports generated at the same time by a backfill
+BACKFILL_CONCURRENCY = getattr(settings, 'REPORT_BACKFILL_CONCURRENCY', 4)
+
+# Run document conversions in a pool of recycled child processes
+RENDER_ISOLATION = getattr(settings, 'REPORT_RENDER_ISOLATION', False)
+RENDER_WORKERS = getattr(settings, 'REPORT_RENDER_WORKERS', None)
+RENDER_MAX_TASKS_PER_CHILD = getattr(
+    settings, 'REPORT_RENDER_MAX_TASKS_PER_CHILD', 20)
+RENDER_TIMEOUT = getattr(settings, 'REPORT_RENDER_TIMEOUT', 300)
+
+# Fair-share limits of concurrent generations per organization and report,
+# counted in a cache shared by all workers. Organization weights scale their
+# limit and how soon their deferred reports are retried.
+CONCURRENCY_CACHE = getattr(settings, 'REPORT_CONCURRENCY_CACHE', 'default')
+ORGANIZATION_CONCURRENCY = getattr(settings,
+                                   'REPORT_ORGANIZATION_CONCURRENCY', None)
+ORGANIZATION_WEIGHTS = getattr(settings, 'REPORT_ORGANIZATION_WEIGHTS', {})
+REPORT_CONCURRENCY = getattr(settings, 'REPORT_REPORT_CONCURRENCY', {})
+CONCURRENCY_RETRY_DELAY = getattr(settings, 'REPORT_CONCURRENCY_RETRY_DELAY',
+                                  30)
+# Generations of a report, including the first one, before it is failed
+GENERATION_MAX_ATTEMPTS = getattr(settings, 'REPORT_GENERATION_MAX_ATTEMPTS',
+                                  4)
+# Slots of workers that died without releasing them expire after this time
+CONCURRENCY_SLOT_TIMEOUT = getattr(settings,
+                                   'REPORT_CONCURRENCY_SLOT_TIMEOUT', 60 * 60)
+
+# Reconciliation of reports whose generation task was lost or whose worker
+# died, in seconds
+RECONCILE_QUEUED_TIMEOUT = getattr(settings,
+                                   'REPORT_RECONCILE_QUEUED_TIMEOUT', 30 * 60)
+RECONCILE_RUNNING_TIMEOUT = getattr(settings,
+                                    'REPORT_RECONCILE_RUNNING_TIMEOUT',
+                                    2 * 60 * 60)
+RECONCILE_BATCH_SIZE = getattr(settings, 'REPORT_RECONCILE_BATCH_SIZE', 100)
+RECONCILE_MAX_BATCHES = getattr(settings, 'REPORT_RECONCILE_MAX_BATCHES', 10)
+RECONCILE_MAX_ATTEMPTS = getattr(settings, 'REPORT_RECONCILE_MAX_ATTEMPTS', 5)
+
+# Post-generation handlers, see ``reports.hooks``
+HOOK_BATCH_SIZE = getattr(settings, 'REPORT_HOOK_BATCH_SIZE', 100)
+HOOK_BATCH_DELAY = getattr(settings, 'REPORT_HOOK_BATCH_DELAY', 30)
+HOOK_MAX_ATTEMPTS = getattr(settings, 'REPORT_HOOK_MAX_ATTEMPTS', 5)
+HOOK_RETRY_DELAY = getattr(settings, 'REPORT_HOOK_RETRY_DELAY', 60)
+# Seconds after which events claimed by a dead worker are claimed again
+HOOK_LEASE_TIMEOUT = getattr(settings, 'REPORT_HOOK_LEASE_TIMEOUT', 10 * 60)
+
+# S3 compatible storage for documents, ``reports.s3.S3Storage``
+S3_BUCKET = getattr(settings, 'REPORT_S3_BUCKET', None)
+S3_LOCATION = getattr(settings, 'REPORT_S3_LOCATION', '')
+S3_ENDPOINT_URL = getattr(settings, 'REPORT_S3_ENDPOINT_URL', None)
+S3_REGION = getattr(settings, 'REPORT_S3_REGION', None)
+S3_ACCESS_KEY_ID = getattr(settings, 'REPORT_S3_ACCESS_KEY_ID', None)
+S3_SECRET_ACCESS_KEY = getattr(settings, 'REPORT_S3_SECRET_ACCESS_KEY', None)
+S3_URL_EXPIRY = getattr(settings, 'REPORT_S3_URL_EXPIRY', 60 * 60)
+# Documents larger than a part are uploaded in parts, several at a time
+UPLOAD_PART_SIZE = getattr(settings, 'REPORT_UPLOAD_PART_SIZE',
+                           8 * 1024 * 1024)
+UPLOAD_CONCURRENCY = getattr(settings, 'REPORT_UPLOAD_CONCURRENCY', 4)
+
+# Post-processing of PDF documents rendered by ``BaseReport.html_to_pdf``,
+# reports can override it with ``pdf_optimize`` and ``pdf_options``
+PDF_OPTIMIZE = getattr(settings, 'REPORT_PDF_OPTIMIZE', False)
+PDF_LINEARIZE = getattr(settings, 'REPORT_PDF_LINEARIZE', True)
+PDF_MAX_IMAGE_SIZE = getattr(settings, 'REPORT_PDF_MAX_IMAGE_SIZE', 2000)
+PDF_IMAGE_QUALITY = getattr(settings, 'REPORT_PDF_IMAGE_QUALITY', 80)
+
+# Order of scheduled reports, 'fifo' queues them when their schedule fires,
+# 'cost' collects them for ``REPORT_DISPATCH_DELAY`` seconds and queues them
+# longest first, see ``reports.costs``
+DISPATCH_ORDER = getattr(settings, 'REPORT_DISPATCH_ORDER', 'fifo')
+DISPATCH_DELAY = getattr(settings, 'REPORT_DISPATCH_DELAY', 60)
+# Workers generating documents, for the predicted makespan
+DISPATCH_WORKERS = getattr(settings, 'REPORT_DISPATCH_WORKERS', 4)
+COST_HISTORY_DAYS = getattr(settings, 'REPORT_COST_HISTORY_DAYS', 30)
+
+# Previews of ad-hoc reports, see ``BaseReport.preview``. Rendered previews
+# are kept in ``REPORT_PREVIEW_CACHE`` until the document is generated.
+PREVIEW_LIMIT = getattr(settings, 'REPORT_PREVIEW_LIMIT', 1000)
+PREVIEW_CACHE = getattr(settings, 'REPORT_PREVIEW_CACHE', 'default')
+PREVIEW_CACHE_TIMEOUT = getattr(settings, 'REPORT_PREVIEW_CACHE_TIMEOUT',
+                                10 * 60)
+
+# Database alias ``generate`` reads the report data from, requires
+# ``reports.routing.ReportRouter`` in ``DATABASE_ROUTERS``. Reports fall back
+# to the primary when the replica lag is over ``REPORT_REPLICA_MAX_LAG``
+# seconds or reaches into their window.
+REPLICA_DATABASE = getattr(settings, 'REPORT_REPLICA_DATABASE', None)
+REPLICA_MAX_LAG = getattr(settings, 'REPORT_REPLICA_MAX_LAG', None)
+REPLICA_LAG_CACHE_TIMEOUT = getattr(settings,
+                                    'REPORT_REPLICA_LAG_CACHE_TIMEOUT', 10)
@@ -0,0 +1,217 @@
+"""
+Cost-aware dispatch of scheduled reports.
+
+Beat fires the ``PeriodicTask`` of every schedule on its own, so a nightly run
+is queued in an arbitrary order and a long yearly report of a large
+organization may start last and delay the end of the whole run. With::
+
+    REPORT_DISPATCH_ORDER = 'cost'
+
+scheduled reports are created without being queued. After
+``REPORT_DISPATCH_DELAY`` seconds the ``reports.tasks.dispatch_reports`` task
+queues every pending report longest first, the greedy LPT order. Workers
+taking tasks from a shared queue then start the long reports first and fill
+the end of the run with short ones.
+
+Durations are predicted by ``CostModel`` from the recorded generation times
+of the last ``REPORT_COST_HISTORY_DAYS`` per report, type, organization and
+period. The prediction is stored in ``Report.predicted_time``, so
+``makespan`` can later compare the predicted and actual length of a run.
+
+A lost dispatch task would leave the reports pending. ``recover``, run by the
+``reports.tasks.reconcile_reports`` task, dispatches reports that are pending
+for longer than twice ``REPORT_DISPATCH_DELAY``.
+"""
+import heapq
+import logging
+from collections import namedtuple
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, Q
+from django.utils import timezone
+
+from . import metrics
+from .conf import COST_HISTORY_DAYS, DISPATCH_DELAY, DISPATCH_WORKERS
+from .models import Report
+
+logger = logging.getLogger(__name__)
+
+Plan = namedtuple('Plan', ['reports', 'bins', 'makespan'])
+Makespan = namedtuple('Makespan', ['reports', 'workers', 'predicted', 'fifo',
+                                   'actual', 'error'])
+
+SCHEDULED_KEY = 'reports:costs:scheduled'
+
+
+class CostModel(object):
+    """
+    Average generation time per (report, typ, organization, period). Keys
+    without history fall back to the average of (report, typ, period), then
+    (report, typ) and then of all reports.
+    """
+
+    def __init__(self, history_days=COST_HISTORY_DAYS, now=None):
+        since = (now or timezone.now()) - timedelta(days=history_days)
+        rows = Report.objects.filter(created_at__gte=since) \
+            .exclude(generation_time=None) \
+            .values('report', 'typ', 'organization', 'schedule__period') \
+            .annotate(seconds=Avg('generation_time'), count=Count('pk')) \
+            .order_by()
+
+        self.averages = {}
+        totals = {}
+        for row in rows:
+            key = (row['report'], row['typ'], row['organization'],
+                   row['schedule__period'])
+            self.averages[key] = row['seconds']
+            for level in (key[:2] + key[3:], key[:2], ()):
+                total = totals.setdefault(level, [0.0, 0])
+                total[0] += row['seconds'] * row['count']
+                total[1] += row['count']
+        for level, (seconds, count) in totals.items():
+            self.averages[level] = seconds / count
+
+    @staticmethod
+    def key(report):
+        period = report.schedule.period if report.schedule_id else None
+        return (report.report, report.typ, report.organization_id, period)
+
+    def estimate(self, report):
+        """
+        :return: predicted generation time of the report in seconds
+        """
+
+        key = self.key(report)
+        for level in (key, key[:2] + key[3:], key[:2], ()):
+            if level in self.averages:
+                return self.averages[level]
+        return 0.0
+
+
+def simulate(costs, workers):
+    """
+    Assigns jobs in the given order to the first free worker
+    :param costs: list of job durations in seconds
+    :return: (makespan, list of job indexes per worker)
+    """
+
+    heap = [(0.0, worker) for worker in range(max(workers, 1))]
+    bins = [[] for __ in heap]
+    for index, cost in enumerate(costs):
+        load, worker = heapq.heappop(heap)
+        bins[worker].append(index)
+        heapq.heappush(heap, (load + cost, worker))
+    return max(load for load, __ in heap), bins
+
+
+def plan(reports, workers=DISPATCH_WORKERS, model=None):
+    """
+    Orders reports longest first
+    :return: ``Plan`` with the ordered reports, the reports per worker and the
+        predicted makespan in seconds
+    """
+
+    model = model or CostModel()
+    for report in reports:
+        report.predicted_time = model.estimate(report)
+    ordered = sorted(reports, key=lambda report: -report.predicted_time)
+    makespan, bins = simulate([r.predicted_time for r in ordered], workers)
+    return Plan(ordered, [[ordered[i] for i in b] for b in bins], makespan)
+
+
+def schedule():
+    """
+    Schedules a dispatch of the pending reports unless one is waiting
+    """
+
+    from .tasks import dispatch_reports
+
+    if cache.add(SCHEDULED_KEY, 1, 2 * DISPATCH_DELAY):
+        dispatch_reports.apply_async(countdown=DISPATCH_DELAY)
+
+
+def pending():
+    """
+    Scheduled reports that were not queued yet
+    """
+
+    return Report.objects.filter(
+        Q(document='') | Q(document=None),
+        generation_state=Report.STATE_PENDING, schedule__isnull=False)
+
+
+def dispatch(workers=DISPATCH_WORKERS, model=None):
+    """
+    Queues the pending scheduled reports longest first
+    :return: ``Plan`` of the dispatched reports
+    """
+
+    # Reports created from now on schedule another dispatch
+    cache.delete(SCHEDULED_KEY)
+
+    with transaction.atomic():
+        reports = list(pending().select_related('schedule')
+                       .select_for_update(skip_locked=True, of=('self',))
+                       .order_by('created_at', 'pk'))
+        result = plan(reports, workers, model)
+        Report.objects.bulk_update(reports, ['predicted_time'])
+        Report.objects.filter(pk__in=[r.pk for r in reports]).update(
+            generation_state=Report.STATE_QUEUED, queued_at=timezone.now())
+
+    for report in result.reports:
+        report.schedule_document_generation(countdown=0)
+
+    if reports:
+        metrics.incr('reports.dispatch.reports', len(reports))
+        metrics.gauge('reports.dispatch.makespan', result.makespan)
+        logger.info('Dispatched %d reports, predicted makespan %.0fs',
+                    len(reports), result.makespan)
+    return result
+
+
+def recover(now=None, workers=DISPATCH_WORKERS):
+    """
+    Dispatches the pending reports if some of them waited longer than a
+    dispatch should take, its task was lost
+    :return: ``Plan`` of the dispatched reports, None if none were overdue
+    """
+
+    now = now or timezone.now()
+    overdue = now - timedelta(seconds=2 * DISPATCH_DELAY)
+    if not pending().filter(created_at__lt=overdue).exists():
+        return None
+    logger.warning('Dispatching pending reports of a lost dispatch')
+    metrics.incr('reports.dispatch.recovered')
+    return dispatch(workers)
+
+
+def makespan(reports, workers=DISPATCH_WORKERS):
+    """
+    Compares the predicted and actual length of a run
+    :param reports: queryset of the generated reports of the run
+    :return: ``Makespan`` with the predicted makespan of the longest first
+        and of the creation order, the actual one from the first start to
+        the last finish and the mean absolute error of the predicted
+        generation times, all in seconds
+    """
+
+    reports = list(reports.exclude(started_at=None)
+                   .exclude(generation_time=None)
+                   .exclude(predicted_time=None)
+                   .order_by('created_at', 'pk'))
+    if not reports:
+        return Makespan(0, workers, 0.0, 0.0, 0.0, 0.0)
+
+    costs = [report.predicted_time for report in reports]
+    predicted, __ = simulate(sorted(costs, reverse=True), workers)
+    fifo, __ = simulate(costs, workers)
+
+    start = min(report.started_at for report in reports)
+    end = max(report.started_at + timedelta(seconds=report.generation_time)
+              for report in reports)
+    error = sum(abs(report.generation_time - report.predicted_time)
+                for report in reports) / len(reports)
+    return Makespan(len(reports), workers, predicted, fifo,
+                    (end - start).total_seconds(), error)
@@ -0,0 +1,333 @@
+"""
+Columnar aggregation helpers for report data.
+
+Querysets are loaded in chunks into NumPy arrays, one per field, and
+aggregated with vectorized operations instead of Python loops. Results are
+returned as a ``Table`` that renders to markdown, HTML or xlsx.
+
+Requires NumPy, install with ``pip install django-libreports[data]``.
+"""
+import io
+from datetime import date, datetime
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from django.utils.html import escape
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FREQUENCIES = {
+    'hour': 'h',
+    'day': 'D',
+    'week': 'W',
+    'month': 'M',
+    'year': 'Y',
+}
+
+
+def _require_numpy():
+    if np is None:
+        raise ImproperlyConfigured(
+            'NumPy is required for reports.data, install it with '
+            '"pip install django-libreports[data]"')
+
+
+def _naive(value):
+    if timezone.is_aware(value):
+        return timezone.make_naive(value, timezone.utc)
+    return value
+
+
+# 1970-01-01, the epoch of datetime64, is a Thursday
+EPOCH_WEEKDAY = 3
+
+
+def to_array(values, dtype=None):
+    """
+    Converts a sequence of Python values to an array, datetimes become
+    ``datetime64[s]`` (aware ones in UTC), dates ``datetime64[D]`` and None
+    becomes NaT or NaN.
+    :param dtype: dtype of the column, only used for chunks without a value,
+        which are NaN if it is not given
+    """
+
+    _require_numpy()
+    sample = next((value for value in values if value is not None), None)
+    if sample is None:
+        dtype = np.dtype(dtype or float)
+        if dtype.kind == 'M':
+            return np.full(len(values), np.datetime64('NaT'), dtype=dtype)
+        if dtype.kind == 'f':
+            return np.full(len(values), np.nan, dtype=dtype)
+        return np.array(values, dtype=object)
+    if isinstance(sample, datetime):
+        return np.array([_naive(value) if value is not None else None
+                         for value in values], dtype='datetime64[s]')
+    if isinstance(sample, date):
+        return np.array(values, dtype='datetime64[D]')
+    if isinstance(sample, (int, float)) and not isinstance(sample, bool) \
+            and any(value is None for value in values):
+        return np.array([np.nan if value is None else value
+                         for value in values], dtype=float)
+    if isinstance(sample, str):
+        return np.array(values, dtype=object)
+    return np.asarray(values)
+
+
+def field_dtype(model, path):
+    """
+    :return: dtype the values of a model field or lookup path are loaded as,
+        None if it can not be told from the field
+    """
+
+    from django.db import models
+
+    field = None
+    try:
+        for name in path.split('__'):
+            field = model._meta.get_field(name)
+            model = field.related_model
+    except Exception:
+        return None
+    if isinstance(field, models.ForeignKey):
+        field = field.target_field
+    if isinstance(field, models.DateTimeField):
+        return 'datetime64[s]'
+    if isinstance(field, models.DateField):
+        return 'datetime64[D]'
+    if isinstance(field, (models.IntegerField, models.FloatField,
+                          models.DecimalField)):
+        return float
+    if isinstance(field, (models.CharField, models.TextField)):
+        return object
+    return None
+
+
+def load_columns(queryset, fields, chunk_size=10000):
+    """
+    Loads the fields of a queryset into arrays, fetching ``chunk_size`` rows
+    at a time with a server side cursor.
+    :return: dict of field name to array
+    """
+
+    _require_numpy()
+    chunks = dict((field, []) for field in fields)
+    rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+
+    dtypes = dict((field, field_dtype(queryset.model, field))
+                  for field in fields)
+
+    def flush(buffer):
+        for field, values in zip(fields, zip(*buffer)):
+            chunks[field].append(to_array(values, dtypes[field]))
+
+    buffer = []
+    for row in rows:
+        buffer.append(row)
+        if len(buffer) >= chunk_size:
+            flush(buffer)
+            buffer = []
+    if buffer:
+        flush(buffer)
+
+    return dict(
+        (field, np.concatenate(arrays) if arrays else np.array([]))
+        for field, arrays in chunks.items()
+    )
+
+
+def _monday(value):
+    day = np.datetime64(_naive(value), 'D')
+    return day - (day.astype('int64') + EPOCH_WEEKDAY) % 7
+
+
+def bucket_edges(start, end, freq):
+    """
+    :param freq: 'hour', 'day', 'week', 'month' or 'year'
+    :return: array with the start of each bucket between start and end
+    """
+
+    _require_numpy()
+    if freq == 'week':
+        # Weeks of datetime64 start on Thursdays, the reports on Mondays
+        first, last = _monday(start), _monday(end)
+        return np.arange(first, last + 1, 7).astype('datetime64[s]')
+    unit = FREQUENCIES[freq]
+    first = np.datetime64(_naive(start), unit)
+    last = np.datetime64(_naive(end), unit)
+    return np.arange(first, last + 1).astype('datetime64[s]')
+
+
+def bucket(times, start, end, freq):
+    """
+    Assigns each time to a bucket of the window
+    :return: (edges, index), index is -1 for times outside of the window
+    """
+
+    edges = bucket_edges(start, end, freq)
+    index = np.searchsorted(edges, times, side='right') - 1
+    outside = (times < np.datetime64(_naive(start), 's')) | \
+        (times > np.datetime64(_naive(end), 's')) | np.isnat(times)
+    index[outside] = -1
+    return edges, index
+
+
+def histogram(times, start, end, freq):
+    """
+    :return: (edges, counts) number of times per bucket
+    """
+
+    edges, index = bucket(times, start, end, freq)
+    counts = np.bincount(index[index >= 0], minlength=len(edges))
+    return edges, counts
+
+
+def group(keys, values=None, func='count'):
+    """
+    Groups values by key, NaN values are ignored
+    :param func: 'count', 'sum', 'mean', 'min' or 'max'
+    :return: (unique keys, aggregated values) ordered by key
+    """
+
+    _require_numpy()
+    labels, inverse = np.unique(keys, return_inverse=True)
+    if func == 'count':
+        return labels, np.bincount(inverse, minlength=len(labels))
+
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    if func in ('sum', 'mean'):
+        totals = np.bincount(inverse[valid], weights=values[valid],
+                             minlength=len(labels))
+        if func == 'mean':
+            counts = np.bincount(inverse[valid], minlength=len(labels))
+            with np.errstate(invalid='ignore'):
+                totals = totals / counts
+        return labels, totals
+    if func in ('min', 'max'):
+        # fmin and fmax skip NaN, groups without values stay NaN
+        result = np.full(len(labels), np.nan)
+        getattr(np, 'fmin' if func == 'min' else 'fmax').at(
+            result, inverse, values)
+        return labels, result
+    raise ValueError('Unknown aggregate "{0}"'.format(func))
+
+
+def top(keys, values=None, func='count', limit=10):
+    """
+    :return: (keys, values) of the largest groups, largest first
+    """
+
+    labels, aggregated = group(keys, values, func)
+    order = np.argsort(-aggregated, kind='stable')[:limit]
+    return labels[order], aggregated[order]
+
+
+def percentiles(values, q=(50, 90, 99)):
+    """
+    :return: dict of percentile to value, ignoring NaN
+    """
+
+    _require_numpy()
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return dict((p, None) for p in q)
+    return dict(zip(q, np.percentile(values, q).tolist()))
+
+
+def pivot(rows, columns, values=None, func='count'):
+    """
+    Cross tabulation of rows and columns
+    :param func: 'count' or 'sum'
+    :return: (row labels, column labels, matrix)
+    """
+
+    _require_numpy()
+    row_labels, row_index = np.unique(rows, return_inverse=True)
+    col_labels, col_index = np.unique(columns, return_inverse=True)
+    if func == 'count':
+        values = np.ones(len(row_index))
+    elif func != 'sum':
+        raise ValueError('Unknown aggregate "{0}"'.format(func))
+
+    matrix = np.zeros((len(row_labels), len(col_labels)))
+    np.add.at(matrix, (row_index, col_index), np.asarray(values, dtype=float))
+    return row_labels, col_labels, matrix
+
+
+def _cell(value):
+    if np is not None and isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+class Table(object):
+    """
+    Headers and rows of an aggregation, ready for the output formats
+    """
+
+    def __init__(self, headers, rows):
+        self.headers = list(headers)
+        self.rows = [[_cell(value) for value in row] for row in rows]
+
+    @classmethod
+    def from_columns(cls, headers, *columns):
+        return cls(headers, zip(*[
+            column.tolist() if hasattr(column, 'tolist') else column
+            for column in columns
+        ]))
+
+    @classmethod
+    def from_pivot(cls, corner, row_labels, col_labels, matrix):
+        headers = [corner] + [_cell(label) for label in col_labels.tolist()]
+        rows = [[label] + list(row)
+                for label, row in zip(row_labels.tolist(), matrix.tolist())]
+        return cls(headers, rows)
+
+    def to_markdown(self):
+        def line(values):
+            return '| ' + ' | '.join(
+                str(value).replace('|', '\\|') for value in values) + ' |'
+
+        lines = [line(self.headers),
+                 '|' + '|'.join('---' for __ in self.headers) + '|']
+        lines.extend(line(row) for row in self.rows)
+        return '\n'.join(lines) + '\n'
+
+    def to_html(self):
+        head = ''.join('<th>{0}</th>'.format(escape(header))
+                       for header in self.headers)
+        body = ''.join(
+            '<tr>{0}</tr>'.format(''.join(
+                '<td>{0}</td>'.format(escape(value)) for value in row))
+            for row in self.rows)
+        return '<table><thead><tr>{0}</tr></thead><tbody>{1}</tbody>' \
+               '</table>'.format(head, body)
+
+    def to_xlsx(self, title=None):
+        """
+        :return: ContentFile with a workbook, requires openpyxl
+        """
+
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            raise ImproperlyConfigured(
+                'openpyxl is required for xlsx output, install it with '
+                '"pip install django-libreports[xlsx]"')
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(title)
+        sheet.append(self.headers)
+        for row in self.rows:
+            sheet.append(row)
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        return ContentFile(buffer.getvalue())
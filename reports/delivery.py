@@ -0,0 +1,194 @@
+import logging
+import mimetypes
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from . import metrics
+from .conf import (EMAIL_ATTACHMENT_MAX_SIZE, EMAIL_BATCH_DELAY,
+                   EMAIL_BATCH_SIZE, EMAIL_FROM, EMAIL_LINK_BASE_URL,
+                   EMAIL_MAX_ATTEMPTS, EMAIL_RECIPIENT_INTERVAL,
+                   EMAIL_RETRY_DELAY)
+from .models import Report
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_KEY = 'reports:delivery:recipient:{0}'
+SCHEDULED_KEY = 'reports:delivery:scheduled'
+ATTEMPTS_KEY = 'reports:delivery:attempts:{0}'
+
+
+def _throttle_keys(emails):
+    return [THROTTLE_KEY.format(email.lower()) for email in emails]
+
+
+def recipients_available(emails):
+    """
+    :return: False if any of the recipients got a report too recently
+    """
+
+    if not EMAIL_RECIPIENT_INTERVAL:
+        return True
+    return not cache.get_many(_throttle_keys(emails))
+
+
+def throttle_recipients(emails):
+    if EMAIL_RECIPIENT_INTERVAL:
+        keys = _throttle_keys(emails)
+        cache.set_many(dict.fromkeys(keys, 1), EMAIL_RECIPIENT_INTERVAL)
+
+
+def document_link(report):
+    url = report.document.url
+    if EMAIL_LINK_BASE_URL and not url.startswith(('http://', 'https://')):
+        url = EMAIL_LINK_BASE_URL.rstrip('/') + url
+    return url
+
+
+def read_document(report):
+    """
+    Reads the document from the storage chunk by chunk, so compressed
+    documents are decompressed as they are read.
+    """
+
+    report.document.open('rb')
+    try:
+        return b''.join(report.document.chunks())
+    finally:
+        report.document.close()
+
+
+def build_message(report, connection=None):
+    """
+    Builds the email for a generated report. Documents larger than
+    ``REPORT_EMAIL_ATTACHMENT_MAX_SIZE`` are sent as a link.
+    """
+
+    size = report.document_size or report.document.size
+    link = document_link(report) if size > EMAIL_ATTACHMENT_MAX_SIZE else None
+
+    subject = report._run_instance_method('get_email_subject')
+    body = report._run_instance_method('get_email_body', link=link)
+    from_email = EMAIL_FROM or settings.DEFAULT_FROM_EMAIL
+    message = EmailMessage(subject, body, from_email, report.emails,
+                           connection=connection)
+    if link is None:
+        filename = report._run_instance_method('get_report_filename')
+        mimetype, __ = mimetypes.guess_type(filename)
+        message.attach(filename, read_document(report), mimetype)
+    return message
+
+
+def _failed(report):
+    """
+    Counts a failed delivery of the report
+    :return: True if it should be retried
+    """
+
+    key = ATTEMPTS_KEY.format(report.pk)
+    cache.add(key, 0, EMAIL_RETRY_DELAY * EMAIL_MAX_ATTEMPTS * 2)
+    attempts = cache.incr(key)
+    if attempts >= EMAIL_MAX_ATTEMPTS:
+        logger.error('Giving up delivering report %s after %d attempts',
+                     report.pk, attempts)
+        return False
+    return True
+
+
+def _deliver_batch(reports):
+    """
+    :return: (number of delivered reports, seconds until the reports that
+        were skipped can be retried or None)
+    """
+
+    delivered = 0
+    retry = []
+    connection = get_connection()
+    connection.open()
+    try:
+        for report in reports:
+            if not recipients_available(report.emails):
+                metrics.incr('reports.delivery.throttled')
+                retry.append(EMAIL_RECIPIENT_INTERVAL)
+                continue
+
+            # Claim the report first so concurrent runs do not send it twice
+            claimed = Report.objects.filter(pk=report.pk, delivered_at=None) \
+                .update(delivered_at=timezone.now())
+            if not claimed:
+                continue
+
+            try:
+                with metrics.timer('reports.delivery.send',
+                                   report=report.report):
+                    build_message(report, connection).send()
+            except Exception:
+                logger.exception('Error delivering report %s', report.pk)
+                Report.objects.filter(pk=report.pk) \
+                    .update(delivered_at=None)
+                metrics.incr('reports.delivery.failed')
+                if _failed(report):
+                    retry.append(EMAIL_RETRY_DELAY)
+                continue
+
+            throttle_recipients(report.emails)
+            metrics.incr('reports.delivery.delivered', report=report.report)
+            delivered += 1
+    finally:
+        connection.close()
+    return delivered, min(retry) if retry else None
+
+
+def deliver(queryset=None, batch_size=None):
+    """
+    Emails generated reports to their recipients. Each batch of messages is
+    sent over a single connection and documents are only read from the
+    storage right before their message is sent.
+
+    Reports of throttled recipients and failed ones are retried by another
+    scheduled run.
+
+    :param queryset: reports to deliver, defaults to all undelivered reports
+    :param batch_size: number of messages sent over one connection
+    :return: number of delivered reports
+    """
+
+    # Reports finished from now on schedule another run
+    cache.delete(SCHEDULED_KEY)
+    if queryset is None:
+        queryset = Report.objects.undelivered()
+    batch_size = batch_size or EMAIL_BATCH_SIZE
+
+    pks = list(queryset.order_by('pk').values_list('pk', flat=True))
+    delivered = 0
+    retry = None
+    for i in range(0, len(pks), batch_size):
+        batch = Report.objects.filter(pk__in=pks[i:i + batch_size]) \
+            .select_related('organization', 'created_by').order_by('pk')
+        with metrics.timer('reports.delivery.batch'):
+            sent, countdown = _deliver_batch(batch)
+        delivered += sent
+        if countdown is not None:
+            retry = min(retry if retry is not None else countdown, countdown)
+
+    if retry is not None:
+        schedule_delivery(countdown=retry)
+    return delivered
+
+
+def schedule_delivery(countdown=None):
+    """
+    Schedules a delivery run unless one is already waiting, so reports
+    finished within ``REPORT_EMAIL_BATCH_DELAY`` are sent together.
+    :param countdown: seconds until the run, defaults to
+        ``REPORT_EMAIL_BATCH_DELAY``
+    """
+
+    from .tasks import deliver_reports
+
+    if countdown is None:
+        countdown = EMAIL_BATCH_DELAY
+    if cache.add(SCHEDULED_KEY, 1, countdown + EMAIL_BATCH_DELAY):
+        deliver_reports.apply_async(countdown=countdown)
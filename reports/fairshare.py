@@ -0,0 +1,180 @@
+"""
+Fair-share limits for document generation.
+
+A large organization with many schedules could otherwise take every worker
+and Chrome tab. Before generating, a task takes a slot of its organization
+and of its report. The slots are counters in ``REPORT_CONCURRENCY_CACHE``,
+shared by all workers::
+
+    REPORT_ORGANIZATION_CONCURRENCY = 4
+    REPORT_ORGANIZATION_WEIGHTS = {42: 2}  # organization 42 gets 8 slots
+    REPORT_REPORT_CONCURRENCY = {'inventory': 2}
+
+Tasks without a free slot are retried later. The delay grows with the number
+of deferred reports of the organization and shrinks with its weight, so
+organizations with a few reports get back in quickly. Bulk dispatches are
+interleaved by weighted round-robin over the organizations.
+"""
+import random
+from time import time
+
+from django.core.cache import caches
+
+from . import metrics
+from .conf import (CONCURRENCY_CACHE, CONCURRENCY_RETRY_DELAY,
+                   CONCURRENCY_SLOT_TIMEOUT, ORGANIZATION_CONCURRENCY,
+                   ORGANIZATION_WEIGHTS, REPORT_CONCURRENCY)
+
+KEY_PREFIX = 'reports:fairshare'
+
+
+def _cache():
+    return caches[CONCURRENCY_CACHE]
+
+
+def weight(organization_id):
+    return ORGANIZATION_WEIGHTS.get(organization_id, 1)
+
+
+def limits(report):
+    """
+    :return: list of (slot key, limit) that apply to the report
+    """
+
+    result = []
+    if ORGANIZATION_CONCURRENCY:
+        limit = max(1, int(round(ORGANIZATION_CONCURRENCY *
+                                 weight(report.organization_id))))
+        result.append(('{0}:organization:{1}'.format(
+            KEY_PREFIX, report.organization_id), limit))
+    if REPORT_CONCURRENCY.get(report.report):
+        result.append(('{0}:report:{1}'.format(KEY_PREFIX, report.report),
+                       REPORT_CONCURRENCY[report.report]))
+    return result
+
+
+def _incr(cache, key, delta=1):
+    try:
+        value = cache.incr(key, delta)
+    except ValueError:
+        # The counter expired
+        if delta < 0:
+            return 0
+        cache.add(key, 0, CONCURRENCY_SLOT_TIMEOUT)
+        value = cache.incr(key, delta)
+    # incr keeps the expiry set when the counter was added, slots that are
+    # in use must not expire with it
+    cache.touch(key, CONCURRENCY_SLOT_TIMEOUT)
+    return value
+
+
+def _release(cache, keys):
+    for key in keys:
+        if _incr(cache, key, -1) < 0:
+            cache.set(key, 0, CONCURRENCY_SLOT_TIMEOUT)
+
+
+def acquire(report):
+    """
+    Takes a slot of every limit of the report
+    :return: False if one of them is full
+    """
+
+    cache = _cache()
+    acquired = []
+    for key, limit in limits(report):
+        cache.add(key, 0, CONCURRENCY_SLOT_TIMEOUT)
+        acquired.append(key)
+        if _incr(cache, key) > limit:
+            _release(cache, acquired)
+            return False
+    return True
+
+
+def release(report):
+    _release(_cache(), [key for key, __ in limits(report)])
+
+
+def _pending_key(organization_id):
+    return '{0}:pending:{1}'.format(KEY_PREFIX, organization_id)
+
+
+def defer(report, deferred=False):
+    """
+    Records a report that did not get a slot. Each report is counted once
+    as pending, however often it is deferred.
+    :param deferred: the report was deferred before
+    :return: seconds to wait before trying again
+    """
+
+    org = report.organization_id
+    if deferred:
+        pending = max(_cache().get(_pending_key(org)) or 0, 1)
+    else:
+        pending = _incr(_cache(), _pending_key(org))
+    metrics.incr('reports.fairshare.deferred', organization=org)
+    delay = CONCURRENCY_RETRY_DELAY * pending / float(weight(org))
+    return delay * random.uniform(0.75, 1.25)
+
+
+def started(report, queued_at=None, deferred=False):
+    """
+    Records the wait time of a report that got its slots
+    :param queued_at: timestamp of the first dispatch of the task
+    :param deferred: the task was deferred before
+    """
+
+    org = report.organization_id
+    if deferred:
+        _release(_cache(), [_pending_key(org)])
+    if queued_at is not None:
+        metrics.timing('reports.fairshare.wait', max(time() - queued_at, 0),
+                       organization=org)
+
+
+def wait_times():
+    """
+    :return: wait time summary per organization collected by this process
+    """
+
+    timings = metrics.snapshot()['timings']
+    return dict(
+        (dict(tags)['organization'], summary)
+        for (name, tags), summary in timings.items()
+        if name == 'reports.fairshare.wait'
+    )
+
+
+def interleave(reports):
+    """
+    Orders reports by smooth weighted round-robin over their organizations,
+    keeping the order within each organization
+    """
+
+    queues = {}
+    for report in reports:
+        queues.setdefault(report.organization_id, []).append(report)
+    for queue in queues.values():
+        queue.reverse()
+
+    current = dict((org, 0.0) for org in queues)
+    result = []
+    while queues:
+        total = sum(weight(org) for org in queues)
+        for org in queues:
+            current[org] += weight(org)
+        org = max(queues, key=lambda org: current[org])
+        current[org] -= total
+        result.append(queues[org].pop())
+        if not queues[org]:
+            del queues[org]
+    return result
+
+
+def dispatch(reports):
+    """
+    Schedules the generation of reports in fair-share order
+    """
+
+    for report in interleave(reports):
+        report.schedule_document_generation()
@@ -0,0 +1,216 @@
+"""
+Post-generation hooks.
+
+Handlers run after a document was saved, in their own Celery tasks instead
+of the generation task, so a slow or failing handler neither delays nor
+retries the generation::
+
+    @hook('index')
+    def index_report(report):
+        ...
+
+    @hook('webhook', batch=True)
+    def notify(reports):
+        ...
+
+Every generated report records a ``ReportEvent`` per handler. Batch handlers
+get up to ``batch_size`` reports at once, collected for ``delay`` seconds.
+Failed events are retried with an exponential backoff until
+``max_attempts``, then kept with their error. Events claimed by a worker
+that died before finishing them are claimed again after
+``REPORT_HOOK_LEASE_TIMEOUT``. Receivers of the
+``report_generated`` signal are run by the ``report_generated`` handler.
+"""
+import logging
+from collections import namedtuple
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import metrics
+from .conf import (HOOK_BATCH_DELAY, HOOK_BATCH_SIZE, HOOK_LEASE_TIMEOUT,
+                   HOOK_MAX_ATTEMPTS, HOOK_RETRY_DELAY)
+from .models import Report, ReportEvent, report_generated
+
+logger = logging.getLogger(__name__)
+
+Handler = namedtuple('Handler', ['name', 'func', 'batch', 'batch_size',
+                                 'delay', 'max_attempts', 'enabled'])
+
+handlers = {}
+
+
+def hook(name, batch=False, batch_size=HOOK_BATCH_SIZE, delay=None,
+         max_attempts=HOOK_MAX_ATTEMPTS, enabled=None):
+    """
+    Registers a post-generation handler
+    :param batch: the handler takes a list of reports
+    :param delay: seconds to collect events for, defaults to
+        ``REPORT_HOOK_BATCH_DELAY`` for batch handlers and 0 otherwise
+    :param enabled: callable telling whether events should be recorded
+    """
+
+    if delay is None:
+        delay = HOOK_BATCH_DELAY if batch else 0
+
+    def decorator(func):
+        handlers[name] = Handler(name, func, batch, batch_size, delay,
+                                 max_attempts, enabled)
+        return func
+
+    return decorator
+
+
+def _scheduled_key(name):
+    return 'reports:hooks:scheduled:{0}'.format(name)
+
+
+def schedule(name, countdown=None):
+    """
+    Schedules a run of the handler unless one is already waiting
+    """
+
+    from .tasks import run_hook
+
+    handler = handlers[name]
+    if countdown is None:
+        countdown = handler.delay
+    if cache.add(_scheduled_key(name), 1, countdown + HOOK_RETRY_DELAY):
+        run_hook.apply_async(kwargs={'name': name}, countdown=countdown)
+
+
+def record(report):
+    """
+    Records the completion of a report for every enabled handler and
+    schedules their runs once the transaction is committed
+    """
+
+    names = [handler.name for handler in handlers.values()
+             if handler.enabled is None or handler.enabled()]
+    ReportEvent.objects.bulk_create(
+        [ReportEvent(report=report, handler=name) for name in names])
+    for name in names:
+        transaction.on_commit(lambda name=name: schedule(name))
+
+
+def _claimable(handler, now):
+    """
+    Events that are due or whose claim expired, the worker processing them
+    died before deleting them
+    """
+
+    return ReportEvent.objects.filter(
+        Q(processed_at=None, available_at__lte=now) |
+        Q(processed_at__lt=now - timedelta(seconds=HOOK_LEASE_TIMEOUT),
+          attempts__lt=handler.max_attempts),
+        handler=handler.name)
+
+
+def _claim(handler):
+    """
+    :return: events due for the handler, marked as processed
+    """
+
+    now = timezone.now()
+    with transaction.atomic():
+        pks = list(_claimable(handler, now).order_by('pk')
+                   .select_for_update(skip_locked=True)
+                   .values_list('pk', flat=True)[:handler.batch_size])
+        ReportEvent.objects.filter(pk__in=pks).update(
+            processed_at=now, attempts=F('attempts') + 1)
+    return list(ReportEvent.objects.filter(pk__in=pks).order_by('pk'))
+
+
+def _failed(handler, events, exc):
+    logger.exception('Post-generation handler %s failed', handler.name)
+    metrics.incr('reports.hooks.failed', len(events), handler=handler.name)
+    retry = [event.pk for event in events
+             if event.attempts < handler.max_attempts]
+    ReportEvent.objects.filter(pk__in=[event.pk for event in events]) \
+        .update(error=repr(exc))
+    if not retry:
+        return None
+    attempts = min(event.attempts for event in events)
+    delay = HOOK_RETRY_DELAY * 2 ** (attempts - 1)
+    ReportEvent.objects.filter(pk__in=retry).update(
+        processed_at=None,
+        available_at=timezone.now() + timedelta(seconds=delay))
+    return delay
+
+
+def _call(handler, events):
+    """
+    :return: seconds until failed events should be retried, or None
+    """
+
+    reports = dict((report.pk, report) for report in Report.objects.filter(
+        pk__in=[event.report_id for event in events]))
+    events = [event for event in events if event.report_id in reports]
+    if not events:
+        return None
+    try:
+        with metrics.timer('reports.hooks.run', handler=handler.name):
+            if handler.batch:
+                handler.func([reports[event.report_id] for event in events])
+            else:
+                handler.func(reports[events[0].report_id])
+    except Exception as exc:
+        return _failed(handler, events, exc)
+
+    ReportEvent.objects.filter(pk__in=[event.pk for event in events]) \
+        .delete()
+    metrics.incr('reports.hooks.processed', len(events),
+                 handler=handler.name)
+    return None
+
+
+def run(name):
+    """
+    Processes the pending events of a handler
+    :return: number of processed events
+    """
+
+    handler = handlers[name]
+    # Events recorded from now on schedule another run
+    cache.delete(_scheduled_key(name))
+
+    processed = 0
+    retry = None
+    while True:
+        events = _claim(handler)
+        if not events:
+            break
+        groups = [events] if handler.batch else [[e] for e in events]
+        for group in groups:
+            delay = _call(handler, group)
+            if delay is not None:
+                retry = min(retry or delay, delay)
+        processed += len(events)
+
+    if retry is not None:
+        schedule(name, countdown=retry)
+    return processed
+
+
+def recover(now=None):
+    """
+    Schedules runs of the handlers with expired claims
+    :return: names of the scheduled handlers
+    """
+
+    now = now or timezone.now()
+    names = [handler.name for handler in handlers.values()
+             if _claimable(handler, now).filter(
+                 processed_at__isnull=False).exists()]
+    for name in names:
+        logger.warning('Reclaiming events of handler %s', name)
+        schedule(name)
+    return names
+
+
+@hook('report_generated', enabled=report_generated.has_listeners)
+def send_report_generated(report):
+    report_generated.send(sender=Report, report=report)
@@ -0,0 +1,94 @@
+"""
+HTML building helpers for PDF reports.
+
+Templates are compiled once per process. Assets such as stylesheets, fonts
+and logos are read and encoded once, and identical files share one cache
+entry keyed by a hash of their content.
+"""
+import base64
+import hashlib
+import mimetypes
+import os
+import threading
+
+from django.contrib.staticfiles import finders
+from django.template import engines
+
+from .conf import HTML_TEMPLATE_ENGINE
+
+_lock = threading.Lock()
+_templates = {}
+# path -> (mtime, content hash), content hash -> (mimetype, data)
+_asset_paths = {}
+_assets = {}
+
+
+def get_template(name, using=HTML_TEMPLATE_ENGINE):
+    """
+    :return: compiled template, cached for the lifetime of the process
+    """
+
+    key = (using, name)
+    template = _templates.get(key)
+    if template is None:
+        template = engines[using].get_template(name)
+        with _lock:
+            _templates[key] = template
+    return template
+
+
+def find_asset(path):
+    if os.path.isabs(path):
+        return path
+    found = finders.find(path)
+    if not found:
+        raise IOError('Report asset "{0}" not found'.format(path))
+    return found
+
+
+def load_asset(path):
+    """
+    :return: (content hash, mimetype, data) of the asset
+    """
+
+    full_path = find_asset(path)
+    mtime = os.path.getmtime(full_path)
+    cached = _asset_paths.get(full_path)
+    if cached is None or cached[0] != mtime:
+        with open(full_path, 'rb') as asset:
+            data = asset.read()
+        digest = hashlib.sha256(data).hexdigest()
+        mimetype, __ = mimetypes.guess_type(full_path)
+        with _lock:
+            _asset_paths[full_path] = (mtime, digest)
+            if digest not in _assets:
+                _assets[digest] = (mimetype or 'application/octet-stream',
+                                   data)
+        cached = _asset_paths[full_path]
+
+    mimetype, data = _assets[cached[1]]
+    return cached[1], mimetype, data
+
+
+def asset_data_uri(path):
+    digest, mimetype, data = load_asset(path)
+    key = ('data_uri', digest)
+    uri = _assets.get(key)
+    if uri is None:
+        uri = 'data:{0};base64,{1}'.format(
+            mimetype, base64.b64encode(data).decode('ascii'))
+        with _lock:
+            _assets[key] = uri
+    return uri
+
+
+def asset_text(path):
+    digest, mimetype, data = load_asset(path)
+    return data.decode('utf-8')
+
+
+def clear():
+    with _lock:
+        _templates.clear()
+        _asset_paths.clear()
+        _assets.clear()
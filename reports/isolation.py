@@ -0,0 +1,223 @@
+"""
+Process isolated document rendering.
+
+With ``REPORT_RENDER_ISOLATION`` enabled, document conversions run in a pool
+of child processes instead of the worker itself, so memory fragmented by
+large documents is returned when a child is recycled after
+``REPORT_RENDER_MAX_TASKS_PER_CHILD`` tasks and CPU heavy work is not held
+back by the GIL. Documents are exchanged through temporary files, only paths
+and a few numbers are pickled.
+
+Tasks are module level functions with a ``(source, output, **kwargs)``
+signature reading ``source`` and writing ``output``::
+
+    document = isolation.run(convert_markdown, markdown.encode('utf-8'),
+                             typ='pdf')
+"""
+import base64
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from timeit import default_timer
+
+from django.core.files.base import ContentFile
+
+from . import metrics
+from .conf import (RENDER_ISOLATION, RENDER_MAX_TASKS_PER_CHILD,
+                   RENDER_TIMEOUT, RENDER_WORKERS)
+
+logger = logging.getLogger(__name__)
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+def convert_markdown(source, output, typ, extra_args=()):
+    from pypandoc import convert_file
+
+    convert_file(source, typ, 'markdown_phpextra', outputfile=output,
+                 extra_args=list(extra_args))
+
+
+def print_pdf(source, output, url, delay=5):
+    import pychrome
+
+    with open(source, 'rb') as f:
+        data_url = 'data:text/html;base64,{0}'.format(
+            base64.b64encode(f.read()).decode('utf-8'))
+
+    browser = pychrome.Browser(url=url)
+    tab = browser.new_tab(data_url)
+    tab.start()
+
+    tab.wait(delay)
+    try:
+        data = tab.Page.printToPDF()
+        with open(output, 'wb') as f:
+            f.write(base64.b64decode(data['data']))
+    finally:
+        tab.stop()
+        browser.close_tab(tab)
+
+
+def _setup_child():
+    # Children are spawned, so tasks using settings or models need the apps
+    # loaded again
+    if os.environ.get('DJANGO_SETTINGS_MODULE'):
+        import django
+
+        django.setup()
+
+
+def _execute(func, source, output, kwargs):
+    """
+    Runs a task in a child
+    :return: (pid, seconds, peak RSS in bytes)
+    """
+
+    start = default_timer()
+    func(source, output, **kwargs)
+    # ru_maxrss is in kilobytes on Linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return os.getpid(), default_timer() - start, rss
+
+
+class RendererPool(object):
+    """
+    Pool of spawned children, replaced as a whole when a task times out or a
+    child dies. Children are recycled after ``max_tasks_per_child`` tasks,
+    on Pythons before 3.11 by replacing the pool once it ran that many tasks
+    per child.
+    """
+
+    def __init__(self, workers=RENDER_WORKERS,
+                 max_tasks_per_child=RENDER_MAX_TASKS_PER_CHILD,
+                 timeout=RENDER_TIMEOUT):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_tasks_per_child = max_tasks_per_child
+        self.timeout = timeout
+        self.children = set()
+        self._executor = None
+        self._submitted = 0
+        self._recycle_after = None
+        self._lock = threading.Lock()
+
+    def _create(self):
+        kwargs = {
+            'max_workers': self.workers,
+            'mp_context': multiprocessing.get_context('spawn'),
+            'initializer': _setup_child,
+        }
+        try:
+            return ProcessPoolExecutor(
+                max_tasks_per_child=self.max_tasks_per_child, **kwargs)
+        except TypeError:
+            self._recycle_after = self.max_tasks_per_child and \
+                self.max_tasks_per_child * self.workers
+            return ProcessPoolExecutor(**kwargs)
+
+    def _submit(self, *args):
+        with self._lock:
+            if self._executor is None:
+                self._recycle_after = None
+                self._executor = self._create()
+                self._submitted = 0
+            executor = self._executor
+            self._submitted += 1
+            if self._recycle_after and \
+                    self._submitted >= self._recycle_after:
+                # Running tasks finish before the old children exit
+                self._executor = None
+                metrics.incr('reports.render.recycled')
+            future = executor.submit(*args)
+            if self._executor is None:
+                executor.shutdown(wait=False)
+            return future
+
+    def reset(self, kill=False):
+        """
+        Replaces the pool, terminating its children when ``kill`` is set
+        """
+
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        if kill:
+            for process in list(getattr(executor, '_processes', {})
+                                .values()):
+                process.terminate()
+        executor.shutdown(wait=not kill)
+
+    def execute(self, func, source, output, timeout=None, **kwargs):
+        """
+        Runs ``func(source, output, **kwargs)`` in a child
+        """
+
+        name = func.__name__
+        future = self._submit(_execute, func, source, output, kwargs)
+        try:
+            pid, seconds, rss = future.result(timeout or self.timeout)
+        except TimeoutError:
+            metrics.incr('reports.render.timeout', task=name)
+            self.reset(kill=True)
+            raise RenderTimeout('Rendering with {0} timed out'.format(name))
+        except BrokenProcessPool:
+            metrics.incr('reports.render.crashed', task=name)
+            self.reset(kill=True)
+            raise
+
+        if pid not in self.children:
+            self.children.add(pid)
+            metrics.incr('reports.render.children')
+        metrics.timing('reports.render.task', seconds, task=name,
+                       child=pid)
+        metrics.gauge('reports.render.rss', rss, child=pid)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = RendererPool()
+        return _pool
+
+
+def run(func, data, suffix='', isolated=None, **kwargs):
+    """
+    Runs a task on ``data`` in the renderer pool, or in this process when
+    isolation is disabled
+    :param data: source document as a bytestring
+    :param suffix: extension of the output file, e.g. '.pdf'
+    :param isolated: defaults to ``REPORT_RENDER_ISOLATION``
+    :return: ContentFile with the output
+    """
+
+    if isolated is None:
+        isolated = RENDER_ISOLATION
+    directory = tempfile.mkdtemp(prefix='reports-render-')
+    try:
+        source = os.path.join(directory, 'source')
+        output = os.path.join(directory, 'output' + suffix)
+        with open(source, 'wb') as f:
+            f.write(data)
+        if isolated:
+            get_pool().execute(func, source, output, **kwargs)
+        else:
+            func(source, output, **kwargs)
+        with open(output, 'rb') as f:
+            return ContentFile(f.read())
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from reports.conf import BACKFILL_CONCURRENCY
+from reports.management.commands.report_capacity import parse_datetime
+from reports.models import ReportSchedule
+
+
+class Command(BaseCommand):
+    help = 'Creates and generates the reports of past windows of a schedule.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('schedule', type=int, help='Report schedule id')
+        parser.add_argument('count', type=int,
+                            help='Number of past windows to backfill.')
+        parser.add_argument(
+            '--until', default=None,
+            help='Backfill the windows before this date instead of today, '
+                 'YYYY-MM-DD')
+        parser.add_argument(
+            '--concurrency', type=int, default=BACKFILL_CONCURRENCY,
+            help='Number of reports generated at the same time.')
+        parser.add_argument(
+            '--dispatch', action='store_true',
+            help='Generate the documents on the Celery workers.')
+
+    def handle(self, *args, **options):
+        try:
+            schedule = ReportSchedule.objects.get(pk=options['schedule'])
+        except ReportSchedule.DoesNotExist:
+            raise CommandError('Report schedule {0} does not exist.'.format(
+                options['schedule']))
+        now = parse_datetime(options['until']) if options['until'] else None
+
+        def progress(done, total, report):
+            self.stdout.write('[{0}/{1}] {2} {3} to {4}'.format(
+                done, total, report.name, report.start_datetime,
+                report.end_datetime))
+
+        result = schedule.backfill(
+            options['count'], now=now, concurrency=options['concurrency'],
+            progress=progress, dispatch=options['dispatch'])
+
+        self.stdout.write('Created {0} reports, skipped {1} existing, '
+                          '{2} failed.'.format(len(result.created),
+                                               result.skipped,
+                                               len(result.failed)))
+        if result.failed:
+            raise CommandError('Failed reports: {0}'.format(
+                ', '.join(str(report.pk) for report in result.failed)))
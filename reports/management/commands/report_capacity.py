@@ -0,0 +1,49 @@
+import csv
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reports import planner
+
+
+def parse_datetime(value):
+    for fmt in ('%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise CommandError('Invalid date "{0}", use YYYY-MM-DD [HH:MM]'.format(
+        value))
+
+
+class Command(BaseCommand):
+    help = 'Prints the expected report generation load per minute.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('start', help='Start of the range, YYYY-MM-DD')
+        parser.add_argument('end', help='End of the range, YYYY-MM-DD')
+        parser.add_argument(
+            '--history-days', type=int, default=30,
+            help='Days of generated reports to average durations over.')
+        parser.add_argument(
+            '--top', type=int, default=None,
+            help='Only print the busiest minutes.')
+
+    def handle(self, *args, **options):
+        start = parse_datetime(options['start'])
+        end = parse_datetime(options['end'])
+        if start >= end:
+            raise CommandError('The start has to be before the end.')
+
+        timeline = planner.plan(start, end,
+                                history_days=options['history_days'])
+        if options['top']:
+            timeline = sorted(timeline, key=lambda load: -load.seconds)
+            timeline = timeline[:options['top']]
+
+        writer = csv.writer(self.stdout)
+        writer.writerow(planner.Load._fields)
+        for load in timeline:
+            writer.writerow([load.minute.strftime('%Y-%m-%d %H:%M'),
+                             load.queue, load.typ, load.renders,
+                             '{0:.1f}'.format(load.seconds)])
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from reports import costs
+from reports.conf import DISPATCH_WORKERS
+from reports.management.commands.report_capacity import parse_datetime
+from reports.models import Report
+
+
+class Command(BaseCommand):
+    help = 'Compares the predicted and actual makespan of a scheduled run.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('start', help='Start of the run, YYYY-MM-DD '
+                                          '[HH:MM]')
+        parser.add_argument('end', help='End of the run, YYYY-MM-DD [HH:MM]')
+        parser.add_argument(
+            '--workers', type=int, default=DISPATCH_WORKERS,
+            help='Number of workers generating documents.')
+
+    def handle(self, *args, **options):
+        start = parse_datetime(options['start'])
+        end = parse_datetime(options['end'])
+        if start >= end:
+            raise CommandError('The start has to be before the end.')
+
+        reports = Report.objects.filter(schedule__isnull=False,
+                                        started_at__gte=start,
+                                        started_at__lt=end)
+        result = costs.makespan(reports, options['workers'])
+        if not result.reports:
+            raise CommandError('No dispatched reports were generated in '
+                               'this range.')
+
+        self.stdout.write('Reports: {0}'.format(result.reports))
+        self.stdout.write('Workers: {0}'.format(result.workers))
+        self.stdout.write('Predicted makespan: {0:.1f}s'.format(
+            result.predicted))
+        self.stdout.write('Predicted makespan in creation order: '
+                          '{0:.1f}s'.format(result.fifo))
+        self.stdout.write('Actual makespan: {0:.1f}s'.format(result.actual))
+        self.stdout.write('Mean absolute error per report: {0:.1f}s'.format(
+            result.error))
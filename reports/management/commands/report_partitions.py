@@ -0,0 +1,54 @@
+from dateutil.relativedelta import relativedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from reports import partitioning
+
+
+class Command(BaseCommand):
+    help = 'Manages the monthly partitions of the reports table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert', action='store_true',
+            help='Convert the reports table to a partitioned table first.')
+        parser.add_argument(
+            '--months-ahead', type=int, default=3,
+            help='Number of future monthly partitions to create.')
+        parser.add_argument(
+            '--retain', type=int, default=None,
+            help='Detach partitions older than this number of months.')
+        parser.add_argument(
+            '--drop', action='store_true',
+            help='Drop the old partitions instead of only detaching them.')
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database to manage partitions for.')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if connections[using].vendor != 'postgresql':
+            raise CommandError('Partitioning requires PostgreSQL.')
+
+        if options['convert']:
+            if partitioning.is_partitioned(using):
+                raise CommandError('The reports table is already partitioned.')
+            partitioning.convert(options['months_ahead'], using=using)
+            self.stdout.write('Converted the reports table.')
+        elif not partitioning.is_partitioned(using):
+            raise CommandError('The reports table is not partitioned, '
+                               'run with --convert first.')
+
+        for name in partitioning.create_partitions(options['months_ahead'],
+                                                   using=using):
+            self.stdout.write('Created {0}'.format(name))
+
+        if options['retain'] is not None:
+            before = timezone.now().date().replace(day=1) - \
+                relativedelta(months=options['retain'])
+            removed = partitioning.remove_partitions(
+                before, drop=options['drop'], using=using)
+            action = 'Dropped' if options['drop'] else 'Detached'
+            for name in removed:
+                self.stdout.write('{0} {1}'.format(action, name))
@@ -0,0 +1,149 @@
+"""
+Memo layer for report data.
+
+Reports for the same organization and window often run the same queries, for
+example a combined report and the individual reports it is made of. Data
+providers decorated with ``data_provider`` keep their results for
+``REPORT_MEMO_TIMEOUT`` seconds in a local LRU and, when ``REPORT_MEMO_CACHE``
+is set, in a cache shared by all workers::
+
+    @data_provider('alerts')
+    def alerts(organization, start_datetime, end_datetime, severity=None):
+        ...
+
+Results are keyed by the provider name, organization, window and keyword
+parameters, so they have to be picklable. Data loaded for a larger window can
+be split and stored for the smaller ones with ``alerts.prime(organization,
+start_datetime, end_datetime, value)``.
+"""
+import hashlib
+import pickle
+import threading
+from functools import partial, wraps
+from inspect import getfullargspec
+
+from django.core.cache import caches
+
+from . import metrics
+from .conf import MEMO_CACHE, MEMO_LOCAL_SIZE, MEMO_MAX_ENTRY_SIZE, \
+    MEMO_TIMEOUT
+from .utils import LRUCache
+
+local_cache = LRUCache(MEMO_LOCAL_SIZE)
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+LOCAL = 'local'
+SHARED = 'shared'
+MISS = 'miss'
+
+WINDOW = ('organization', 'start_datetime', 'end_datetime')
+
+
+def _record(provider, outcome):
+    with _stats_lock:
+        counts = _stats.setdefault(provider, {LOCAL: 0, SHARED: 0, MISS: 0})
+        counts[outcome] += 1
+    metrics.incr('reports.memo.{0}'.format(outcome), provider=provider)
+
+
+def stats():
+    """
+    :return: hits, misses and hit rate per provider
+    """
+
+    with _stats_lock:
+        result = {}
+        for provider, counts in _stats.items():
+            total = sum(counts.values())
+            hits = counts[LOCAL] + counts[SHARED]
+            result[provider] = dict(
+                counts, hit_rate=float(hits) / total if total else 0.0)
+        return result
+
+
+def clear():
+    local_cache.clear()
+    with _stats_lock:
+        _stats.clear()
+
+
+def make_key(provider, organization, start_datetime, end_datetime, params,
+             args=()):
+    org = getattr(organization, 'pk', organization)
+    parts = repr((org, start_datetime, end_datetime, tuple(args),
+                  sorted(params.items())))
+    digest = hashlib.sha1(parts.encode('utf-8')).hexdigest()
+    return 'reports:memo:{0}:{1}'.format(provider, digest)
+
+
+def get_or_compute(provider, key, compute, timeout=MEMO_TIMEOUT):
+    # The local cache keeps pickled values too, every caller gets its own
+    # copy and may change it
+    pickled = local_cache.get(key)
+    if pickled is not None:
+        _record(provider, LOCAL)
+        return pickle.loads(pickled)
+
+    shared = caches[MEMO_CACHE] if MEMO_CACHE else None
+    if shared is not None:
+        pickled = shared.get(key)
+        if pickled is not None:
+            local_cache.set(key, pickled, timeout=timeout)
+            _record(provider, SHARED)
+            return pickle.loads(pickled)
+
+    _record(provider, MISS)
+    with metrics.timer('reports.memo.compute', provider=provider):
+        value = compute()
+
+    pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    local_cache.set(key, pickled, timeout=timeout)
+    if shared is not None and len(pickled) <= MEMO_MAX_ENTRY_SIZE:
+        shared.set(key, pickled, timeout)
+    return value
+
+
+def prime(provider, organization, start_datetime, end_datetime, value,
+          timeout=MEMO_TIMEOUT, **params):
+    """
+    Stores a value for a provider call, e.g. a slice of data that was loaded
+    for a larger window
+    """
+
+    key = make_key(provider, organization, start_datetime, end_datetime,
+                   params)
+    pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    local_cache.set(key, pickled, timeout=timeout)
+    shared = caches[MEMO_CACHE] if MEMO_CACHE else None
+    if shared is not None and len(pickled) <= MEMO_MAX_ENTRY_SIZE:
+        shared.set(key, pickled, timeout)
+
+
+def data_provider(name, timeout=MEMO_TIMEOUT):
+    """
+    Decorator for functions or report methods with an
+    ``(organization, start_datetime, end_datetime, **params)`` signature.
+    """
+
+    def decorator(func):
+        is_method = getfullargspec(func).args[:1] == ['self']
+
+        @wraps(func)
+        def wrapper(*args, **params):
+            window = list(args[1:] if is_method else args)
+            extra = window[len(WINDOW):]
+            del window[len(WINDOW):]
+            key_params = dict(params)
+            for field in WINDOW[len(window):]:
+                window.append(key_params.pop(field))
+            key = make_key(name, *window, params=key_params, args=extra)
+            return get_or_compute(name, key, lambda: func(*args, **params),
+                                  timeout)
+
+        wrapper.provider = name
+        wrapper.prime = partial(prime, name, timeout=timeout)
+        return wrapper
+
+    return decorator
@@ -0,0 +1,119 @@
+"""
+Memory accounting for document generation.
+
+``track_memory`` measures the peak memory of a block either with tracemalloc
+(precise, Python allocations only) or by sampling the resident set size of
+the process (cheaper, includes pandoc buffers, C extensions, etc).
+
+tracemalloc traces the whole process and has a single peak, so only one block
+at a time measures with it. Blocks that start while it is in use, e.g. in
+other generation threads, sample the RSS instead. The peak of the block using
+tracemalloc includes the allocations of blocks running next to it.
+"""
+import resource
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+from .conf import MEMORY_TRACKING
+
+TRACEMALLOC = 'tracemalloc'
+RSS = 'rss'
+
+RSS_INTERVAL = 0.05
+
+_lock = threading.Lock()
+_tracing = False
+_started = False
+
+
+def current_rss():
+    """
+    :return: resident set size of the process in bytes
+    """
+
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * resource.getpagesize()
+    except (IOError, OSError):
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS, without
+        # /proc this is the best estimate available.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RSSSampler(threading.Thread):
+
+    def __init__(self, interval=RSS_INTERVAL):
+        super(RSSSampler, self).__init__(name='reports-rss-sampler')
+        self.daemon = True
+        self.interval = interval
+        self.baseline = current_rss()
+        self.peak = self.baseline
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.peak = max(self.peak, current_rss())
+        return self.peak - self.baseline
+
+
+def _start_tracing():
+    """
+    :return: True if the caller has tracemalloc to itself and may reset its
+        peak
+    """
+
+    global _tracing, _started
+    with _lock:
+        if _tracing:
+            return False
+        _tracing = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started = True
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        return True
+
+
+def _stop_tracing():
+    global _tracing, _started
+    with _lock:
+        _tracing = False
+        if _started:
+            tracemalloc.stop()
+            _started = False
+
+
+@contextmanager
+def track_memory(mode=MEMORY_TRACKING):
+    """
+    Yields a dict with the ``peak`` memory in bytes used by the block, set
+    once the block finishes. The peak stays None if tracking is disabled.
+    """
+
+    usage = {'peak': None}
+    if mode == TRACEMALLOC and _start_tracing():
+        baseline = tracemalloc.get_traced_memory()[0]
+        try:
+            yield usage
+        finally:
+            usage['peak'] = tracemalloc.get_traced_memory()[1] - baseline
+            _stop_tracing()
+    elif mode in (TRACEMALLOC, RSS):
+        sampler = RSSSampler()
+        sampler.start()
+        try:
+            yield usage
+        finally:
+            usage['peak'] = sampler.stop()
+    elif mode:
+        raise ValueError('Unknown memory tracking "{0}"'.format(mode))
+    else:
+        yield usage
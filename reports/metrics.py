@@ -0,0 +1,111 @@
+"""
+Lightweight metrics for the reports app.
+
+Values are aggregated in-process and, when ``REPORT_METRICS_BACKEND`` is set,
+forwarded to that callable as ``backend(kind, name, value, tags)`` so they can
+be shipped to statsd, prometheus, etc.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from timeit import default_timer
+
+from django.utils.module_loading import import_string
+
+from .conf import METRICS_BACKEND
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_timings = {}
+_backend = None
+
+
+def _key(name, tags):
+    return name, tuple(sorted(tags.items()))
+
+
+def _forward(kind, name, value, tags):
+    global _backend
+
+    if not METRICS_BACKEND:
+        return
+    if _backend is None:
+        _backend = import_string(METRICS_BACKEND)
+    try:
+        _backend(kind, name, value, tags)
+    except Exception:
+        logger.exception('Error forwarding metric %s', name)
+
+
+def incr(name, value=1, **tags):
+    key = _key(name, tags)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    _forward('counter', name, value, tags)
+
+
+def gauge(name, value, **tags):
+    with _lock:
+        _gauges[_key(name, tags)] = value
+    _forward('gauge', name, value, tags)
+
+
+def timing(name, seconds, **tags):
+    key = _key(name, tags)
+    with _lock:
+        count, total, peak = _timings.get(key, (0, 0.0, 0.0))
+        _timings[key] = (count + 1, total + seconds, max(peak, seconds))
+    _forward('timing', name, seconds, tags)
+
+
+@contextmanager
+def timer(name, **tags):
+    start = default_timer()
+    try:
+        yield
+    finally:
+        timing(name, default_timer() - start, **tags)
+
+
+def snapshot():
+    """
+    :return: copy of the values collected by this process
+    """
+
+    with _lock:
+        timings = dict(
+            (key, {'count': count, 'total': total, 'max': peak})
+            for key, (count, total, peak) in _timings.items()
+        )
+        return {
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'timings': timings,
+        }
+
+
+def get(name, default=0, **tags):
+    """
+    :return: counter, gauge or timing summary for the name and tags
+    """
+
+    key = _key(name, tags)
+    with _lock:
+        if key in _counters:
+            return _counters[key]
+        if key in _gauges:
+            return _gauges[key]
+        if key in _timings:
+            count, total, peak = _timings[key]
+            return {'count': count, 'total': total, 'max': peak}
+    return default
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _timings.clear()
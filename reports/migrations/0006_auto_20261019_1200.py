@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.28 on 2026-10-19 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import reports.models
+import reports.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0005_auto_20190930_1822'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='report',
+            name='document',
+            field=models.FileField(blank=True, max_length=1024, null=True, storage=reports.storage.ReportStorage(), upload_to=reports.models.report_upload_to),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='document_size',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='stored_size',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.28 on 2026-10-19 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_delivered(apps, schema_editor):
+    # Reports generated before delivery existed must not be emailed now
+    Report = apps.get_model('reports', 'Report')
+    Report.objects.update(delivered_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0006_auto_20261019_1200'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(mark_delivered, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.28 on 2026-10-19 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0008_report_generation_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='memory_peak',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
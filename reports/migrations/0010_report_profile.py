@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.28 on 2026-10-19 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import reports.models
+import reports.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0009_report_memory_peak'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='profile',
+            field=models.FileField(blank=True, editable=False, max_length=1024, null=True, storage=reports.storage.ReportStorage(), upload_to=reports.models.profile_upload_to),
+        ),
+    ]
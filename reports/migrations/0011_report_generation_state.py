@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.28 on 2026-10-19 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def set_generation_state(apps, schema_editor):
+    Report = apps.get_model('reports', 'Report')
+    missing = Q(document='') | Q(document=None)
+    Report.objects.exclude(missing).update(generation_state='done')
+    Report.objects.filter(missing).update(generation_state='failed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0010_report_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='generation_state',
+            field=models.CharField(choices=[('pending', 'Pending'), ('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='queued_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='started_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(set_generation_state,
+                             migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['generation_state', 'queued_at'], name='reports_report_queued_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['generation_state', 'started_at'], name='reports_report_started_idx'),
+        ),
+    ]
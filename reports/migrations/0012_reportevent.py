@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.28 on 2026-10-19 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0011_report_generation_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('handler', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('report', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='reports.Report')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='reportevent',
+            index=models.Index(fields=['handler', 'processed_at', 'available_at'], name='reports_event_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.28 on 2026-10-19 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0012_reportevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='schedule',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reports', to='reports.ReportSchedule'),
+        ),
+        migrations.AddConstraint(
+            model_name='report',
+            constraint=models.UniqueConstraint(fields=('schedule', 'start_datetime', 'end_datetime'), name='reports_report_unique_run'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.28 on 2026-10-19 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0013_report_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='predicted_time',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+    ]
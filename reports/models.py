@@ -1,22 +1,36 @@
+import hashlib
 import json
 import logging
+import struct
 from copy import deepcopy
 from datetime import datetime, time, timedelta
 from importlib import import_module
 from pkgutil import walk_packages
+from timeit import default_timer
 
 from dateutil.relativedelta import relativedelta
 from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
-from django.db import models
-from django.db.models import Q
+from django.core.cache import caches
+from django.db import (IntegrityError, connections, models, router,
+                       transaction)
+from django.db.models import Count, F, Q, Sum
 from django.dispatch import Signal
 from django.utils import timezone
 from django_celery_beat.models import PeriodicTask, CrontabSchedule
 from jsonfield.fields import JSONField
 
+from . import metrics
 from .base import BaseReport
-from .conf import ORG_MODEL, REPORT_PACKAGES, TYPE_CHOICES
+from .conf import (DISPATCH_ORDER, HIGH_MEMORY_QUEUE, MEMORY_BUDGET,
+                   MEMORY_HISTORY_DAYS, ORG_MODEL, PREVIEW_CACHE,
+                   PREVIEW_CACHE_TIMEOUT, QUEUE,
+                   RECONCILE_QUEUED_TIMEOUT, RECONCILE_RUNNING_TIMEOUT,
+                   REPORT_PACKAGES, TYPE_CHOICES)
+from .memory import track_memory
+from .profiling import profiled
+from .routing import replica_for
+from .storage import report_storage
 from .utils import hashed_upload_to
 
 logger = logging.getLogger(__name__)
@@ -46,6 +60,23 @@ def report_upload_to(instance, filename):
     return hashed_upload_to('reports', instance.document, filename)
 
 
+def profile_upload_to(instance, filename):
+    return hashed_upload_to('profiles', instance.profile, filename)
+
+
+def lock_window(schedule_id, start_datetime, end_datetime, using):
+    """
+    Takes a transaction level advisory lock on a window of a schedule, it is
+    released with the transaction open on ``using``
+    """
+
+    key = '{0}|{1}|{2}'.format(schedule_id, start_datetime, end_datetime)
+    lock_id = struct.unpack(
+        '>q', hashlib.sha1(key.encode('utf-8')).digest()[:8])[0]
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [lock_id])
+
+
 class BaseReportModel(models.Model):
     """
     Abstract Base Report Model for Report and ReportSchedule fields.
@@ -77,16 +108,124 @@ class ReportManager(models.Manager):
         qs = self.get_queryset()
         return qs.filter(Q(document='') | Q(document=None))
 
+    def storage_summary(self):
+        """
+        Document and stored sizes summed up per report type
+        """
+
+        qs = self.get_queryset().exclude(document_size=None)
+        return qs.values('report').annotate(
+            documents=Count('pk'),
+            document_size=Sum('document_size'),
+            stored_size=Sum('stored_size'),
+        ).order_by('report')
+
+    def over_memory_budget(self):
+        """
+        Reports that went over ``REPORT_MEMORY_BUDGET`` within the last
+        ``REPORT_MEMORY_HISTORY_DAYS``
+        """
+
+        qs = self.get_queryset()
+        if not MEMORY_BUDGET:
+            return qs.none()
+        since = timezone.now() - timedelta(days=MEMORY_HISTORY_DAYS)
+        return qs.filter(created_at__gte=since,
+                         memory_peak__gt=MEMORY_BUDGET)
+
+    def stuck(self, now=None):
+        """
+        Reports that were queued longer than
+        ``REPORT_RECONCILE_QUEUED_TIMEOUT`` or are running longer than
+        ``REPORT_RECONCILE_RUNNING_TIMEOUT``, their task was lost or the worker
+        died
+        """
+
+        now = now or timezone.now()
+        return self.get_queryset().filter(
+            Q(generation_state=Report.STATE_QUEUED,
+              queued_at__lt=now - timedelta(
+                  seconds=RECONCILE_QUEUED_TIMEOUT)) |
+            Q(generation_state=Report.STATE_RUNNING,
+              started_at__lt=now - timedelta(
+                  seconds=RECONCILE_RUNNING_TIMEOUT))
+        )
+
+    def undelivered(self):
+        """
+        Generated reports with emails that were not delivered yet
+        """
+
+        qs = self.get_queryset().exclude(Q(document='') | Q(document=None))
+        return qs.filter(emails__len__gt=0, delivered_at=None)
+
 
 class Report(BaseReportModel):
+    STATE_PENDING = 'pending'
+    STATE_QUEUED = 'queued'
+    STATE_RUNNING = 'running'
+    STATE_DONE = 'done'
+    STATE_FAILED = 'failed'
+
+    STATE_CHOICES = (
+        (STATE_PENDING, STATE_PENDING.title()),
+        (STATE_QUEUED, STATE_QUEUED.title()),
+        (STATE_RUNNING, STATE_RUNNING.title()),
+        (STATE_DONE, STATE_DONE.title()),
+        (STATE_FAILED, STATE_FAILED.title()),
+    )
+
     start_datetime = models.DateTimeField()
     end_datetime = models.DateTimeField()
     document = models.FileField(upload_to=report_upload_to, blank=True,
-                                null=True, max_length=1024)
+                                null=True, max_length=1024,
+                                storage=report_storage)
+    # Size of the generated document and the size it takes in the storage
+    document_size = models.BigIntegerField(null=True, blank=True,
+                                           editable=False)
+    delivered_at = models.DateTimeField(null=True, blank=True,
+                                        editable=False)
+    # Seconds it took to generate and store the document
+    generation_time = models.FloatField(null=True, blank=True, editable=False)
+    # Generation time predicted by ``reports.costs`` when it was dispatched
+    predicted_time = models.FloatField(null=True, blank=True, editable=False)
+    # Peak memory in bytes used while generating the document
+    memory_peak = models.BigIntegerField(null=True, blank=True,
+                                         editable=False)
+    # Call profile and SQL queries of a profiled generation
+    profile = models.FileField(upload_to=profile_upload_to, blank=True,
+                               null=True, max_length=1024, editable=False,
+                               storage=report_storage)
+    # Size of the profile archive, which the storage may keep compressed
+    profile_size = models.BigIntegerField(null=True, blank=True,
+                                          editable=False)
+    stored_size = models.BigIntegerField(null=True, blank=True,
+                                         editable=False)
+    # Progress of the document generation, see ``reports.reconcile``
+    generation_state = models.CharField(max_length=16, choices=STATE_CHOICES,
+                                        default=STATE_PENDING, editable=False)
+    queued_at = models.DateTimeField(null=True, blank=True, editable=False)
+    started_at = models.DateTimeField(null=True, blank=True, editable=False)
+    attempts = models.PositiveIntegerField(default=0, editable=False)
+    # Schedule that created the report, one report per schedule and window
+    schedule = models.ForeignKey('ReportSchedule', null=True, blank=True,
+                                 editable=False, on_delete=models.SET_NULL,
+                                 related_name='reports')
 
     class Meta(object):
         verbose_name = "Report"
         verbose_name_plural = "Reports"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['schedule', 'start_datetime', 'end_datetime'],
+                name='reports_report_unique_run'),
+        ]
+        indexes = [
+            models.Index(fields=['generation_state', 'queued_at'],
+                         name='reports_report_queued_idx'),
+            models.Index(fields=['generation_state', 'started_at'],
+                         name='reports_report_started_idx'),
+        ]
 
     objects = ReportManager()
 
@@ -109,33 +248,120 @@ class Report(BaseReportModel):
             self.name = self._run_instance_method('get_report_name')
         super(Report, self).save(*args, **kwargs)
 
-    def schedule_document_generation(self):
+    def schedule_document_generation(self, force=False, countdown=10):
         """
         Schedules a task to generate the document
+        :param force: regenerate an already generated document
         """
 
         from .tasks import generate_document
 
-        if not self.generated:
-            kwargs = {'report_id': self.pk}
-            generate_document.apply_async(kwargs=kwargs, countdown=10)
+        if self.generated and not force:
+            return
+        self._set_state(self.STATE_QUEUED, queued_at=timezone.now())
+        kwargs = {'report_id': self.pk,
+                  'queued_at': self.queued_at.timestamp()}
+        generate_document.apply_async(kwargs=kwargs, countdown=countdown,
+                                      queue=self.get_queue())
+
+    def _set_state(self, state, **fields):
+        fields['generation_state'] = state
+        Report.objects.filter(pk=self.pk).update(**fields)
+        for name, value in fields.items():
+            if not hasattr(value, 'resolve_expression'):
+                setattr(self, name, value)
+
+    def get_queue(self):
+        """
+        Queue for the document generation. Reports of an organization that
+        recently went over the memory budget go to the high memory queue.
+        """
+
+        if HIGH_MEMORY_QUEUE and Report.objects.over_memory_budget().filter(
+                report=self.report,
+                organization_id=self.organization_id).exists():
+            return HIGH_MEMORY_QUEUE
+        return QUEUE
 
     def generate_document(self):
         """
         Generate and save the document
         """
 
-        content = self._run_instance_method('generate')
-        name = self._run_instance_method('get_report_filename')
-
-        # Setting save to false to avoid hashed_upload_to raising an exception
-        # because of document not having an attached file.
-        self.document.save(name, content, save=False)
+        self._set_state(self.STATE_RUNNING, started_at=timezone.now(),
+                        attempts=F('attempts') + 1)
+        self.attempts += 1
+        start = default_timer()
+        try:
+            with track_memory() as memory, profiled(self) as profile:
+                with replica_for(self):
+                    content = self._run_instance_method('generate')
+                name = self._run_instance_method('get_report_filename')
+
+                # Setting save to false to avoid hashed_upload_to raising an
+                # exception because of document not having an attached file.
+                upload_start = default_timer()
+                self.document.save(name, content, save=False)
+                upload_time = default_timer() - upload_start
+        except Exception:
+            self._set_state(self.STATE_FAILED)
+            raise
+        self.document_size = content.size
+        self.stored_size = self.document.size
+        self.generation_time = default_timer() - start
+        metrics.timing('reports.upload', upload_time, report=self.report)
+        if upload_time:
+            metrics.gauge('reports.upload.throughput',
+                          self.stored_size / upload_time, report=self.report)
+        self.memory_peak = memory['peak']
+        if profile is not None:
+            artifact = profile.artifact()
+            self.profile_size = artifact.size
+            self.profile.save('{0}.zip'.format(name), artifact, save=False)
+        self.generation_state = self.STATE_DONE
         self.save()
 
-        report_generated.send(sender=self.__class__, report=self)
+        if MEMORY_BUDGET and memory['peak'] and \
+                memory['peak'] > MEMORY_BUDGET:
+            logger.warning('Report %s used %d bytes, over the memory budget',
+                           self.pk, memory['peak'])
 
-    def _run_instance_method(self, method):
+        # Handlers, including the report_generated receivers, run in their
+        # own tasks
+        from .hooks import record
+        record(self)
+
+    def _preview_key(self):
+        # Edits of the window or config invalidate the preview
+        data = json.dumps([self.typ, self.config, self.start_datetime,
+                           self.end_datetime], sort_keys=True, default=str)
+        return 'reports:preview:{0}:{1}'.format(
+            self.pk, hashlib.sha1(data.encode('utf-8')).hexdigest())
+
+    def generate_preview(self, schedule=True):
+        """
+        Renders a preview from sampled data, see ``BaseReport.preview``.
+        Previews are cached for ``REPORT_PREVIEW_CACHE_TIMEOUT``, they are
+        never stored as the document.
+        :param schedule: queue the generation of the full document
+        :return: html document as a bytestring
+        """
+
+        cache = caches[PREVIEW_CACHE]
+        key = self._preview_key()
+        html = cache.get(key)
+        if html is None:
+            with metrics.timer('reports.preview', report=self.report):
+                html = self._run_instance_method('preview')
+            cache.set(key, html, PREVIEW_CACHE_TIMEOUT)
+        else:
+            metrics.incr('reports.preview.cached', report=self.report)
+
+        if schedule and self.generation_state == self.STATE_PENDING:
+            self.schedule_document_generation()
+        return html
+
+    def _run_instance_method(self, method, **extra):
         kwargs = deepcopy(self.config)
         if not isinstance(kwargs, dict):
             kwargs = json.loads(kwargs)
@@ -148,10 +374,37 @@ class Report(BaseReportModel):
             'organization': self.organization,
             'config': self.config,
         })
+        kwargs.update(extra)
         instance = REPORTS[self.report]()
         return getattr(instance, method)(**kwargs)
 
 
+class ReportEvent(models.Model):
+    """
+    Completion of a report waiting to be processed by a post-generation
+    handler, see ``reports.hooks``
+    """
+
+    # No database constraint, so the reports table can be partitioned
+    report = models.ForeignKey(Report, on_delete=models.CASCADE,
+                               db_constraint=False)
+    handler = models.CharField(max_length=64)
+    created_at = models.DateTimeField(default=timezone.now)
+    available_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta(object):
+        indexes = [
+            models.Index(fields=['handler', 'processed_at', 'available_at'],
+                         name='reports_event_pending_idx'),
+        ]
+
+    def __str__(self):
+        return u'{0} ({1})'.format(self.handler, self.report_id)
+
+
 class ReportSchedule(BaseReportModel):
     PERIOD_DAILY = 'daily'
     PERIOD_WEEKLY = 'weekly'
@@ -219,14 +472,16 @@ class ReportSchedule(BaseReportModel):
         self.periodic_task, __ = PeriodicTask.objects.get_or_create(**data)
         self.save()
 
-    def datetimes_by_period(self):
+    def datetimes_by_period(self, now=None):
         """
         Constructs start_datetime and end_datetime based on a self.period
+        :param now: reference datetime, defaults to the current time
         :return: start_datetime, end_datetime
         """
+        now = now or timezone.now()
         if self.report_datetime:
             end_time = self.report_datetime.time()
-            end_datetime = datetime.combine(timezone.now().date(), end_time)
+            end_datetime = datetime.combine(now.date(), end_time)
 
             if self.period == self.PERIOD_DAILY:
                 # Yesterday
@@ -254,7 +509,7 @@ class ReportSchedule(BaseReportModel):
 
             return start_datetime, end_datetime
 
-        today = datetime.combine(timezone.now().date(), time(0, 0, 0))
+        today = datetime.combine(now.date(), time(0, 0, 0))
 
         if self.period == self.PERIOD_DAILY:
             # Yesterday
@@ -280,7 +535,7 @@ class ReportSchedule(BaseReportModel):
         elif self.period == self.PERIOD_QUARTERLY:
             # Last quarter's start and end date
             year = today.year
-            last_quarter = (today.month - 1) / 3
+            last_quarter = (today.month - 1) // 3
             if last_quarter == 0:
                 # in this case it should be last year's Q4
                 last_quarter = 4
@@ -304,6 +559,38 @@ class ReportSchedule(BaseReportModel):
 
         return start_datetime, end_datetime
 
+    def backfill_windows(self, count, now=None):
+        """
+        The windows the schedule would have reported on in the past
+        :param now: reference datetime, defaults to the current time
+        :return: list of ``count`` (start_datetime, end_datetime), oldest
+            first
+        """
+
+        windows = []
+        for __ in range(count):
+            start_datetime, end_datetime = self.datetimes_by_period(now)
+            if start_datetime is None:
+                break
+            windows.append((start_datetime, end_datetime))
+            # Windows of a chosen time start one second after the previous
+            # end, the others on the day the previous window is reported.
+            if self.report_datetime:
+                now = start_datetime - timedelta(seconds=1)
+            else:
+                now = start_datetime
+        return windows[::-1]
+
+    def backfill(self, count, now=None, **kwargs):
+        """
+        Creates and generates the reports of the last ``count`` windows,
+        see ``reports.backfill.backfill``
+        """
+
+        from .backfill import backfill
+
+        return backfill(self, self.backfill_windows(count, now), **kwargs)
+
     def set_schedule(self):
         """
         Constructs crontab format schedule based on a period and stores
@@ -372,7 +659,11 @@ class ReportSchedule(BaseReportModel):
 
     def schedule_report(self):
         """
-        Creates `Report` instance and schedules it.
+        Creates `Report` instance and schedules it. Runs of a window that
+        already has a report of this schedule, e.g. when beat fires twice,
+        are skipped. With ``REPORT_DISPATCH_ORDER = 'cost'`` the report is
+        queued later by ``reports.costs.dispatch``.
+        :return: the report or None for a skipped run
         """
 
         start_datetime, end_datetime = self.datetimes_by_period()
@@ -386,9 +677,39 @@ class ReportSchedule(BaseReportModel):
             'end_datetime': end_datetime,
             'config': self.config,
             'emails': self.emails,
+            'schedule': self,
         }
         if self.name:
             data['name'] = self.name
 
-        report = Report.objects.create(**data)
-        report.schedule_document_generation()
+        window = {'schedule': self, 'start_datetime': start_datetime,
+                  'end_datetime': end_datetime}
+        using = router.db_for_write(Report)
+        try:
+            # INSERT ... ON CONFLICT DO NOTHING needs a unique index, which
+            # partitioned tables can not have on the window as it does not
+            # contain the partition key. Concurrent runs of a window wait for
+            # each other on a lock instead, held by the transaction that
+            # checks for and inserts the report.
+            with transaction.atomic(using=using):
+                lock_window(self.pk, start_datetime, end_datetime, using)
+                duplicate = Report.objects.using(using).filter(
+                    **window).exists()
+                if not duplicate:
+                    report = Report.objects.using(using).create(**data)
+        except IntegrityError:
+            if not Report.objects.using(using).filter(**window).exists():
+                raise
+            duplicate = True
+        if duplicate:
+            logger.info('Skipping duplicate run of schedule %s for %s to %s',
+                        self.pk, start_datetime, end_datetime)
+            metrics.incr('reports.schedule.duplicate', report=self.report)
+            return None
+
+        if DISPATCH_ORDER == 'cost':
+            from .costs import schedule
+            transaction.on_commit(schedule)
+        else:
+            report.schedule_document_generation()
+        return report
@@ -0,0 +1,223 @@
+"""
+Optional declarative range partitioning of the ``Report`` table by
+``created_at``, one partition per month. Requires PostgreSQL 11 or newer.
+
+The primary key of a partitioned table has to contain the partition key, so
+after converting it becomes ``(id, created_at)``. Ids still come from the
+same sequence, so the model and manager API keep working unchanged.
+"""
+import logging
+import re
+from datetime import date, datetime
+
+from dateutil.relativedelta import relativedelta
+from django.db import connections, transaction
+
+from .models import Report, ReportEvent
+
+logger = logging.getLogger(__name__)
+
+PARTITION_RE = re.compile(r'_p(\d{4})(\d{2})$')
+
+
+def _table():
+    return Report._meta.db_table
+
+
+def _month(value):
+    return date(value.year, value.month, 1)
+
+
+def partition_name(month):
+    return '{0}_p{1:%Y%m}'.format(_table(), month)
+
+
+def is_partitioned(using='default'):
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = to_regclass(%s)", [_table()])
+        return cursor.fetchone() is not None
+
+
+def partitions(using='default'):
+    """
+    :return: list of (month, table name) of the monthly partitions
+    """
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s)", [_table()])
+        names = [row[0] for row in cursor.fetchall()]
+
+    result = []
+    for name in names:
+        match = PARTITION_RE.search(name)
+        if match:
+            month = date(int(match.group(1)), int(match.group(2)), 1)
+            result.append((month, name))
+    return sorted(result)
+
+
+def create_partitions(months_ahead=3, start=None, using='default'):
+    """
+    Creates missing monthly partitions from ``start`` (defaults to the
+    current month) up to ``months_ahead`` months in the future.
+    :return: names of the created partitions
+    """
+
+    today = date.today()
+    month = _month(start or today)
+    last = _month(today) + relativedelta(months=months_ahead)
+    existing = dict(partitions(using))
+    created = []
+
+    with connections[using].cursor() as cursor:
+        while month <= last:
+            if month not in existing:
+                name = partition_name(month)
+                cursor.execute(
+                    'CREATE TABLE "{0}" PARTITION OF "{1}" '
+                    'FOR VALUES FROM (%s) TO (%s)'.format(name, _table()),
+                    [month, month + relativedelta(months=1)])
+                created.append(name)
+            month += relativedelta(months=1)
+
+    for name in created:
+        logger.info('Created partition %s', name)
+    return created
+
+
+def _stored_files(cursor, name, batch_size=1000):
+    """
+    :return: (report ids, names of stored documents and profiles) of the rows
+        of a partition
+    """
+
+    ids, files = [], []
+    cursor.execute('SELECT "{0}", document, profile FROM "{1}"'.format(
+        Report._meta.pk.column, name))
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for pk, document, profile in rows:
+            ids.append(pk)
+            files.extend(file for file in (document, profile) if file)
+    return ids, files
+
+
+def _delete_stored(ids, files, using, batch_size=1000):
+    """
+    Deletes the events and stored files of dropped reports
+    """
+
+    for i in range(0, len(ids), batch_size):
+        ReportEvent.objects.using(using).filter(
+            report_id__in=ids[i:i + batch_size]).delete()
+
+    storage = Report._meta.get_field('document').storage
+    for name in files:
+        try:
+            storage.delete(name)
+        except Exception:
+            logger.warning('Could not delete %s', name, exc_info=True)
+
+
+def remove_partitions(before, drop=False, using='default'):
+    """
+    Detaches the partitions with all rows older than ``before``. Detached
+    tables keep their rows and documents.
+    :param drop: drop the detached tables together with the events, stored
+        documents and profiles of their reports
+    :return: names of the removed partitions
+    """
+
+    if isinstance(before, datetime):
+        before = before.date()
+
+    removed = []
+    with connections[using].cursor() as cursor:
+        for month, name in partitions(using):
+            if month + relativedelta(months=1) > before:
+                continue
+            cursor.execute('ALTER TABLE "{0}" DETACH PARTITION "{1}"'.format(
+                _table(), name))
+            if drop:
+                ids, files = _stored_files(cursor, name)
+                cursor.execute('DROP TABLE "{0}"'.format(name))
+                # Files go last, a failed drop keeps rows pointing to them
+                _delete_stored(ids, files, using)
+            removed.append(name)
+            logger.info('%s partition %s', 'Dropped' if drop else 'Detached',
+                        name)
+    return removed
+
+
+def convert(months_ahead=3, using='default'):
+    """
+    Replaces the ``Report`` table by a partitioned one and copies the rows
+    over. Rows outside of the monthly partitions end up in a default one.
+    """
+
+    table = _table()
+    legacy = '{0}_legacy'.format(table)
+    pk = Report._meta.pk.column
+
+    with transaction.atomic(using=using):
+        _convert(table, legacy, pk, months_ahead, using)
+
+
+def _convert(table, legacy, pk, months_ahead, using):
+    with connections[using].cursor() as cursor:
+        # Pending foreign key checks would block dropping the old table
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(
+            "SELECT pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype = 'f'", [table])
+        foreign_keys = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT i.relname, pg_get_indexdef(i.oid) FROM pg_index x "
+            "JOIN pg_class i ON i.oid = x.indexrelid "
+            "WHERE x.indrelid = to_regclass(%s) AND NOT x.indisprimary",
+            [table])
+        indexes = cursor.fetchall()
+        cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", [table, pk])
+        sequence = cursor.fetchone()[0]
+        cursor.execute("SELECT min(created_at) FROM {0}".format(table))
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute('ALTER TABLE "{0}" RENAME TO "{1}"'.format(
+            table, legacy))
+        cursor.execute(
+            'CREATE TABLE "{0}" (LIKE "{1}" INCLUDING DEFAULTS) '
+            'PARTITION BY RANGE (created_at)'.format(table, legacy))
+        cursor.execute('ALTER TABLE "{0}" ADD PRIMARY KEY ("{1}", created_at)'
+                       .format(table, pk))
+        for definition in foreign_keys:
+            cursor.execute('ALTER TABLE "{0}" ADD {1}'.format(
+                table, definition))
+        if sequence:
+            cursor.execute('ALTER SEQUENCE {0} OWNED BY "{1}"."{2}"'.format(
+                sequence, table, pk))
+        cursor.execute('CREATE TABLE "{0}_default" PARTITION OF "{0}" '
+                       'DEFAULT'.format(table))
+
+    create_partitions(months_ahead, start=oldest, using=using)
+
+    with connections[using].cursor() as cursor:
+        cursor.execute('INSERT INTO "{0}" SELECT * FROM "{1}"'.format(
+            table, legacy))
+        cursor.execute('DROP TABLE "{0}"'.format(legacy))
+        for name, definition in indexes:
+            if ' UNIQUE ' in definition and 'created_at' not in definition:
+                # Scheduled runs stay unique through the advisory lock of
+                # ReportSchedule.schedule_report
+                logger.warning('Skipping unique index %s, it does not '
+                               'contain the partition key', name)
+                continue
+            cursor.execute(definition.replace(
+                'ON public.{0}'.format(legacy), 'ON {0}'.format(table))
+                .replace('ON {0}'.format(legacy), 'ON {0}'.format(table)))
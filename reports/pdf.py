@@ -0,0 +1,109 @@
+"""
+PDF post-processing.
+
+Chrome embeds screenshots and charts at their full resolution and may embed
+the same image several times. ``optimize`` downsamples images larger than
+``max_image_size`` pixels, stores identical images once and linearizes the
+file, so viewers can show the first page before the rest is loaded.
+
+It is an ``isolation`` task, so it runs in the renderer pool when process
+isolation is enabled. Requires pikepdf and Pillow, install them with
+``pip install django-libreports[pdf]``.
+"""
+import hashlib
+import io
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .conf import PDF_IMAGE_QUALITY, PDF_LINEARIZE, PDF_MAX_IMAGE_SIZE
+
+# Color spaces that can be written as JPEG
+JPEG_MODES = {'RGB': '/DeviceRGB', 'L': '/DeviceGray'}
+
+
+def _import():
+    try:
+        import pikepdf
+        from PIL import Image
+    except ImportError:
+        raise ImproperlyConfigured(
+            'pikepdf and Pillow are required for PDF post-processing, '
+            'install them with "pip install django-libreports[pdf]"')
+    return pikepdf, Image
+
+
+def _images(pdf, pikepdf):
+    """
+    :return: list of (resources, name, image) of every image of the pages
+    """
+
+    result = []
+    for page in pdf.pages:
+        resources = page.obj.get('/Resources')
+        xobjects = resources.get('/XObject') if resources else None
+        if xobjects is None:
+            continue
+        for name, obj in xobjects.items():
+            if obj.get('/Subtype') == pikepdf.Name.Image:
+                result.append((xobjects, name, obj))
+    return result
+
+
+def _downsample(obj, max_size, quality, pikepdf, Image):
+    """
+    :return: True if the image was replaced by a smaller one
+    """
+
+    if max(int(obj.Width), int(obj.Height)) <= max_size or \
+            obj.get('/ImageMask') or '/Mask' in obj or '/SMask' in obj:
+        return False
+    try:
+        image = pikepdf.PdfImage(obj).as_pil_image()
+    except Exception:
+        # Color spaces or filters Pillow can not read
+        return False
+    if image.mode not in JPEG_MODES:
+        return False
+
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=quality, optimize=True)
+    obj.write(buffer.getvalue(), filter=pikepdf.Name.DCTDecode)
+    obj.Width, obj.Height = image.size
+    obj.ColorSpace = pikepdf.Name(JPEG_MODES[image.mode])
+    obj.BitsPerComponent = 8
+    for key in ('/DecodeParms', '/Decode'):
+        if key in obj:
+            del obj[key]
+    return True
+
+
+def optimize(source, output, linearize=PDF_LINEARIZE,
+             max_image_size=PDF_MAX_IMAGE_SIZE, quality=PDF_IMAGE_QUALITY,
+             dedupe=True):
+    """
+    :param max_image_size: longest side of images in pixels, 0 keeps them
+    :param quality: JPEG quality of downsampled images
+    :param dedupe: store identical images once
+    """
+
+    pikepdf, Image = _import()
+
+    with pikepdf.open(source) as pdf:
+        seen = {}
+        processed = set()
+        for xobjects, name, obj in _images(pdf, pikepdf):
+            if dedupe:
+                digest = hashlib.sha1(obj.read_raw_bytes()).hexdigest()
+                key = (digest, repr(obj.stream_dict))
+                if key in seen and seen[key].objgen != obj.objgen:
+                    xobjects[name] = seen[key]
+                    continue
+                seen.setdefault(key, obj)
+            if max_image_size and obj.objgen not in processed:
+                processed.add(obj.objgen)
+                _downsample(obj, max_image_size, quality, pikepdf, Image)
+
+        pdf.remove_unreferenced_resources()
+        pdf.save(output, linearize=linearize, compress_streams=True,
+                 object_stream_mode=pikepdf.ObjectStreamMode.generate)
@@ -0,0 +1,124 @@
+"""
+Capacity planning for scheduled reports.
+
+Expands the crontab of every ``ReportSchedule`` over a time range and joins
+it with the recorded generation times, resulting in the expected load per
+minute, queue and document type. Schedules are grouped by crontab, report and
+type in the database, so each distinct crontab is only expanded once.
+"""
+import json
+from collections import defaultdict, namedtuple
+from datetime import datetime, time, timedelta
+
+from celery.schedules import crontab
+from django.db.models import Avg, Count
+from django.utils import timezone
+
+from .conf import HIGH_MEMORY_QUEUE, QUEUE
+from .models import Report, ReportSchedule
+
+Load = namedtuple('Load', ['minute', 'queue', 'typ', 'renders', 'seconds'])
+
+CRONTAB_FIELDS = ('minute', 'hour', 'day_of_week', 'day_of_month',
+                  'month_of_year')
+
+
+def crontab_key(schedule):
+    if not isinstance(schedule, dict):
+        schedule = json.loads(schedule or '{}')
+    return tuple(str(schedule.get(field, '*')) for field in CRONTAB_FIELDS)
+
+
+def expand_crontab(key, start, end):
+    """
+    :param key: crontab fields as returned by ``crontab_key``
+    :return: datetimes the crontab fires at in [start, end)
+    """
+
+    cron = crontab(**dict(zip(CRONTAB_FIELDS, key)))
+    times = [time(hour, minute) for hour in sorted(cron.hour)
+             for minute in sorted(cron.minute)]
+
+    result = []
+    day = start.date()
+    while day <= end.date():
+        # Celery counts the days of the week from Sunday=0
+        if day.month in cron.month_of_year and \
+                day.day in cron.day_of_month and \
+                day.isoweekday() % 7 in cron.day_of_week:
+            for moment in times:
+                fire = datetime.combine(day, moment)
+                if start <= fire < end:
+                    result.append(fire)
+        day += timedelta(days=1)
+    return result
+
+
+def high_memory_reports():
+    """
+    :return: set of (report, organization_id) routed to the high memory queue
+    """
+
+    if not HIGH_MEMORY_QUEUE:
+        return set()
+    qs = Report.objects.over_memory_budget() \
+        .values_list('report', 'organization_id').distinct()
+    return set(qs)
+
+
+def generation_times(history_days=30):
+    """
+    :return: average generation time per (report, typ) over the history
+    """
+
+    since = timezone.now() - timedelta(days=history_days)
+    qs = Report.objects.filter(created_at__gte=since) \
+        .exclude(generation_time=None).values('report', 'typ') \
+        .annotate(seconds=Avg('generation_time')).order_by()
+    return dict(((row['report'], row['typ']), row['seconds']) for row in qs)
+
+
+def plan(start, end, schedules=None, history_days=30):
+    """
+    Simulates the scheduled load between start and end
+    :param schedules: queryset of schedules, defaults to all active ones
+    :return: list of ``Load`` ordered by minute, queue and typ
+    """
+
+    if schedules is None:
+        schedules = ReportSchedule.objects.filter(
+            periodic_task__enabled=True)
+
+    # Organizations only matter for the queue of high memory reports
+    high_memory = high_memory_reports()
+    fields = ['schedule', 'report', 'typ']
+    if high_memory:
+        fields.append('organization')
+
+    groups = defaultdict(int)
+    rows = schedules.values(*fields).annotate(count=Count('pk')).order_by()
+    for row in rows:
+        key = crontab_key(row['schedule'])
+        if (row['report'], row.get('organization')) in high_memory:
+            queue = HIGH_MEMORY_QUEUE
+        else:
+            queue = QUEUE or 'celery'
+        groups[(key, row['report'], row['typ'], queue)] += row['count']
+
+    durations = generation_times(history_days)
+    default = sum(durations.values()) / len(durations) if durations else 0.0
+
+    expanded = {}
+    timeline = defaultdict(lambda: [0, 0.0])
+    for (key, report, typ, queue), count in groups.items():
+        if key not in expanded:
+            expanded[key] = expand_crontab(key, start, end)
+        seconds = durations.get((report, typ), default) * count
+        for minute in expanded[key]:
+            load = timeline[(minute, queue, typ)]
+            load[0] += count
+            load[1] += seconds
+
+    return [Load(minute, queue, typ, renders, seconds)
+            for (minute, queue, typ), (renders, seconds)
+            in sorted(timeline.items())]
@@ -0,0 +1,121 @@
+"""
+Opt-in profiling of document generation.
+
+A profiled generation records a cProfile call profile and every SQL query
+run through Django. The result is stored on ``Report.profile`` as a zip file
+with the raw ``profile.prof`` (for snakeviz, pstats, etc.) and text summaries.
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import random
+import zipfile
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from timeit import default_timer
+
+from django.core.files.base import ContentFile
+from django.db import connections
+
+from .conf import PROFILE_ORGANIZATIONS, PROFILE_REPORTS, PROFILE_SAMPLE_RATE
+
+
+def should_profile(report):
+    """
+    Profiling is enabled for a report by ``"profile": true`` in its config,
+    by ``REPORT_PROFILE_REPORTS``, ``REPORT_PROFILE_ORGANIZATIONS`` or by
+    ``REPORT_PROFILE_SAMPLE_RATE``.
+    """
+
+    config = report.config if isinstance(report.config, dict) else {}
+    return bool(
+        config.get('profile') or
+        report.report in PROFILE_REPORTS or
+        report.organization_id in PROFILE_ORGANIZATIONS or
+        (PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE)
+    )
+
+
+class QueryRecorder(object):
+    """
+    Database execute wrapper recording the duration of each query
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = default_timer()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, default_timer() - start))
+
+    @property
+    def total_time(self):
+        return sum(duration for __, duration in self.queries)
+
+    def summary(self, limit=50):
+        grouped = defaultdict(lambda: [0, 0.0])
+        for sql, duration in self.queries:
+            grouped[sql][0] += 1
+            grouped[sql][1] += duration
+
+        lines = ['{0} queries in {1:.3f}s'.format(len(self.queries),
+                                                  self.total_time), '']
+        rows = sorted(grouped.items(), key=lambda item: -item[1][1])
+        for sql, (count, duration) in rows[:limit]:
+            lines.append('{0:>6} {1:>10.3f}s  {2}'.format(count, duration,
+                                                          sql))
+        return '\n'.join(lines) + '\n'
+
+
+class Profile(object):
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.queries = QueryRecorder()
+
+    def stats(self, limit=50):
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=stream)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return stream.getvalue()
+
+    def artifact(self):
+        """
+        :return: ContentFile with the zipped profile
+        """
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            # Same format as pstats.Stats.dump_stats, which needs a file name
+            stats = pstats.Stats(self.profiler)
+            archive.writestr('profile.prof', marshal.dumps(stats.stats))
+            archive.writestr('profile.txt', self.stats())
+            archive.writestr('queries.txt', self.queries.summary())
+        return ContentFile(buffer.getvalue())
+
+
+@contextmanager
+def profiled(report):
+    """
+    Yields a ``Profile`` collecting data for the block if profiling is
+    enabled for the report, None otherwise.
+    """
+
+    if not should_profile(report):
+        yield None
+        return
+
+    profile = Profile()
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(
+                connections[alias].execute_wrapper(profile.queries))
+        profile.profiler.enable()
+        try:
+            yield profile
+        finally:
+            profile.profiler.disable()
@@ -0,0 +1,89 @@
+"""
+Reconciliation of lost and stuck report generations.
+
+``Report.generation_state`` follows a report from queued to running to done
+or failed. A report queued for too long lost its task, one running for too
+long lost its worker. ``reconcile`` requeues them in batches, run it
+periodically with the ``reports.tasks.reconcile_reports`` task::
+
+    CELERY_BEAT_SCHEDULE = {
+        'reconcile-reports': {
+            'task': 'reports.tasks.reconcile_reports',
+            'schedule': 5 * 60,
+        },
+    }
+
+Every report is claimed with a conditional update before it is requeued, so
+concurrent reconcilers do not queue it twice. Reports that reached
+``REPORT_RECONCILE_MAX_ATTEMPTS`` are marked as failed instead.
+"""
+import logging
+
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from . import metrics
+from .conf import (RECONCILE_BATCH_SIZE, RECONCILE_MAX_ATTEMPTS,
+                   RECONCILE_MAX_BATCHES)
+from .models import Report
+
+logger = logging.getLogger(__name__)
+
+
+def record_backlog(now=None):
+    """
+    Records the number of queued reports and the age of the oldest one
+    :return: (count, age in seconds)
+    """
+
+    now = now or timezone.now()
+    backlog = Report.objects.filter(
+        generation_state=Report.STATE_QUEUED).aggregate(
+        count=Count('pk'), oldest=Min('queued_at'))
+    age = (now - backlog['oldest']).total_seconds() \
+        if backlog['oldest'] else 0.0
+    metrics.gauge('reports.reconcile.backlog', backlog['count'])
+    metrics.gauge('reports.reconcile.backlog_age', age)
+    return backlog['count'], age
+
+
+def _claim(report, state):
+    """
+    :return: True if the report was still stuck in the same way
+    """
+
+    return Report.objects.filter(
+        pk=report.pk, generation_state=report.generation_state,
+        queued_at=report.queued_at, started_at=report.started_at,
+    ).update(generation_state=state) == 1
+
+
+def reconcile(now=None, batch_size=RECONCILE_BATCH_SIZE,
+              max_batches=RECONCILE_MAX_BATCHES):
+    """
+    Requeues up to ``batch_size * max_batches`` stuck reports, oldest first
+    :return: (requeued, abandoned) number of reports
+    """
+
+    now = now or timezone.now()
+    record_backlog(now)
+
+    requeued = abandoned = 0
+    for __ in range(max_batches):
+        batch = list(Report.objects.stuck(now).select_related(
+            'organization').order_by('queued_at')[:batch_size])
+        for report in batch:
+            if report.attempts >= RECONCILE_MAX_ATTEMPTS:
+                if _claim(report, Report.STATE_FAILED):
+                    logger.warning('Report %s failed after %d attempts',
+                                   report.pk, report.attempts)
+                    abandoned += 1
+            elif _claim(report, Report.STATE_QUEUED):
+                report.schedule_document_generation(force=True, countdown=0)
+                requeued += 1
+        if len(batch) < batch_size:
+            break
+
+    metrics.incr('reports.reconcile.requeued', requeued)
+    metrics.incr('reports.reconcile.abandoned', abandoned)
+    return requeued, abandoned
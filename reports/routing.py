@@ -0,0 +1,166 @@
+"""
+Read-replica routing of report data queries.
+
+The aggregate queries of ``BaseReport.generate`` can run on a replica instead
+of competing with the transactional traffic on the primary::
+
+    DATABASE_ROUTERS = ['reports.routing.ReportRouter']
+    REPORT_REPLICA_DATABASE = 'replica'
+
+``Report.generate_document`` routes the reads of ``generate`` to the replica
+with ``replica_for``. The models of this app such as ``Report`` itself are
+always read from the primary. Writes inside the block and writes of objects
+that were loaded from the replica go to the primary. Other queries are left
+to the next router in ``DATABASE_ROUTERS``, or the default database.
+
+A replica is only used if it replayed everything up to the end of the report
+window. The lag may not exceed the time since ``end_datetime`` nor
+``REPORT_REPLICA_MAX_LAG``. Otherwise the report reads from the primary.
+Reports that need fresh data set ``BaseReport.read_replica = False``.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from time import time
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from . import metrics
+from .conf import REPLICA_DATABASE, REPLICA_LAG_CACHE_TIMEOUT, REPLICA_MAX_LAG
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+_lock = threading.Lock()
+# alias -> (timestamp, lag in seconds)
+_lags = {}
+
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+def current():
+    """
+    :return: replica alias reads are routed to in this thread, or None
+    """
+
+    return getattr(_state, 'alias', None)
+
+
+@contextmanager
+def use_replica(alias):
+    """
+    Routes the reads of the block to the database alias, None keeps them on
+    the primary
+    """
+
+    previous = current()
+    _state.alias = alias
+    try:
+        yield alias
+    finally:
+        _state.alias = previous
+
+
+def replica_lag(alias):
+    """
+    :return: seconds the replica is behind the primary, cached for
+        ``REPORT_REPLICA_LAG_CACHE_TIMEOUT``, None if it is unreachable
+    """
+
+    cached = _lags.get(alias)
+    if cached is not None and time() - cached[0] < REPLICA_LAG_CACHE_TIMEOUT:
+        return cached[1]
+
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(LAG_SQL)
+            lag = float(cursor.fetchone()[0] or 0)
+    except Exception:
+        logger.warning('Replica %s is unreachable', alias, exc_info=True)
+        lag = None
+    else:
+        metrics.gauge('reports.replica.lag', lag, alias=alias)
+    with _lock:
+        _lags[alias] = (time(), lag)
+    return lag
+
+
+def choose_replica(report, alias=None):
+    """
+    :return: replica alias the data of the report can be read from, None if
+        the replica is disabled or too far behind for the report window
+    """
+
+    from .models import REPORTS
+
+    alias = alias or REPLICA_DATABASE
+    if not alias or not REPORTS[report.report].read_replica:
+        return None
+
+    allowed = (timezone.now() - report.end_datetime).total_seconds()
+    if REPLICA_MAX_LAG is not None:
+        allowed = min(allowed, REPLICA_MAX_LAG)
+    lag = replica_lag(alias)
+    if lag is None or lag > allowed:
+        metrics.incr('reports.replica.fallback', report=report.report)
+        logger.info('Reading report %s from the primary, replica lag %s over '
+                    '%.0fs', report.pk, lag, allowed)
+        return None
+    metrics.incr('reports.replica.used', report=report.report)
+    return alias
+
+
+def replica_for(report):
+    """
+    Routes the reads of the block to the replica if it is fresh enough for
+    the report
+    """
+
+    return use_replica(choose_replica(report))
+
+
+def clear():
+    with _lock:
+        _lags.clear()
+
+
+class ReportRouter(object):
+    """
+    Sends reads to the replica chosen by ``use_replica``. Models of this app,
+    writes and queries of rows that were read from the replica go to the
+    primary. Everything else is left to the routers listed after it.
+    """
+
+    def _from_replica(self, hints):
+        instance = hints.get('instance')
+        return instance is not None and instance._state.db in (
+            current(), REPLICA_DATABASE)
+
+    def db_for_read(self, model, **hints):
+        alias = current()
+        if model._meta.app_label == 'reports' or (
+                alias is None and self._from_replica(hints)):
+            # Without an answer Django would read related objects from the
+            # database of the instance they are accessed from
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == 'reports' or current() is not None or \
+                self._from_replica(hints):
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        aliases = {DEFAULT_DB_ALIAS, current() or REPLICA_DATABASE}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
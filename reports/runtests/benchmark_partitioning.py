@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Compares recent-window queries on the reports table before and after
+converting it to a partitioned table.
+
+    python reports/runtests/benchmark_partitioning.py --rows 500000
+"""
+
+import argparse
+import os
+import sys
+from timeit import default_timer
+
+# fix sys path so we don't need to setup PYTHONPATH
+sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
+os.environ['DJANGO_SETTINGS_MODULE'] = 'reports.runtests.settings'
+
+
+import django
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+
+
+def populate(rows, months):
+    from reports.runtests.example.models import Organization
+
+    org = Organization.objects.create(name=u'Benchmark')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO reports_report (name, report, typ, organization_id, "
+            "created_at, config, start_datetime, end_datetime, document) "
+            "SELECT 'Benchmark', 'example', 'pdf', %s, "
+            "now() - random() * (%s * interval '1 month'), '{}', now(), "
+            "now(), 'reports/benchmark.pdf' FROM generate_series(1, %s)",
+            [org.pk, months, rows])
+        cursor.execute('ANALYZE reports_report')
+
+
+def run_queries(repeat):
+    from datetime import timedelta
+    from django.utils import timezone
+    from reports.models import Report
+
+    since = timezone.now() - timedelta(days=7)
+    queries = {
+        'count last 7 days': lambda: Report.objects.filter(
+            created_at__gte=since).count(),
+        'latest 100 of last 7 days': lambda: list(Report.objects.filter(
+            created_at__gte=since).order_by('-created_at')[:100]),
+    }
+
+    results = {}
+    for name, query in sorted(queries.items()):
+        query()
+        start = default_timer()
+        for __ in range(repeat):
+            query()
+        results[name] = (default_timer() - start) / repeat * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    django.setup()
+    from reports import partitioning
+
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        populate(args.rows, args.months)
+        before = run_queries(args.repeat)
+
+        partitioning.convert()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE reports_report')
+        after = run_queries(args.repeat)
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+    print('{0} rows over {1} months, average of {2} runs'.format(
+        args.rows, args.months, args.repeat))
+    print('{0:<30}{1:>12}{2:>18}'.format('query', 'plain (ms)',
+                                         'partitioned (ms)'))
+    for name in sorted(before):
+        print('{0:<30}{1:>12.2f}{2:>18.2f}'.format(name, before[name],
+                                                   after[name]))
+
+
+if __name__ == '__main__':
+    main()
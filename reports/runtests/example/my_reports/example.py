@@ -9,6 +9,7 @@ class ExampleReport(BaseReport):
 
     id = u'example'
     name = u'Example report'
+    preview_template = 'example/report.html'
 
     def generate(self, **kwargs):
         return ContentFile(u'Some data')
@@ -39,6 +39,10 @@ else:
         }
     }
 
+# Replica for the report data queries, the same database in tests
+DATABASES['replica'] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+DATABASE_ROUTERS = ['reports.routing.ReportRouter']
+
 TIME_ZONE = 'Europe/London'
 LANGUAGE_CODE = 'en-GB'
 
@@ -60,6 +64,13 @@ TEMPLATE_LOADERS = (
     'django.template.loaders.app_directories.Loader',
 )
 
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'APP_DIRS': True,
+    },
+]
+
 MIDDLEWARE_CLASSES = (
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
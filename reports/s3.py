@@ -0,0 +1,205 @@
+"""
+Storage for S3 compatible object stores with parallel multipart uploads.
+
+Documents larger than ``REPORT_UPLOAD_PART_SIZE`` are uploaded in parts,
+``REPORT_UPLOAD_CONCURRENCY`` at a time. Parts are sent as soon as they are
+full, so with ``CompressedS3Storage`` the upload runs while the rest of the
+document is still being compressed::
+
+    REPORT_STORAGE = 'reports.s3.CompressedS3Storage'
+    REPORT_S3_BUCKET = 'reports'
+    REPORT_S3_ENDPOINT_URL = 'https://minio.example.com'
+
+Requires boto3, install with ``pip install django-libreports[s3]``.
+"""
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import File
+from django.core.files.storage import Storage
+from django.utils.deconstruct import deconstructible
+
+from . import metrics
+from .conf import (S3_ACCESS_KEY_ID, S3_BUCKET, S3_ENDPOINT_URL, S3_LOCATION,
+                   S3_REGION, S3_SECRET_ACCESS_KEY, S3_URL_EXPIRY,
+                   UPLOAD_CONCURRENCY, UPLOAD_PART_SIZE)
+from .storage import CompressedStorageMixin
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+# S3 rejects smaller parts, except for the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class MultipartUpload(object):
+    """
+    File-like writer uploading full parts in a thread pool. At most
+    ``concurrency`` parts are buffered or in flight at any time. Documents
+    smaller than a part are sent with a single request on ``close``.
+    """
+
+    def __init__(self, client, bucket, key, part_size=UPLOAD_PART_SIZE,
+                 concurrency=UPLOAD_CONCURRENCY):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.size = 0
+        self.upload_id = None
+        self._buffer = bytearray()
+        self._futures = []
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, data):
+        self._buffer.extend(data)
+        self.size += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._send(self.part_size)
+
+    def _send(self, size):
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key)['UploadId']
+        body = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self._slots.acquire()
+        self._futures.append(self._executor.submit(
+            self._upload_part, len(self._futures) + 1, body))
+
+    def _upload_part(self, number, body):
+        try:
+            with metrics.timer('reports.upload.part'):
+                response = self.client.upload_part(
+                    Bucket=self.bucket, Key=self.key, PartNumber=number,
+                    UploadId=self.upload_id, Body=body)
+            return {'PartNumber': number, 'ETag': response['ETag']}
+        finally:
+            self._slots.release()
+
+    def close(self):
+        try:
+            if self.upload_id is None:
+                self.client.put_object(Bucket=self.bucket, Key=self.key,
+                                       Body=bytes(self._buffer))
+                return
+            if self._buffer:
+                self._send(len(self._buffer))
+            parts = [future.result() for future in self._futures]
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                MultipartUpload={'Parts': parts})
+            metrics.incr('reports.upload.parts', len(parts))
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._executor.shutdown()
+
+    def abort(self):
+        self._executor.shutdown()
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            self.upload_id = None
+
+
+@deconstructible
+class S3Storage(Storage):
+
+    # Downloads are kept in memory up to this size, then spooled to disk
+    spool_size = 1024 * 1024
+
+    def __init__(self, bucket=None, location=None, endpoint_url=None,
+                 part_size=None, concurrency=None):
+        if boto3 is None:
+            raise ImproperlyConfigured(
+                'boto3 is required for reports.s3, install it with '
+                '"pip install django-libreports[s3]"')
+        self.bucket = bucket or S3_BUCKET
+        self.location = S3_LOCATION if location is None else location
+        self.endpoint_url = endpoint_url or S3_ENDPOINT_URL
+        self.part_size = part_size or UPLOAD_PART_SIZE
+        self.concurrency = concurrency or UPLOAD_CONCURRENCY
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = boto3.client(
+                's3', endpoint_url=self.endpoint_url, region_name=S3_REGION,
+                aws_access_key_id=S3_ACCESS_KEY_ID,
+                aws_secret_access_key=S3_SECRET_ACCESS_KEY)
+        return self._client
+
+    def _key(self, name):
+        return posixpath.join(self.location, name) if self.location else name
+
+    def _head(self, name):
+        try:
+            return self.client.head_object(Bucket=self.bucket,
+                                           Key=self._key(name))
+        except ClientError as exc:
+            if exc.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return None
+            raise
+
+    def open_upload(self, name):
+        """
+        :return: ``MultipartUpload`` writing to the name
+        """
+
+        return MultipartUpload(self.client, self.bucket, self._key(name),
+                               self.part_size, self.concurrency)
+
+    def _save(self, name, content):
+        with self.open_upload(name) as upload:
+            for chunk in content.chunks():
+                upload.write(chunk)
+        return name
+
+    def _open(self, name, mode='rb'):
+        response = self.client.get_object(Bucket=self.bucket,
+                                          Key=self._key(name))
+        spool = SpooledTemporaryFile(max_size=self.spool_size)
+        for chunk in response['Body'].iter_chunks():
+            spool.write(chunk)
+        spool.seek(0)
+        return File(spool, name=name)
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def exists(self, name):
+        return self._head(name) is not None
+
+    def size(self, name):
+        return self._head(name)['ContentLength']
+
+    def get_modified_time(self, name):
+        return self._head(name)['LastModified']
+
+    def url(self, name):
+        return self.client.generate_presigned_url(
+            'get_object', ExpiresIn=S3_URL_EXPIRY,
+            Params={'Bucket': self.bucket, 'Key': self._key(name)})
+
+
+class CompressedS3Storage(CompressedStorageMixin, S3Storage):
+    pass
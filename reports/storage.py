@@ -0,0 +1,101 @@
+import bz2
+import gzip
+import lzma
+import zlib
+from collections import namedtuple
+from tempfile import SpooledTemporaryFile
+
+from django.core.files.base import File
+from django.core.files.storage import (FileSystemStorage, default_storage,
+                                       get_storage_class)
+from django.utils.functional import LazyObject
+
+from .conf import COMPRESSION_CODEC, COMPRESSION_LEVEL, REPORT_STORAGE
+
+Codec = namedtuple('Codec', ['magic', 'compressor', 'decompressor'])
+
+CODECS = {
+    'gzip': Codec(
+        magic=b'\x1f\x8b',
+        compressor=lambda level: zlib.compressobj(level, zlib.DEFLATED, 31),
+        decompressor=lambda fileobj: gzip.GzipFile(fileobj=fileobj, mode='rb'),
+    ),
+    'bz2': Codec(
+        magic=b'BZh',
+        compressor=lambda level: bz2.BZ2Compressor(level),
+        decompressor=lambda fileobj: bz2.BZ2File(fileobj, mode='rb'),
+    ),
+    'lzma': Codec(
+        magic=b'\xfd7zXZ\x00',
+        compressor=lambda level: lzma.LZMACompressor(preset=level),
+        decompressor=lambda fileobj: lzma.LZMAFile(fileobj, mode='rb'),
+    ),
+}
+
+
+class CompressedStorageMixin(object):
+    """
+    Storage mixin that compresses files on write and decompresses them
+    transparently on read. Files that were stored before compression was
+    enabled are detected by their header and returned as they are.
+    """
+
+    # Compressed output is kept in memory up to this size, then spooled to disk
+    spool_size = 1024 * 1024
+
+    def __init__(self, codec=None, level=None, *args, **kwargs):
+        self.codec = codec or COMPRESSION_CODEC
+        self.level = COMPRESSION_LEVEL if level is None else level
+        if self.codec not in CODECS:
+            raise ValueError('Unknown compression codec "{0}"'.format(
+                self.codec))
+        super(CompressedStorageMixin, self).__init__(*args, **kwargs)
+
+    def _save(self, name, content):
+        compressor = CODECS[self.codec].compressor(self.level)
+        if hasattr(self, 'open_upload'):
+            # Parts are uploaded while the rest is still being compressed
+            with self.open_upload(name) as upload:
+                for chunk in content.chunks():
+                    upload.write(compressor.compress(chunk))
+                upload.write(compressor.flush())
+            return name
+        with SpooledTemporaryFile(max_size=self.spool_size) as spool:
+            for chunk in content.chunks():
+                spool.write(compressor.compress(chunk))
+            spool.write(compressor.flush())
+            spool.seek(0)
+            return super(CompressedStorageMixin, self)._save(
+                name, File(spool, name=name))
+
+    def _open(self, name, mode='rb'):
+        fileobj = super(CompressedStorageMixin, self)._open(name, mode)
+        header = fileobj.read(6)
+        fileobj.seek(0)
+        for codec in CODECS.values():
+            if header.startswith(codec.magic):
+                return File(codec.decompressor(fileobj), name=name)
+        return fileobj
+
+
+class CompressedFileSystemStorage(CompressedStorageMixin, FileSystemStorage):
+    pass
+
+
+class ReportStorage(LazyObject):
+    """
+    Resolves ``REPORT_STORAGE`` on first use. It always deconstructs to the
+    same path so that changing the setting does not require a migration.
+    """
+
+    def _setup(self):
+        if REPORT_STORAGE:
+            self._wrapped = get_storage_class(REPORT_STORAGE)()
+        else:
+            self._wrapped = default_storage
+
+    def deconstruct(self):
+        return 'reports.storage.ReportStorage', (), {}
+
+
+report_storage = ReportStorage()
@@ -2,6 +2,10 @@ import logging
 import sys
 
 from celery import shared_task
+from django.utils import timezone
+
+from . import costs, delivery, fairshare, hooks, reconcile, warmup  # NOQA
+from .conf import DISPATCH_ORDER, EMAIL_DELIVERY, GENERATION_MAX_ATTEMPTS
 from .models import Report, ReportSchedule
 
 
@@ -9,24 +13,88 @@ logger = logging.getLogger(__name__)
 
 
 @shared_task(ignore_result=True, bind=True, default_retry_delay=1 * 60)
-def generate_document(self, report_id):
+def generate_document(self, report_id, queued_at=None, deferred=False):
     """
-    Generates the report document. Retry after 1 minute
+    Generates the report document. Retry after 1 minute. Waits for a
+    fair-share slot of the organization and report first. Failed generations
+    are retried until ``Report.attempts`` reaches
+    ``REPORT_GENERATION_MAX_ATTEMPTS``, waiting for a slot does not count.
     """
 
     try:
         report = Report.objects.get(pk=report_id)
     except Report.DoesNotExist as exc:
         raise self.retry(exc=exc, max_retries=3)
+    if report.generation_state in (Report.STATE_RUNNING, Report.STATE_DONE):
+        # Requeued by the reconciler while the original task was only late
+        logger.info('Report %s is already %s', report.pk,
+                    report.generation_state)
+        return
+
+    if not fairshare.acquire(report):
+        Report.objects.filter(pk=report.pk).update(queued_at=timezone.now())
+        kwargs = dict(self.request.kwargs, deferred=True)
+        raise self.retry(kwargs=kwargs,
+                         countdown=fairshare.defer(report, deferred),
+                         max_retries=None)
+    fairshare.started(report, queued_at, deferred)
     try:
         report.generate_document()
     except Exception as exc:
         msg = "Error generating report"
         logger.error(msg, exc_info=sys.exc_info())
-        raise self.retry(exc=exc)
+        if report.attempts >= GENERATION_MAX_ATTEMPTS:
+            raise
+        # Celery's retry count also includes the deferrals
+        raise self.retry(exc=exc, max_retries=None)
+    finally:
+        fairshare.release(report)
+
+    if EMAIL_DELIVERY and report.emails:
+        delivery.schedule_delivery()
 
 
 @shared_task(ignore_result=True)
 def schedule_task(report_schedule_id):
     report_schedule = ReportSchedule.objects.get(pk=report_schedule_id)
     report_schedule.schedule_report()
+
+
+@shared_task(ignore_result=True)
+def deliver_reports():
+    """
+    Emails generated reports that were not delivered yet
+    """
+
+    delivery.deliver()
+
+
+@shared_task(ignore_result=True)
+def reconcile_reports():
+    """
+    Requeues reports whose generation or dispatch was lost or got stuck and
+    events of post-generation handlers whose worker died
+    """
+
+    reconcile.reconcile()
+    if DISPATCH_ORDER == 'cost':
+        costs.recover()
+    hooks.recover()
+
+
+@shared_task(ignore_result=True)
+def run_hook(name):
+    """
+    Runs a post-generation handler on its pending events
+    """
+
+    hooks.run(name)
+
+
+@shared_task(ignore_result=True)
+def dispatch_reports():
+    """
+    Queues the pending scheduled reports longest first
+    """
+
+    costs.dispatch()
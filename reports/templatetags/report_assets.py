@@ -0,0 +1,39 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from reports.html import asset_data_uri, asset_text
+
+register = template.Library()
+
+
+@register.simple_tag
+def report_asset(path):
+    """
+    Inlines an image or font as a data uri::
+
+        <img src="{% report_asset 'img/logo.png' %}">
+    """
+
+    return asset_data_uri(path)
+
+
+@register.simple_tag
+def report_css(path):
+    """
+    Inlines a stylesheet::
+
+        <style>{% report_css 'css/report.css' %}</style>
+    """
+
+    return mark_safe(asset_text(path))
+
+
+@register.simple_tag
+def report_chart(chart, alt=''):
+    """
+    Inlines a ``reports.charts.Chart`` as an image::
+
+        {% report_chart chart 'Alerts per host' %}
+    """
+
+    return mark_safe(chart.html(alt))
@@ -1,2 +1,25 @@
 from .models_report import ReportModelTestCase  # NOQA
 from .models_schedule_report import ScheduleReportModelTestCase  # NOQA
+from .storage import CompressedStorageTestCase  # NOQA
+from .delivery import DeliveryTestCase  # NOQA
+from .chrome import ChromePoolTestCase  # NOQA
+from .views import ReportDownloadViewTestCase  # NOQA
+from .partitioning import PartitioningTestCase  # NOQA
+from .memo import LRUCacheTestCase, MemoTestCase  # NOQA
+from .warmup import WarmUpTestCase  # NOQA
+from .planner import PlannerTestCase  # NOQA
+from .memory import MemoryTestCase  # NOQA
+from .profiling import ProfilingTestCase  # NOQA
+from .html import HTMLTestCase  # NOQA
+from .data import DataTestCase  # NOQA
+from .charts import ChartTestCase  # NOQA
+from .backfill import BackfillTestCase, ConcurrentBackfillTestCase  # NOQA
+from .isolation import IsolationTestCase  # NOQA
+from .fairshare import FairShareTestCase  # NOQA
+from .reconcile import ReconcileTestCase  # NOQA
+from .hooks import HooksTestCase  # NOQA
+from .s3 import S3StorageTestCase  # NOQA
+from .pdf import PDFTestCase  # NOQA
+from .costs import CostsTestCase  # NOQA
+from .preview import PreviewTestCase  # NOQA
+from .routing import RoutingTestCase  # NOQA
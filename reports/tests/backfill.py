@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from unittest.mock import patch
+
+from reports import backfill, costs, memo, metrics
+from reports.models import Report, ReportSchedule
+from reports.runtests.example.models import Organization
+from reports.runtests.example.my_reports.example import ExampleReport
+
+NOW = datetime(2012, 12, 12, 12, 12, 12)
+
+
+class BackfillTestCase(TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.org = Organization.objects.create(name='Org')
+        self.schedule = ReportSchedule.objects.create(
+            organization=self.org, report='example', typ='pdf',
+            period=ReportSchedule.PERIOD_MONTHLY)
+
+    def test_windows(self):
+        windows = self.schedule.backfill_windows(12, now=NOW)
+        self.assertEqual(len(windows), 12)
+        self.assertEqual(windows[0], (datetime(2011, 12, 1),
+                                      datetime(2011, 12, 31, 23, 59, 59)))
+        self.assertEqual(windows[-1], self.schedule.datetimes_by_period(NOW))
+
+        self.schedule.period = ReportSchedule.PERIOD_QUARTERLY
+        windows = self.schedule.backfill_windows(8, now=NOW)
+        self.assertEqual(windows[0], (datetime(2010, 10, 1),
+                                      datetime(2010, 12, 31, 23, 59, 59)))
+        self.assertEqual(windows[-1], (datetime(2012, 7, 1),
+                                       datetime(2012, 9, 30, 23, 59, 59)))
+
+        self.schedule.period = ReportSchedule.PERIOD_DAILY
+        self.schedule.report_datetime = datetime(2010, 10, 10, 23, 59, 59)
+        windows = self.schedule.backfill_windows(3, now=NOW)
+        self.assertEqual(windows, [
+            (datetime(2012, 12, 10), datetime(2012, 12, 10, 23, 59, 59)),
+            (datetime(2012, 12, 11), datetime(2012, 12, 11, 23, 59, 59)),
+            (datetime(2012, 12, 12), datetime(2012, 12, 12, 23, 59, 59)),
+        ])
+
+    def test_backfill(self):
+        done = []
+        result = self.schedule.backfill(
+            3, now=NOW, concurrency=1,
+            progress=lambda *args: done.append(args[:2]))
+
+        self.assertEqual(len(result.created), 3)
+        self.assertEqual((result.skipped, result.failed), (0, []))
+        self.assertEqual(done, [(1, 3), (2, 3), (3, 3)])
+        reports = Report.objects.order_by('start_datetime')
+        self.assertEqual(reports.count(), 3)
+        self.assertTrue(all(report.generated for report in reports))
+        self.assertEqual(reports[0].name, 'Org Example Report')
+        self.assertEqual(metrics.get('reports.backfill.created',
+                                     report='example'), 3)
+
+        result = self.schedule.backfill(4, now=NOW, concurrency=1)
+        self.assertEqual((len(result.created), result.skipped), (1, 3))
+        self.assertEqual(Report.objects.count(), 4)
+
+    def test_not_dispatched(self):
+        created, __ = backfill.create_reports(
+            self.schedule, self.schedule.backfill_windows(3, now=NOW))
+
+        # Waiting for the threads of the backfill, not for a worker
+        later = datetime.now() + timedelta(days=1)
+        self.assertEqual(
+            {r.generation_state for r in created}, {Report.STATE_QUEUED})
+        self.assertFalse(costs.pending().exists())
+        self.assertFalse(Report.objects.stuck(later).exists())
+
+    def test_prefetch(self):
+        prefetched = []
+
+        def prefetch(report, windows=None, organization=None, **kwargs):
+            for start, end in windows:
+                memo.prime('backfill', organization, start, end, 'primed')
+            prefetched.extend(windows)
+
+        def generate(report, organization=None, start_datetime=None,
+                     end_datetime=None, **kwargs):
+            key = memo.make_key('backfill', organization, start_datetime,
+                                end_datetime, {})
+            return ContentFile(memo.get_or_compute(
+                'backfill', key, lambda: 'missing'))
+
+        with patch.object(ExampleReport, 'prefetch', prefetch), \
+                patch.object(ExampleReport, 'generate', generate):
+            result = self.schedule.backfill(2, now=NOW, concurrency=1)
+
+        self.assertEqual(len(prefetched), 2)
+        self.assertEqual(result.failed, [])
+        self.assertEqual(result.created[0].document.read(), b'primed')
+
+    def test_failed(self):
+        with patch.object(ExampleReport, 'generate', side_effect=ValueError):
+            result = self.schedule.backfill(2, now=NOW, concurrency=1)
+        self.assertEqual(len(result.failed), 2)
+
+    @patch('reports.tasks.generate_document.apply_async')
+    def test_dispatch(self, mApply):
+        result = self.schedule.backfill(2, now=NOW, dispatch=True)
+        self.assertEqual(len(result.created), 2)
+        self.assertEqual(mApply.call_count, 2)
+        self.assertFalse(Report.objects.exclude(document='').exists())
+
+    def test_command(self):
+        out = StringIO()
+        call_command('report_backfill', str(self.schedule.pk), '2',
+                     '--until', '2012-12-12', '--concurrency', '1',
+                     stdout=out)
+        self.assertIn('[2/2] Org Example Report', out.getvalue())
+        self.assertIn('Created 2 reports, skipped 0 existing, 0 failed.',
+                      out.getvalue())
+
+
+class ConcurrentBackfillTestCase(TransactionTestCase):
+
+    def test_concurrency(self):
+        org = Organization.objects.create(name='Org')
+        schedule = ReportSchedule.objects.create(
+            organization=org, report='example', typ='pdf',
+            period=ReportSchedule.PERIOD_DAILY)
+
+        result = schedule.backfill(6, now=NOW, concurrency=3)
+
+        self.assertEqual(result.failed, [])
+        self.assertEqual(Report.objects.exclude(document='').count(), 6)
@@ -0,0 +1,92 @@
+import os
+import threading
+import unittest
+
+from django.template import Context, Template
+from django.test import SimpleTestCase
+
+from reports import charts, metrics
+
+try:
+    import matplotlib
+except ImportError:
+    matplotlib = None
+
+calls = []
+release = threading.Event()
+
+
+@charts.renderer('fake')
+def render_fake(chart):
+    release.wait(5)
+    calls.append(chart.key)
+    return repr(sorted(chart.series.items())).encode('utf-8')
+
+
+class ChartTestCase(SimpleTestCase):
+
+    def setUp(self):
+        charts.local_cache.clear()
+        metrics.reset()
+        del calls[:]
+        release.set()
+
+    def test_key(self):
+        chart = charts.Chart('fake', {'a': [1, 2]}, title='A')
+        self.assertEqual(chart.key,
+                         charts.Chart('fake', {'a': (1, 2)}, title='A').key)
+        self.assertNotEqual(chart.key,
+                            charts.Chart('fake', {'a': [1, 3]}, title='A').key)
+        self.assertNotEqual(chart.key,
+                            charts.Chart('fake', {'a': [1, 2]}, title='B').key)
+
+    def test_cache(self):
+        first = charts.Chart('fake', {'a': [1, 2]}).render()
+        second = charts.Chart('fake', {'a': [1, 2]}).render()
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(metrics.get('reports.charts.miss', kind='fake'), 1)
+        self.assertEqual(metrics.get('reports.charts.hit', kind='fake'), 1)
+
+    def test_render_async_dedupe(self):
+        release.clear()
+        futures = [charts.Chart('fake', {'a': [1]}).render_async()
+                   for __ in range(3)]
+        release.set()
+
+        self.assertEqual(len(set(f.result() for f in futures)), 1)
+        self.assertEqual(len(calls), 1)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            charts.Chart('fake', {}, fmt='gif')
+        with self.assertRaises(ValueError):
+            charts.Chart('unknown', {'a': [1]}).render()
+
+    def test_outputs(self):
+        chart = charts.Chart('fake', {'a': [1]}, fmt='svg')
+
+        self.assertTrue(chart.data_uri().startswith(
+            'data:image/svg+xml;base64,'))
+        self.assertIn('alt="a &lt; b"', chart.html('a < b'))
+        path = chart.path()
+        self.assertTrue(path.endswith('.svg'))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), chart.render())
+        self.assertEqual(chart.path(), path)
+        self.assertEqual(chart.markdown('A'), '![A]({0})'.format(path))
+
+        template = Template('{% load report_assets %}{% report_chart chart %}')
+        self.assertIn('<img src="data:image/svg+xml;base64,',
+                      template.render(Context({'chart': chart})))
+
+    @unittest.skipIf(matplotlib is None, 'matplotlib is not installed')
+    def test_matplotlib(self):
+        for kind in ('line', 'bar', 'pie'):
+            chart = charts.Chart(kind, {'a': [1, 2, 3], 'b': [3, 2, 1]},
+                                 labels=['x', 'y', 'z'], title=kind)
+            self.assertTrue(chart.render().startswith(b'\x89PNG'))
+        svg = charts.Chart('line', {'a': [1, 2]}, fmt='svg').render()
+        self.assertIn(b'<svg', svg)
+        self.assertTrue(os.path.isdir(charts._get_directory()))
@@ -0,0 +1,159 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from unittest.mock import patch
+
+from reports.chrome import ChromePool, ChromeUnavailable, ROUND_ROBIN
+
+
+class DevToolsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.checks += 1
+        if not self.server.healthy:
+            self.send_error(503)
+            return
+        body = json.dumps({'Browser': 'HeadlessChrome/Fake'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ChromePoolTestCase(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.servers = []
+        for __ in range(3):
+            server = HTTPServer(('127.0.0.1', 0), DevToolsHandler)
+            server.healthy = True
+            server.checks = 0
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+            self.servers.append(server)
+        self.urls = ['http://localhost:{0}'.format(s.server_address[1])
+                     for s in self.servers]
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def test_least_loaded(self):
+        pool = ChromePool(self.urls, max_tabs=2)
+
+        endpoints = [pool.acquire() for __ in range(4)]
+        self.assertEqual(sorted(e.active for e in pool.endpoints), [1, 1, 2])
+
+        single = [e for e in endpoints if e.active == 1][0]
+        pool.release(single)
+        self.assertEqual(pool.acquire(), single)
+
+    def test_processes(self):
+        # Pools of two worker processes sharing the cache
+        first = ChromePool(self.urls[:2], max_tabs=1)
+        second = ChromePool(self.urls[:2], max_tabs=1)
+
+        endpoints = [first.acquire(), second.acquire()]
+        self.assertEqual(sorted(e.url for e in endpoints),
+                         sorted(self.urls[:2]))
+        with self.assertRaises(ChromeUnavailable):
+            second.acquire(timeout=0.1)
+
+        # A slot released by the other process is picked up
+        threading.Timer(0.1, first.release, args=(endpoints[0],)).start()
+        self.assertEqual(second.acquire(timeout=5).url, endpoints[0].url)
+
+    def test_process_local(self):
+        first = ChromePool(self.urls[:1], max_tabs=1, cache=None)
+        second = ChromePool(self.urls[:1], max_tabs=1, cache=None)
+
+        first.acquire()
+        self.assertEqual(second.acquire().active, 1)
+
+    def test_round_robin(self):
+        pool = ChromePool(self.urls, strategy=ROUND_ROBIN)
+
+        for i in range(6):
+            endpoint = pool.acquire()
+            pool.release(endpoint)
+            self.assertEqual(endpoint.url, self.urls[i % 3])
+
+    def test_concurrency_limit(self):
+        pool = ChromePool(self.urls[:1], max_tabs=1)
+
+        endpoint = pool.acquire()
+        with self.assertRaises(ChromeUnavailable):
+            pool.acquire(timeout=0.1)
+
+        threading.Timer(0.1, pool.release, args=(endpoint,)).start()
+        self.assertEqual(pool.acquire(timeout=5), endpoint)
+
+    def test_health_check(self):
+        pool = ChromePool(self.urls, health_interval=0)
+        self.addCleanup(pool.close)
+        self.servers[0].healthy = False
+
+        pool.check_health()
+        self.assertEqual([e.healthy for e in pool.endpoints],
+                         [False, True, True])
+        for __ in range(4):
+            self.assertNotEqual(pool.acquire().url, self.urls[0])
+
+        self.servers[0].healthy = True
+        pool.check_health()
+        self.assertTrue(pool.endpoints[0].healthy)
+
+    def test_health_monitor(self):
+        pool = ChromePool(self.urls[:2], health_interval=0.1)
+        self.addCleanup(pool.close)
+
+        # Renders do not wait for health checks
+        pool.release(pool.acquire())
+        self.assertEqual(sum(server.checks for server in self.servers), 0)
+
+        pool.release(pool.acquire(), failed=True)
+        down = [e for e in pool.endpoints if not e.healthy]
+        self.assertEqual(len(down), 1)
+        for __ in range(50):
+            if down[0].healthy:
+                break
+            time.sleep(0.1)
+        self.assertTrue(down[0].healthy)
+        # Only the endpoint out of rotation was checked
+        self.assertEqual(
+            [server.checks > 0 for server in self.servers[:2]],
+            [e is down[0] for e in pool.endpoints])
+
+    def test_slot_timeout(self):
+        pool = ChromePool(self.urls[:1])
+        key = pool._key(pool.endpoints[0])
+        with patch('reports.chrome.CHROME_SLOT_TIMEOUT', 1):
+            pool.acquire()
+        # A later render extends the expiry of the counter
+        with patch('reports.chrome.CHROME_SLOT_TIMEOUT', 60):
+            time.sleep(0.6)
+            pool.acquire()
+        time.sleep(0.6)
+        self.assertEqual(cache.get(key), 2)
+
+    def test_failed_connection(self):
+        pool = ChromePool(self.urls[:1], health_interval=60)
+
+        with self.assertRaises(OSError):
+            with pool.connection() as url:
+                self.assertTrue(url.startswith('http://127.0.0.1:'))
+                raise ConnectionRefusedError()
+
+        self.assertFalse(pool.endpoints[0].healthy)
+        with self.assertRaises(ChromeUnavailable):
+            pool.acquire()
@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from reports import costs, metrics
+from reports.models import Report, ReportSchedule
+from reports.runtests.example.models import Organization
+
+
+class CostsTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.org = Organization.objects.create(name='Org')
+        self.daily = ReportSchedule.objects.create(
+            organization=self.org, report='example', typ='pdf',
+            period=ReportSchedule.PERIOD_DAILY)
+        self.yearly = ReportSchedule.objects.create(
+            organization=self.org, report='example', typ='pdf',
+            period=ReportSchedule.PERIOD_YEARLY)
+
+    def create_report(self, schedule=None, day=1, **kwargs):
+        return Report.objects.create(
+            report='example', typ='pdf', organization=self.org,
+            schedule=schedule, start_datetime=datetime(2017, 1, day),
+            end_datetime=datetime(2017, 1, day + 1), **kwargs)
+
+    def test_cost_model(self):
+        self.create_report(self.daily, 1, generation_time=10)
+        self.create_report(self.daily, 2, generation_time=20)
+        self.create_report(self.yearly, 1, generation_time=300)
+        other = Organization.objects.create(name='Other')
+        model = costs.CostModel()
+
+        self.assertEqual(model.estimate(Report(
+            report='example', typ='pdf', organization=self.org,
+            schedule=self.yearly)), 300)
+        self.assertEqual(model.estimate(Report(
+            report='example', typ='pdf', organization=self.org,
+            schedule=self.daily)), 15)
+        # Falls back to the period, then the report and type
+        self.assertEqual(model.estimate(Report(
+            report='example', typ='pdf', organization=other,
+            schedule=self.daily)), 15)
+        self.assertEqual(model.estimate(Report(
+            report='example', typ='docx', organization=other)), 110)
+        self.assertEqual(costs.CostModel(history_days=0).estimate(Report(
+            report='example', typ='pdf', organization=other)), 0)
+
+    def test_simulate(self):
+        self.assertEqual(costs.simulate([1, 1, 1, 1, 4], 2), (6, [
+            [0, 2, 4], [1, 3]]))
+        self.assertEqual(costs.simulate([4, 1, 1, 1, 1], 2), (4, [
+            [0], [1, 2, 3, 4]]))
+
+    @patch('reports.tasks.generate_document.apply_async')
+    @patch('reports.tasks.dispatch_reports.apply_async')
+    @patch('reports.models.DISPATCH_ORDER', 'cost')
+    def test_dispatch(self, mDispatch, mApply):
+        self.create_report(self.yearly, 1, generation_time=300,
+                           generation_state=Report.STATE_DONE)
+        self.create_report(self.daily, 1, generation_time=10,
+                           generation_state=Report.STATE_DONE)
+        with patch('reports.models.transaction.on_commit',
+                   lambda func: func()):
+            daily = self.daily.schedule_report()
+            yearly = self.yearly.schedule_report()
+        # Not queued until the dispatch
+        self.assertEqual(mDispatch.call_count, 1)
+        self.assertEqual(mApply.call_count, 0)
+        self.assertEqual(daily.generation_state, Report.STATE_PENDING)
+
+        plan = costs.dispatch(workers=2)
+
+        self.assertEqual([r.pk for r in plan.reports], [yearly.pk, daily.pk])
+        self.assertEqual(plan.makespan, 300)
+        self.assertEqual(
+            [call[1]['kwargs']['report_id'] for call in mApply.call_args_list],
+            [yearly.pk, daily.pk])
+        yearly.refresh_from_db()
+        self.assertEqual(yearly.predicted_time, 300)
+        self.assertEqual(yearly.generation_state, Report.STATE_QUEUED)
+        self.assertEqual(metrics.get('reports.dispatch.makespan'), 300)
+        # Nothing left to dispatch
+        self.assertEqual(costs.dispatch().reports, [])
+
+    @patch('reports.tasks.generate_document.apply_async')
+    def test_recover(self, mApply):
+        report = self.create_report(self.daily, 1)
+        self.assertEqual(report.generation_state, Report.STATE_PENDING)
+        self.assertIsNone(costs.recover())
+
+        # The dispatch task was lost
+        Report.objects.update(
+            created_at=datetime.now() - timedelta(hours=1))
+        plan = costs.recover()
+
+        self.assertEqual([r.pk for r in plan.reports], [report.pk])
+        self.assertEqual(mApply.call_count, 1)
+        report.refresh_from_db()
+        self.assertEqual(report.generation_state, Report.STATE_QUEUED)
+        self.assertIsNone(costs.recover())
+
+    @patch('reports.costs.recover')
+    def test_reconcile_task(self, mRecover):
+        from reports.tasks import reconcile_reports
+
+        reconcile_reports()
+        self.assertFalse(mRecover.called)
+        with patch('reports.tasks.DISPATCH_ORDER', 'cost'):
+            reconcile_reports()
+        self.assertEqual(mRecover.call_count, 1)
+
+    def test_makespan(self):
+        start = datetime(2017, 1, 2, 1)
+        # Created shortest first, generated longest first
+        for day, predicted, actual, offset in ((1, 10, 10, 100),
+                                               (2, 10, 8, 100),
+                                               (3, 100, 110, 0)):
+            self.create_report(
+                self.daily, day, predicted_time=predicted,
+                generation_time=actual,
+                started_at=start + timedelta(seconds=offset))
+
+        result = costs.makespan(Report.objects.all(), workers=2)
+
+        self.assertEqual(result, costs.Makespan(3, 2, 100, 110, 110, 4))
+
+        out = StringIO()
+        call_command('report_makespan', '2017-01-02', '2017-01-03',
+                     '--workers', '2', stdout=out)
+        self.assertIn('Actual makespan: 110.0s', out.getvalue())
@@ -0,0 +1,131 @@
+import io
+from datetime import date, datetime
+from unittest import skipIf
+from unittest.mock import Mock
+
+from django.db import models
+from django.test import TestCase
+
+from reports import data
+from reports.models import Report
+from reports.runtests.example.models import Organization
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+
+@skipIf(np is None, 'NumPy is not installed')
+class DataTestCase(TestCase):
+
+    def setUp(self):
+        org = Organization.objects.create(name=u'Org')
+        rows = [
+            ('pdf', datetime(2017, 1, 1, 10), 10.0),
+            ('pdf', datetime(2017, 1, 1, 23), 20.0),
+            ('docx', datetime(2017, 1, 2, 5), None),
+            ('pdf', datetime(2017, 1, 3, 8), 60.0),
+            ('docx', datetime(2017, 2, 1, 8), 5.0),
+        ]
+        for typ, created_at, generation_time in rows:
+            Report.objects.create(
+                report=u'example', organization=org, typ=typ,
+                created_at=created_at, generation_time=generation_time,
+                start_datetime=created_at, end_datetime=created_at)
+
+    def test_load_columns(self):
+        columns = data.load_columns(
+            Report.objects.order_by('created_at'),
+            ['typ', 'created_at', 'generation_time'], chunk_size=2)
+
+        self.assertEqual(columns['typ'].tolist(),
+                         ['pdf', 'pdf', 'docx', 'pdf', 'docx'])
+        self.assertEqual(columns['created_at'].dtype,
+                         np.dtype('datetime64[s]'))
+        self.assertTrue(np.isnan(columns['generation_time'][2]))
+
+    def test_empty_chunks(self):
+        columns = data.load_columns(
+            Report.objects.order_by('created_at'),
+            ['generation_time', 'delivered_at', 'organization__name'],
+            chunk_size=1)
+
+        self.assertEqual(columns['generation_time'].dtype, np.dtype(float))
+        self.assertEqual(np.nansum(columns['generation_time']), 95.0)
+        self.assertEqual(columns['delivered_at'].dtype,
+                         np.dtype('datetime64[s]'))
+        self.assertTrue(np.isnat(columns['delivered_at']).all())
+        self.assertTrue(np.isnan(data.to_array([None, None])).all())
+
+    def test_dates(self):
+        dates = data.to_array([date(2017, 1, 1), None])
+        self.assertEqual(dates.dtype, np.dtype('datetime64[D]'))
+        self.assertTrue(np.isnat(dates[1]))
+        # Chunks without a value get the same dtype
+        model = Mock()
+        model._meta.get_field.return_value = models.DateField()
+        self.assertEqual(data.to_array(
+            [None], dtype=data.field_dtype(model, 'day')).dtype, dates.dtype)
+
+    def test_week_buckets(self):
+        # Sunday 1st to Tuesday 10th of January 2017, weeks start on Monday
+        edges, counts = data.histogram(
+            data.to_array([datetime(2017, 1, 1, 10), datetime(2017, 1, 1, 23),
+                           datetime(2017, 1, 2, 5), datetime(2017, 1, 8, 23),
+                           datetime(2017, 1, 9)]),
+            datetime(2017, 1, 1), datetime(2017, 1, 10), 'week')
+
+        self.assertEqual([edge.item() for edge in edges],
+                         [datetime(2016, 12, 26), datetime(2017, 1, 2),
+                          datetime(2017, 1, 9)])
+        self.assertEqual(counts.tolist(), [2, 2, 1])
+
+    def test_aggregation(self):
+        columns = data.load_columns(Report.objects.order_by('created_at'),
+                                    ['typ', 'created_at', 'generation_time'])
+        start, end = datetime(2017, 1, 1), datetime(2017, 1, 3, 23, 59)
+
+        edges, counts = data.histogram(columns['created_at'], start, end,
+                                       'day')
+        self.assertEqual(counts.tolist(), [2, 1, 1])
+        self.assertEqual(edges[0].item(), start)
+
+        labels, totals = data.group(columns['typ'],
+                                    columns['generation_time'], 'max')
+        self.assertEqual(labels.tolist(), ['docx', 'pdf'])
+        self.assertEqual(totals.tolist(), [5.0, 60.0])
+
+        self.assertEqual(data.percentiles(columns['generation_time'], [50]),
+                         {50: 15.0})
+
+        edges, index = data.bucket(columns['created_at'], start, end, 'day')
+        rows, cols, matrix = data.pivot(columns['typ'], index)
+        self.assertEqual(cols.tolist(), [-1, 0, 1, 2])
+        self.assertEqual(matrix.tolist(), [[1, 0, 1, 0], [0, 2, 0, 1]])
+
+    def test_table(self):
+        table = data.Table.from_columns(['Type', 'Reports'],
+                                        *data.top(['pdf', 'docx', 'pdf']))
+
+        self.assertEqual(table.rows, [['pdf', 2], ['docx', 1]])
+        self.assertEqual(table.to_markdown(),
+                         '| Type | Reports |\n|---|---|\n| pdf | 2 |\n'
+                         '| docx | 1 |\n')
+        self.assertEqual(table.to_html(),
+                         '<table><thead><tr><th>Type</th><th>Reports</th>'
+                         '</tr></thead><tbody><tr><td>pdf</td><td>2</td>'
+                         '</tr><tr><td>docx</td><td>1</td></tr></tbody>'
+                         '</table>')
+
+    @skipIf(openpyxl is None, 'openpyxl is not installed')
+    def test_xlsx(self):
+        table = data.Table(['Type', 'Reports'], [['pdf', 2]])
+        workbook = openpyxl.load_workbook(io.BytesIO(table.to_xlsx().read()))
+        rows = list(workbook.active.values)
+        self.assertEqual(rows, [('Type', 'Reports'), ('pdf', 2)])
@@ -0,0 +1,98 @@
+from datetime import datetime
+from importlib import import_module
+
+from django.apps import apps
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import TestCase
+from unittest.mock import patch
+
+from reports import delivery
+from reports.models import Report
+from reports.runtests.example.models import Organization
+
+
+class DeliveryTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.org = Organization.objects.create(name=u'Org')
+
+    def create_report(self, emails, content=b'Some data'):
+        report = Report.objects.create(
+            report=u'example', organization=self.org, typ=u'pdf',
+            start_datetime=datetime(2017, 1, 1, 12, 33),
+            end_datetime=datetime(2017, 1, 2, 12, 33), emails=emails,
+        )
+        report.document.save('report.pdf', ContentFile(content))
+        return report
+
+    def test_deliver(self):
+        report = self.create_report([u'a@example.com', u'b@example.com'])
+        self.create_report([u'c@example.com'])
+        Report.objects.create(
+            report=u'example', organization=self.org, typ=u'pdf',
+            start_datetime=datetime(2017, 1, 1, 12, 33),
+            end_datetime=datetime(2017, 1, 2, 12, 33),
+            emails=[u'd@example.com'],
+        )
+
+        self.assertEqual(delivery.deliver(batch_size=1), 2)
+        self.assertEqual(len(mail.outbox), 2)
+
+        message = mail.outbox[0]
+        self.assertEqual(message.to, report.emails)
+        filename, content, mimetype = message.attachments[0]
+        self.assertEqual(content, b'Some data')
+        self.assertEqual(mimetype, 'application/pdf')
+        self.assertFalse(Report.objects.undelivered().exists())
+
+        # Nothing left to deliver
+        self.assertEqual(delivery.deliver(), 0)
+
+    @patch('reports.delivery.EMAIL_ATTACHMENT_MAX_SIZE', 4)
+    def test_deliver_link(self):
+        report = self.create_report([u'a@example.com'])
+
+        delivery.deliver()
+
+        message = mail.outbox[0]
+        self.assertFalse(message.attachments)
+        self.assertIn(report.document.url, message.body)
+
+    @patch('reports.tasks.deliver_reports.apply_async')
+    @patch('reports.delivery.EMAIL_RECIPIENT_INTERVAL', 60)
+    def test_recipient_throttling(self, mApply):
+        self.create_report([u'a@example.com'])
+        throttled = self.create_report([u'A@example.com'])
+
+        self.assertEqual(delivery.deliver(), 1)
+        self.assertEqual(list(Report.objects.undelivered()), [throttled])
+        # Retried once the recipient may get another email
+        mApply.assert_called_once_with(countdown=60)
+
+    @patch('reports.tasks.deliver_reports.apply_async')
+    @patch('reports.delivery.EMAIL_MAX_ATTEMPTS', 2)
+    @patch('reports.delivery.build_message', side_effect=IOError)
+    def test_failed_delivery(self, mBuild, mApply):
+        report = self.create_report([u'a@example.com'])
+
+        self.assertEqual(delivery.deliver(), 0)
+        mApply.assert_called_once_with(countdown=delivery.EMAIL_RETRY_DELAY)
+        self.assertEqual(list(Report.objects.undelivered()), [report])
+
+        # Not rescheduled after the last attempt
+        self.assertEqual(delivery.deliver(), 0)
+        self.assertEqual(mApply.call_count, 1)
+
+    def test_migration_marks_existing_reports(self):
+        report = self.create_report([u'a@example.com'])
+        migration = import_module(
+            'reports.migrations.0007_report_delivered_at')
+
+        migration.mark_delivered(apps, None)
+
+        report.refresh_from_db()
+        self.assertEqual(report.delivered_at, report.created_at)
+        self.assertEqual(list(Report.objects.undelivered()), [])
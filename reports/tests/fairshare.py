@@ -0,0 +1,140 @@
+import time
+
+from django.core.cache import cache
+from django.test import TestCase
+from unittest.mock import patch
+
+from reports import fairshare, metrics
+from reports.models import Report
+from reports.runtests.example.models import Organization
+from reports.tasks import generate_document
+
+
+@patch('reports.fairshare.ORGANIZATION_CONCURRENCY', 1)
+@patch('reports.fairshare.ORGANIZATION_WEIGHTS', {})
+@patch('reports.fairshare.REPORT_CONCURRENCY', {'example': 3})
+class FairShareTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.big = Organization.objects.create(name='Big')
+        self.small = Organization.objects.create(name='Small')
+
+    def create_report(self, org):
+        return Report.objects.create(
+            report='example', typ='pdf', organization=org,
+            start_datetime='2017-01-01', end_datetime='2017-01-02')
+
+    def test_slots(self):
+        big = [self.create_report(self.big) for __ in range(2)]
+        small = [self.create_report(self.small) for __ in range(3)]
+
+        self.assertTrue(fairshare.acquire(big[0]))
+        self.assertFalse(fairshare.acquire(big[1]))
+        self.assertTrue(fairshare.acquire(small[0]))
+        # The report limit is full
+        with patch.dict(fairshare.ORGANIZATION_WEIGHTS, {self.small.pk: 2}):
+            self.assertTrue(fairshare.acquire(small[1]))
+            self.assertFalse(fairshare.acquire(small[2]))
+
+        fairshare.release(big[0])
+        self.assertTrue(fairshare.acquire(big[1]))
+
+    def test_slot_timeout(self):
+        first, second = [self.create_report(self.small) for __ in range(2)]
+        key = '{0}:report:example'.format(fairshare.KEY_PREFIX)
+        with patch('reports.fairshare.CONCURRENCY_SLOT_TIMEOUT', 1):
+            fairshare.acquire(first)
+        # The slot of the second report keeps the counter alive
+        with patch('reports.fairshare.CONCURRENCY_SLOT_TIMEOUT', 60), \
+                patch.dict(fairshare.ORGANIZATION_WEIGHTS, {self.small.pk: 2}):
+            time.sleep(0.6)
+            fairshare.acquire(second)
+        time.sleep(0.6)
+        self.assertEqual(cache.get(key), 2)
+
+    def test_defer(self):
+        report = self.create_report(self.big)
+        first = fairshare.defer(report)
+        second = fairshare.defer(report)
+
+        self.assertTrue(22 <= first <= 38)
+        self.assertTrue(45 <= second <= 75)
+        self.assertEqual(metrics.get('reports.fairshare.deferred',
+                                     organization=self.big.pk), 2)
+
+        fairshare.started(report, queued_at=0, deferred=True)
+        self.assertTrue(22 <= fairshare.defer(report) <= 75)
+        self.assertEqual(fairshare.wait_times()[self.big.pk]['count'], 1)
+
+    @patch('reports.tasks.generate_document.retry')
+    def test_repeated_deferral(self, mRetry):
+        mRetry.side_effect = RuntimeError
+        running = self.create_report(self.big)
+        report = self.create_report(self.big)
+        fairshare.acquire(running)
+
+        with self.assertRaises(RuntimeError):
+            generate_document(report_id=report.pk)
+        for __ in range(5):
+            with self.assertRaises(RuntimeError):
+                generate_document(report_id=report.pk, deferred=True)
+            self.assertTrue(
+                22 <= mRetry.call_args[1]['countdown'] <= 38)
+        key = fairshare._pending_key(self.big.pk)
+        self.assertEqual(cache.get(key), 1)
+
+        fairshare.release(running)
+        generate_document(report_id=report.pk, queued_at=0, deferred=True)
+        self.assertEqual(cache.get(key), 0)
+
+    @patch('reports.tasks.generate_document.retry')
+    def test_generation_retries(self, mRetry):
+        mRetry.side_effect = RuntimeError
+        report = self.create_report(self.big)
+
+        with patch.object(Report, 'generate_document',
+                          side_effect=ValueError), \
+                patch('reports.tasks.GENERATION_MAX_ATTEMPTS', 2):
+            with self.assertRaises(RuntimeError):
+                generate_document(report_id=report.pk, deferred=True)
+            # Deferrals do not use up the retries
+            self.assertIsNone(mRetry.call_args[1]['max_retries'])
+
+            Report.objects.filter(pk=report.pk).update(attempts=2)
+            with self.assertRaises(ValueError):
+                generate_document(report_id=report.pk, deferred=True)
+
+    def test_interleave(self):
+        big = [self.create_report(self.big) for __ in range(4)]
+        small = [self.create_report(self.small) for __ in range(2)]
+
+        self.assertEqual(fairshare.interleave(big + small),
+                         [big[0], small[0], big[1], small[1], big[2], big[3]])
+
+        with patch.dict(fairshare.ORGANIZATION_WEIGHTS, {self.big.pk: 2}):
+            self.assertEqual(
+                fairshare.interleave(big + small),
+                [big[0], small[0], big[1], big[2], small[1], big[3]])
+
+    @patch('reports.tasks.generate_document.retry')
+    def test_task(self, mRetry):
+        mRetry.side_effect = RuntimeError
+        running = self.create_report(self.big)
+        report = self.create_report(self.big)
+        fairshare.acquire(running)
+
+        with self.assertRaises(RuntimeError):
+            generate_document(report_id=report.pk)
+        self.assertEqual(mRetry.call_args[1]['kwargs'],
+                         {'report_id': report.pk, 'deferred': True})
+
+        fairshare.release(running)
+        generate_document(report.pk, queued_at=0, deferred=True)
+        report.refresh_from_db()
+        self.assertTrue(report.generated)
+        self.assertTrue(fairshare.acquire(running))
+        self.assertEqual(
+            metrics.get('reports.fairshare.wait',
+                        organization=self.big.pk)['count'], 1)
@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from unittest.mock import patch
+
+from reports import hooks, metrics
+from reports.models import Report, ReportEvent, report_generated
+from reports.runtests.example.models import Organization
+
+calls = []
+
+
+def single(report):
+    calls.append(report.pk)
+
+
+def batch(reports):
+    calls.append([report.pk for report in reports])
+
+
+def failing(report):
+    raise ValueError('Down')
+
+
+class HooksTestCase(TestCase):
+
+    def setUp(self):
+        del calls[:]
+        cache.clear()
+        metrics.reset()
+        patcher = patch.dict(hooks.handlers, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        hooks.hook('single')(single)
+        hooks.hook('batch', batch=True, batch_size=2)(batch)
+        self.org = Organization.objects.create(name='Org')
+
+    def create_report(self):
+        return Report.objects.create(
+            report='example', typ='pdf', organization=self.org,
+            start_datetime=datetime(2017, 1, 1),
+            end_datetime=datetime(2017, 1, 2))
+
+    def test_record(self):
+        report = self.create_report()
+        with patch('reports.tasks.run_hook.apply_async') as mApply, \
+                patch('reports.hooks.transaction.on_commit',
+                      lambda func: func()):
+            report.generate_document()
+
+        self.assertEqual(
+            sorted(ReportEvent.objects.values_list('handler', flat=True)),
+            ['batch', 'single'])
+        self.assertEqual(
+            sorted(call[1]['countdown'] for call in mApply.call_args_list),
+            [0, 30])
+        # Pending runs are not scheduled twice
+        hooks.schedule('single')
+        self.assertEqual(mApply.call_count, 2)
+        self.assertEqual(calls, [])
+
+    def test_run(self):
+        reports = [self.create_report() for __ in range(3)]
+        for report in reports:
+            hooks.record(report)
+
+        self.assertEqual(hooks.run('single'), 3)
+        self.assertEqual(hooks.run('batch'), 3)
+        pks = [report.pk for report in reports]
+        self.assertEqual(calls, pks + [pks[:2], pks[2:]])
+        self.assertFalse(ReportEvent.objects.exists())
+        self.assertEqual(metrics.get('reports.hooks.processed',
+                                     handler='batch'), 3)
+        self.assertEqual(
+            metrics.get('reports.hooks.run', handler='single')['count'], 3)
+
+    @patch('reports.hooks.schedule')
+    def test_retry(self, mSchedule):
+        hooks.handlers.clear()
+        hooks.hook('failing', max_attempts=2)(failing)
+        hooks.record(self.create_report())
+
+        self.assertEqual(hooks.run('failing'), 1)
+        mSchedule.assert_called_once_with('failing', countdown=60)
+        event = ReportEvent.objects.get()
+        self.assertIsNone(event.processed_at)
+        self.assertGreater(event.available_at, timezone.now())
+        self.assertIn('Down', event.error)
+
+        # Not due yet
+        self.assertEqual(hooks.run('failing'), 0)
+        ReportEvent.objects.update(available_at=timezone.now())
+        self.assertEqual(hooks.run('failing'), 1)
+        event.refresh_from_db()
+        self.assertIsNotNone(event.processed_at)
+        self.assertEqual(event.attempts, 2)
+        self.assertEqual(mSchedule.call_count, 1)
+
+    @patch('reports.hooks.schedule')
+    def test_lease(self, mSchedule):
+        hooks.record(self.create_report())
+        # The worker died after claiming the event
+        claimed = hooks._claim(hooks.handlers['single'])
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(hooks.run('single'), 0)
+        self.assertEqual(hooks.recover(), [])
+
+        ReportEvent.objects.filter(handler='single').update(
+            processed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(hooks.recover(), ['single'])
+        mSchedule.assert_called_once_with('single')
+        self.assertEqual(hooks.run('single'), 1)
+        self.assertEqual(calls, [claimed[0].report_id])
+        self.assertFalse(ReportEvent.objects.filter(handler='single').exists())
+
+        # Events that used up their attempts stay for inspection
+        hooks.record(self.create_report())
+        ReportEvent.objects.filter(handler='single').update(
+            processed_at=timezone.now() - timedelta(hours=1), attempts=5)
+        self.assertEqual(hooks.run('single'), 0)
+
+    def test_signal(self):
+        received = []
+
+        def receiver(sender, report, **kwargs):
+            received.append(report.pk)
+
+        hooks.handlers.clear()
+        hooks.hook('report_generated',
+                   enabled=report_generated.has_listeners)(
+            hooks.send_report_generated)
+        report = self.create_report()
+        hooks.record(report)
+        self.assertFalse(ReportEvent.objects.exists())
+
+        report_generated.connect(receiver)
+        self.addCleanup(report_generated.disconnect, receiver)
+        hooks.record(report)
+        hooks.run('report_generated')
+        self.assertEqual(received, [report.pk])
@@ -0,0 +1,45 @@
+import base64
+
+from django.test import SimpleTestCase
+from unittest.mock import patch
+
+from reports import html, metrics
+from reports.base import BaseReport
+from reports.runtests.example.models import Organization
+
+
+class HTMLTestCase(SimpleTestCase):
+
+    def setUp(self):
+        html.clear()
+        metrics.reset()
+
+    def test_render_html(self):
+        report = BaseReport()
+        report.id = 'example'
+        context = {'organization': Organization(name=u'Org')}
+
+        document = report.render_html('example/report.html', context)
+
+        self.assertIn(b'<h1>Org</h1>', document)
+        self.assertIn(b'h1 { color: #333; }', document)
+        self.assertIn(b'src="data:image/svg+xml;base64,', document)
+        self.assertEqual(metrics.get('reports.html.size', report='example'),
+                         len(document))
+        self.assertEqual(
+            metrics.get('reports.html.build', report='example')['count'], 1)
+
+    def test_template_cache(self):
+        template = html.get_template('example/report.html')
+        with patch('reports.html.engines') as mEngines:
+            self.assertIs(html.get_template('example/report.html'), template)
+            self.assertFalse(mEngines.called)
+
+    def test_asset_cache(self):
+        uri = html.asset_data_uri('example/logo.svg')
+        data = base64.b64decode(uri.split(',', 1)[1])
+        self.assertTrue(data.startswith(b'<svg'))
+
+        with patch('reports.html.open') as mOpen:
+            self.assertIs(html.asset_data_uri('example/logo.svg'), uri)
+            self.assertFalse(mOpen.called)
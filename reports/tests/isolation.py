@@ -0,0 +1,82 @@
+import os
+import time
+
+from django.test import SimpleTestCase
+from unittest.mock import patch
+
+from reports import isolation, metrics
+from reports.base import BaseReport
+
+
+def upper(source, output):
+    with open(source, 'rb') as src, open(output, 'wb') as out:
+        out.write(src.read().upper())
+
+
+def pid(source, output):
+    with open(output, 'w') as out:
+        out.write(str(os.getpid()))
+
+
+def sleep(source, output, seconds):
+    time.sleep(seconds)
+    pid(source, output)
+
+
+def crash(source, output):
+    os._exit(1)
+
+
+class IsolationTestCase(SimpleTestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.pool = isolation.RendererPool(workers=1, max_tasks_per_child=2,
+                                           timeout=30)
+        patcher = patch('reports.isolation._pool', self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.pool.reset, kill=True)
+
+    def run_task(self, func, **kwargs):
+        return isolation.run(func, b'data', isolated=True, **kwargs).read()
+
+    def test_inline(self):
+        document = isolation.run(pid, b'data', isolated=False)
+        self.assertEqual(document.read(), str(os.getpid()).encode('utf-8'))
+
+    def test_run(self):
+        self.assertEqual(self.run_task(upper), b'DATA')
+        child = int(self.run_task(pid))
+
+        self.assertNotEqual(child, os.getpid())
+        self.assertEqual(metrics.get('reports.render.children'), 1)
+        self.assertEqual(metrics.get('reports.render.task', task='upper',
+                                     child=child)['count'], 1)
+        self.assertGreater(metrics.get('reports.render.rss', child=child), 0)
+
+    def test_recycle(self):
+        pids = [self.run_task(pid) for __ in range(3)]
+
+        self.assertEqual(pids[0], pids[1])
+        self.assertNotEqual(pids[1], pids[2])
+        self.assertEqual(metrics.get('reports.render.children'), 2)
+
+    def test_timeout(self):
+        with self.assertRaises(isolation.RenderTimeout):
+            self.run_task(sleep, seconds=30, timeout=1)
+        self.assertEqual(metrics.get('reports.render.timeout', task='sleep'),
+                         1)
+        self.assertTrue(self.run_task(sleep, seconds=0))
+
+    def test_crash(self):
+        with self.assertRaises(isolation.BrokenProcessPool):
+            self.run_task(crash)
+        self.assertEqual(self.run_task(upper), b'DATA')
+
+    @patch('reports.isolation.run')
+    def test_markdown_to_doc(self, mRun):
+        BaseReport().markdown_to_doc(u'# Caf\xe9', 'pdf')
+        BaseReport().markdown_to_doc(u'# Caf\xe9'.encode('utf-8'), 'pdf')
+        self.assertEqual([call[0][1] for call in mRun.call_args_list],
+                         [b'# Caf\xc3\xa9'] * 2)
@@ -0,0 +1,116 @@
+import pickle
+from datetime import datetime
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+from unittest.mock import patch
+
+from reports import memo
+from reports.base import BaseReport, data_provider
+from reports.runtests.example.models import Organization
+from reports.utils import LRUCache
+
+calls = []
+
+
+@data_provider('alerts')
+def alerts(organization, start_datetime, end_datetime, severity=None):
+    calls.append((organization.pk, severity))
+    return [organization.pk, severity]
+
+
+class AlertsReport(BaseReport):
+    id = 'alerts'
+
+    @data_provider('alert_totals')
+    def totals(self, organization, start_datetime, end_datetime):
+        return len(alerts(organization, start_datetime, end_datetime))
+
+
+class MemoTestCase(SimpleTestCase):
+
+    def setUp(self):
+        del calls[:]
+        memo.clear()
+        self.org = Organization(pk=1, name=u'Org')
+        self.start = datetime(2017, 1, 1)
+        self.end = datetime(2017, 1, 2)
+
+    def test_local(self):
+        alerts(self.org, self.start, self.end)
+        alerts(self.org, self.start, self.end)
+        alerts(self.org, start_datetime=self.start, end_datetime=self.end)
+        alerts(self.org, self.start, self.end, severity='high')
+        alerts(Organization(pk=2), self.start, self.end)
+
+        self.assertEqual(calls, [(1, None), (1, 'high'), (2, None)])
+        self.assertEqual(memo.stats()['alerts'], {
+            'local': 2, 'shared': 0, 'miss': 3, 'hit_rate': 0.4})
+
+    def test_method(self):
+        report = AlertsReport()
+        self.assertEqual(report.totals(self.org, self.start, self.end), 2)
+        self.assertEqual(AlertsReport().totals(self.org, self.start,
+                                               self.end), 2)
+        self.assertEqual(memo.stats()['alert_totals']['local'], 1)
+
+    @patch('reports.memo.MEMO_CACHE', 'default')
+    def test_shared(self):
+        caches['default'].clear()
+        alerts(self.org, self.start, self.end)
+
+        # Another worker with an empty local cache
+        memo.local_cache.clear()
+        self.assertEqual(alerts(self.org, self.start, self.end), [1, None])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(memo.stats()['alerts']['shared'], 1)
+
+    def test_timeout(self):
+        with patch('reports.utils.time', return_value=1000):
+            alerts(self.org, self.start, self.end)
+        with patch('reports.utils.time', return_value=1000 + 3599):
+            alerts(self.org, self.start, self.end)
+        self.assertEqual(len(calls), 1)
+
+        # Expired, also if no other value pushed it out
+        with patch('reports.utils.time', return_value=1000 + 3600):
+            alerts(self.org, self.start, self.end)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(memo.local_cache.size,
+                         len(pickle.dumps([1, None], pickle.HIGHEST_PROTOCOL)))
+
+    def test_copies(self):
+        alerts(self.org, self.start, self.end).append('changed')
+        self.assertEqual(alerts(self.org, self.start, self.end), [1, None])
+        self.assertEqual(memo.stats()['alerts']['local'], 1)
+
+    def test_positional_params(self):
+        self.assertEqual(alerts(self.org, self.start, self.end, 'high'),
+                         [1, 'high'])
+        alerts(self.org, self.start, self.end, 'high')
+        alerts(self.org, self.start, self.end, 'low')
+        self.assertEqual(calls, [(1, 'high'), (1, 'low')])
+
+
+class LRUCacheTestCase(SimpleTestCase):
+
+    def test_eviction(self):
+        cache = LRUCache(10)
+        cache.set('a', b'12345')
+        cache.set('b', b'1234')
+        cache.get('a')
+        cache.set('c', b'123')
+
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.size, 8)
+        self.assertFalse(cache.set('d', b'12345678901'))
+
+    def test_timeout(self):
+        cache = LRUCache(10)
+        with patch('reports.utils.time', return_value=1000):
+            cache.set('a', b'12345', timeout=60)
+            cache.set('b', b'1234')
+        with patch('reports.utils.time', return_value=1060):
+            self.assertNotIn('a', cache)
+            self.assertEqual(cache.get('b'), b'1234')
+        self.assertEqual(cache.size, 4)
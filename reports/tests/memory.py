@@ -0,0 +1,69 @@
+import time
+import tracemalloc
+from datetime import datetime
+
+from django.test import TestCase
+from unittest.mock import patch
+
+from reports.memory import track_memory
+from reports.models import Report
+from reports.runtests.example.models import Organization
+
+
+class MemoryTestCase(TestCase):
+
+    def create_report(self, org, **kwargs):
+        return Report.objects.create(
+            report=u'example', organization=org, typ=u'pdf',
+            start_datetime=datetime(2017, 1, 1),
+            end_datetime=datetime(2017, 1, 2), **kwargs)
+
+    def test_track_memory(self):
+        for mode in ('tracemalloc', 'rss'):
+            with track_memory(mode) as memory:
+                data = b'x' * 32 * 1024 * 1024
+                # Give the RSS sampler a chance to see it
+                time.sleep(0.2)
+                del data
+            self.assertGreater(memory['peak'], 16 * 1024 * 1024, mode)
+
+        with track_memory(None) as memory:
+            pass
+        self.assertIsNone(memory['peak'])
+
+    @patch('reports.memory.RSSSampler')
+    def test_concurrent_tracking(self, mSampler):
+        mSampler.return_value.stop.return_value = 1024
+        with track_memory('tracemalloc') as outer:
+            # Another generation thread falls back to the RSS
+            with track_memory('tracemalloc') as inner:
+                pass
+            self.assertEqual(inner['peak'], 1024)
+            self.assertTrue(tracemalloc.is_tracing())
+        self.assertIsNotNone(outer['peak'])
+        self.assertFalse(tracemalloc.is_tracing())
+
+        with track_memory('tracemalloc'):
+            self.assertTrue(tracemalloc.is_tracing())
+        self.assertEqual(mSampler.call_count, 1)
+
+    @patch('reports.models.track_memory')
+    def test_memory_peak_recorded(self, mTrack):
+        mTrack.return_value.__enter__.return_value = {'peak': 1024}
+        report = self.create_report(Organization.objects.create(name=u'Org'))
+
+        report.generate_document()
+
+        self.assertEqual(Report.objects.get(pk=report.pk).memory_peak, 1024)
+
+    @patch('reports.models.HIGH_MEMORY_QUEUE', 'high-memory')
+    @patch('reports.models.MEMORY_BUDGET', 1024)
+    def test_queue(self):
+        large = Organization.objects.create(name=u'Large')
+        small = Organization.objects.create(name=u'Small')
+        self.create_report(large, memory_peak=2048)
+        self.create_report(small, memory_peak=512)
+
+        self.assertEqual(self.create_report(large).get_queue(),
+                         'high-memory')
+        self.assertIsNone(self.create_report(small).get_queue())
@@ -2,9 +2,11 @@ import json
 from django_celery_beat.models import PeriodicTask
 from unittest.mock import patch
 from datetime import datetime
+from django.db import connections
 from django.test import TestCase
 
-from reports.models import ReportSchedule
+from reports import metrics
+from reports.models import Report, ReportSchedule
 from reports.runtests.example.models import Organization
 
 
@@ -201,3 +203,41 @@ class ScheduleReportModelTestCase(TestCase):
         task = schedule.periodic_task
         # Make sure django-celery-beat can properly load kwargs
         json.loads(task.kwargs)
+
+    @patch('reports.tasks.generate_document.apply_async')
+    def test_schedule_report_idempotent(self, mApply):
+        metrics.reset()
+        org = Organization.objects.create(name='Org')
+        schedule = ReportSchedule.objects.create(
+            organization=org, report='example', typ='pdf',
+            period=ReportSchedule.PERIOD_DAILY)
+
+        report = schedule.schedule_report()
+        self.assertEqual(report.schedule, schedule)
+        self.assertIsNone(schedule.schedule_report())
+
+        self.assertEqual(Report.objects.count(), 1)
+        self.assertEqual(mApply.call_count, 1)
+        self.assertEqual(metrics.get('reports.schedule.duplicate',
+                                     report='example'), 1)
+
+        other = ReportSchedule.objects.create(
+            organization=org, report='example', typ='pdf',
+            period=ReportSchedule.PERIOD_DAILY)
+        self.assertIsNotNone(other.schedule_report())
+
+    @patch('reports.tasks.generate_document.apply_async')
+    def test_schedule_report_lock(self, mApply):
+        org = Organization.objects.create(name='Org')
+        schedule = ReportSchedule.objects.create(
+            organization=org, report='example', typ='pdf',
+            period=ReportSchedule.PERIOD_DAILY)
+        atomic = []
+
+        def lock_window(schedule_id, start, end, using):
+            # The lock is released with the transaction of the insert
+            atomic.append((using, connections[using].in_atomic_block))
+
+        with patch('reports.models.lock_window', lock_window):
+            schedule.schedule_report()
+        self.assertEqual(atomic, [('default', True)])
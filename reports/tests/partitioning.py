@@ -0,0 +1,78 @@
+from datetime import date, datetime
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from unittest.mock import patch
+
+from reports import partitioning
+from reports.models import Report, ReportEvent, ReportSchedule
+from reports.runtests.example.models import Organization
+
+
+class PartitioningTestCase(TestCase):
+
+    def create_report(self, created_at):
+        return Report.objects.create(
+            report=u'example', organization=self.org, typ=u'pdf',
+            start_datetime=datetime(2017, 1, 1), created_at=created_at,
+            end_datetime=datetime(2017, 1, 2),
+        )
+
+    def setUp(self):
+        self.org = Organization.objects.create(name=u'Org')
+
+    @patch('reports.partitioning.date')
+    def test_partitioning(self, mDate):
+        mDate.side_effect = date
+        mDate.today.return_value = date(2018, 3, 15)
+        old = self.create_report(datetime(2017, 11, 5, 10, 0))
+
+        partitioning.convert(months_ahead=2)
+
+        self.assertTrue(partitioning.is_partitioned())
+        months = [month for month, name in partitioning.partitions()]
+        self.assertEqual(months, [date(2017, 11, 1), date(2017, 12, 1),
+                                  date(2018, 1, 1), date(2018, 2, 1),
+                                  date(2018, 3, 1), date(2018, 4, 1),
+                                  date(2018, 5, 1)])
+
+        # Model and manager API keep working
+        new = self.create_report(datetime(2018, 3, 15, 10, 0))
+        self.assertGreater(new.pk, old.pk)
+        self.assertEqual(Report.objects.get(pk=old.pk), old)
+        self.assertEqual(Report.objects.failed().count(), 2)
+
+        old.document.save('old.pdf', ContentFile(b'old'))
+        old.profile.save('old.zip', ContentFile(b'profile'))
+        ReportEvent.objects.create(report_id=old.pk, handler='index')
+        ReportEvent.objects.create(report=new, handler='index')
+        storage = old.document.storage
+
+        removed = partitioning.remove_partitions(date(2018, 1, 1), drop=True)
+        self.assertEqual(removed, ['reports_report_p201711',
+                                   'reports_report_p201712'])
+        self.assertEqual(list(Report.objects.all()), [new])
+        # Documents, profiles and events of the dropped reports are deleted
+        self.assertFalse(storage.exists(old.document.name))
+        self.assertFalse(storage.exists(old.profile.name))
+        self.assertEqual(
+            list(ReportEvent.objects.values_list('report_id', flat=True)),
+            [new.pk])
+
+    @patch('reports.tasks.generate_document.apply_async')
+    def test_schedule_report(self, mApply):
+        partitioning.convert(months_ahead=1)
+        schedule = ReportSchedule.objects.create(
+            organization=self.org, report='example', typ='pdf',
+            period=ReportSchedule.PERIOD_DAILY)
+
+        self.assertIsNotNone(schedule.schedule_report())
+        self.assertIsNone(schedule.schedule_report())
+        self.assertEqual(Report.objects.filter(schedule=schedule).count(), 1)
+        self.assertEqual(mApply.call_count, 1)
+
+    def test_command_requires_conversion(self):
+        with self.assertRaises(CommandError):
+            call_command('report_partitions')
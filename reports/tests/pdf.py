@@ -0,0 +1,81 @@
+import io
+from unittest import skipIf
+
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase
+from unittest.mock import patch
+
+from reports import metrics
+from reports.base import BaseReport
+
+try:
+    import pikepdf
+    from PIL import Image
+except ImportError:
+    pikepdf = None
+else:
+    from reports import pdf
+
+
+def make_pdf(size=(3000, 2000), pages=2):
+    image = Image.linear_gradient('L').resize(size).convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, 'PDF', save_all=True,
+               append_images=[image.copy() for __ in range(pages - 1)])
+    return ContentFile(buffer.getvalue())
+
+
+def images(document):
+    with pikepdf.open(document) as opened:
+        return opened.is_linearized, [
+            (obj.objgen, int(obj.Width), int(obj.Height))
+            for __, __, obj in pdf._images(opened, pikepdf)]
+
+
+@skipIf(pikepdf is None, 'pikepdf and Pillow are not installed')
+class PDFTestCase(SimpleTestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.report = BaseReport()
+        self.report.id = 'example'
+
+    def test_optimize(self):
+        document = make_pdf()
+        linearized, before = images(document)
+        self.assertFalse(linearized)
+        self.assertEqual(len(set(objgen for objgen, __, __ in before)), 2)
+
+        with patch.object(BaseReport, 'pdf_optimize', True):
+            optimized = self.report.optimize_pdf(document)
+
+        linearized, after = images(optimized)
+        self.assertTrue(linearized)
+        self.assertEqual(len(after), 2)
+        self.assertEqual(len(set(objgen for objgen, __, __ in after)), 1)
+        self.assertEqual(after[0][1:], (2000, 1333))
+        self.assertLess(optimized.size, document.size)
+        self.assertEqual(
+            metrics.get('reports.pdf.size_before', report='example'),
+            document.size)
+        self.assertEqual(
+            metrics.get('reports.pdf.size_after', report='example'),
+            optimized.size)
+        self.assertEqual(
+            metrics.get('reports.pdf.optimize', report='example')['count'],
+            1)
+
+    def test_options(self):
+        document = make_pdf(size=(800, 600), pages=1)
+        with patch.object(BaseReport, 'pdf_optimize', True), \
+                patch.object(BaseReport, 'pdf_options',
+                             {'max_image_size': 400, 'linearize': False}):
+            optimized = self.report.optimize_pdf(document)
+
+        linearized, after = images(optimized)
+        self.assertFalse(linearized)
+        self.assertEqual(after[0][1:], (400, 300))
+
+    def test_disabled(self):
+        document = make_pdf(pages=1)
+        self.assertIs(self.report.optimize_pdf(document), document)
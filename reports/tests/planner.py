@@ -0,0 +1,71 @@
+from datetime import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django_celery_beat.models import CrontabSchedule, PeriodicTask
+
+from reports import planner
+from reports.models import Report, ReportSchedule
+from reports.runtests.example.models import Organization
+
+
+class PlannerTestCase(TestCase):
+
+    def setUp(self):
+        org = Organization.objects.create(name=u'Org')
+        cron = CrontabSchedule.objects.create()
+        task = PeriodicTask.objects.create(name='task', crontab=cron)
+
+        schedules = [
+            # Daily at 06:00, twice
+            ('pdf', {'minute': '0', 'hour': '6', 'day_of_week': '*',
+                     'day_of_month': '*', 'month_of_year': '*'}),
+            ('pdf', {'minute': '0', 'hour': '6', 'day_of_week': '*',
+                     'day_of_month': '*', 'month_of_year': '*'}),
+            # Mondays at 06:00
+            ('docx', {'minute': '0', 'hour': '6', 'day_of_week': '1',
+                      'day_of_month': '*', 'month_of_year': '*'}),
+            # 1st of the quarter at 06:30
+            ('pdf', {'minute': '30', 'hour': '6', 'day_of_week': '*',
+                     'day_of_month': '1', 'month_of_year': '*/3'}),
+        ]
+        for typ, schedule in schedules:
+            ReportSchedule.objects.create(
+                report=u'example', typ=typ, organization=org,
+                schedule=schedule, periodic_task=task)
+
+        Report.objects.create(
+            report=u'example', organization=org, typ=u'pdf',
+            start_datetime=datetime(2017, 1, 1),
+            end_datetime=datetime(2017, 1, 2), generation_time=30)
+
+    def test_expand_crontab(self):
+        key = planner.crontab_key({'minute': '0,30', 'hour': '6',
+                                   'day_of_week': '1'})
+        fires = planner.expand_crontab(key, datetime(2018, 1, 1),
+                                       datetime(2018, 1, 15))
+        self.assertEqual(fires, [datetime(2018, 1, 1, 6, 0),
+                                 datetime(2018, 1, 1, 6, 30),
+                                 datetime(2018, 1, 8, 6, 0),
+                                 datetime(2018, 1, 8, 6, 30)])
+
+    def test_plan(self):
+        # Monday 1st of January, start of a quarter
+        timeline = planner.plan(datetime(2018, 1, 1), datetime(2018, 1, 3))
+
+        self.assertEqual(timeline, [
+            planner.Load(datetime(2018, 1, 1, 6, 0), 'celery', 'docx', 1, 30),
+            planner.Load(datetime(2018, 1, 1, 6, 0), 'celery', 'pdf', 2, 60),
+            planner.Load(datetime(2018, 1, 1, 6, 30), 'celery', 'pdf', 1, 30),
+            planner.Load(datetime(2018, 1, 2, 6, 0), 'celery', 'pdf', 2, 60),
+        ])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('report_capacity', '2018-01-01', '2018-01-03',
+                     '--top', '1', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            'minute,queue,typ,renders,seconds',
+            '2018-01-01 06:00,celery,pdf,2,60.0',
+        ])
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import include, path
+
+from reports import metrics
+from reports.models import REPORTS, Report
+from reports.runtests.example.models import Organization
+from reports.views import ReportPreviewView
+
+urlpatterns = [
+    path('reports/', include('reports.urls')),
+]
+
+
+@override_settings(ROOT_URLCONF='reports.tests.preview')
+@patch('reports.tasks.generate_document.apply_async')
+class PreviewTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.factory = RequestFactory()
+        self.user = User.objects.create(username='user')
+        self.org = Organization.objects.create(name=u'Org')
+        self.report = Report.objects.create(
+            report=u'example', organization=self.org, typ=u'pdf',
+            start_datetime=datetime(2017, 1, 1),
+            end_datetime=datetime(2017, 2, 1), created_by=self.user)
+
+    def get(self, method='get'):
+        request = getattr(self.factory, method)('/')
+        request.user = self.user
+        return ReportPreviewView.as_view()(request, pk=self.report.pk)
+
+    def test_preview(self, mApply):
+        html = self.report.generate_preview()
+
+        self.assertIn(b'<h1>Org</h1>', html)
+        self.assertFalse(self.report.generated)
+        self.assertEqual(self.report.generation_state, Report.STATE_QUEUED)
+        self.assertEqual(mApply.call_count, 1)
+
+        # Cached and queued once
+        report = Report.objects.get(pk=self.report.pk)
+        self.assertEqual(report.generate_preview(), html)
+        self.assertEqual(mApply.call_count, 1)
+        self.assertEqual(
+            metrics.get('reports.preview.cached', report='example'), 1)
+
+        # A new window renders a new preview
+        report.end_datetime = datetime(2017, 3, 1)
+        with patch.object(REPORTS['example'], 'generate_preview',
+                          return_value=b'new') as mPreview:
+            self.assertEqual(report.generate_preview(), b'new')
+        self.assertTrue(mPreview.call_args[1]['preview'])
+
+    def test_sample(self, mApply):
+        cls = REPORTS['example']
+        report = cls()
+        report.preview_limit = 2
+        qs = Organization.objects.order_by('pk')
+        for name in ('B', 'C'):
+            Organization.objects.create(name=name)
+
+        self.assertEqual(report.sample(qs).count(), 3)
+        self.assertEqual(len(report.sample(qs, preview=True)), 2)
+
+        with patch.object(cls, 'preview_window', timedelta(days=7)), \
+                patch.object(cls, 'generate_preview',
+                             return_value=b'preview') as mPreview:
+            self.report.generate_preview(schedule=False)
+        self.assertEqual(mPreview.call_args[1]['start_datetime'],
+                         datetime(2017, 1, 25))
+        self.assertEqual(mApply.call_count, 0)
+
+    def test_view(self, mApply):
+        response = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'<h1>Org</h1>', response.content)
+        self.assertEqual(response['X-Report-State'], Report.STATE_PENDING)
+        self.assertEqual(mApply.call_count, 0)
+
+        response = self.get('post')
+        self.assertIn(b'<h1>Org</h1>', response.content)
+        self.assertEqual(response['X-Report-State'], Report.STATE_QUEUED)
+        self.assertEqual(mApply.call_count, 1)
+
+        self.report.document.save('report.pdf', ContentFile(b'data'))
+        response = self.get()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url,
+                         '/reports/{0}/download/'.format(self.report.pk))
+
+    def test_view_not_supported(self, mApply):
+        with patch.object(REPORTS['example'], 'preview_template', None):
+            with self.assertRaises(Http404):
+                self.get()
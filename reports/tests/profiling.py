@@ -0,0 +1,64 @@
+import io
+import zipfile
+from datetime import datetime
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+from unittest.mock import patch
+
+from reports.models import Report
+from reports.profiling import should_profile
+from reports.runtests.example.models import Organization
+
+
+class ProfilingTestCase(TestCase):
+
+    def setUp(self):
+        self.org = Organization.objects.create(name=u'Org')
+
+    def create_report(self, **kwargs):
+        return Report.objects.create(
+            report=u'example', organization=self.org, typ=u'pdf',
+            start_datetime=datetime(2017, 1, 1),
+            end_datetime=datetime(2017, 1, 2), **kwargs)
+
+    def test_should_profile(self):
+        report = self.create_report()
+        self.assertFalse(should_profile(report))
+        self.assertTrue(should_profile(self.create_report(
+            config={'profile': True})))
+
+        with patch('reports.profiling.PROFILE_REPORTS', ['example']):
+            self.assertTrue(should_profile(report))
+        with patch('reports.profiling.PROFILE_ORGANIZATIONS', [self.org.pk]):
+            self.assertTrue(should_profile(report))
+        with patch('reports.profiling.PROFILE_SAMPLE_RATE', 1):
+            self.assertTrue(should_profile(report))
+
+    @patch('reports.runtests.example.my_reports.example.ExampleReport'
+           '.generate')
+    def test_profile(self, mGenerate):
+        def generate(**kwargs):
+            Organization.objects.count()
+            return ContentFile(u'Some data')
+
+        mGenerate.side_effect = generate
+        report = self.create_report(config={'profile': True})
+        report.generate_document()
+
+        report = Report.objects.get(pk=report.pk)
+        self.assertTrue(report.profile.name.endswith('.zip'))
+        data = report.profile.read()
+        self.assertEqual(report.profile_size, len(data))
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        self.assertEqual(sorted(archive.namelist()),
+                         ['profile.prof', 'profile.txt', 'queries.txt'])
+        self.assertIn(b'generate', archive.read('profile.txt'))
+        queries = archive.read('queries.txt')
+        self.assertTrue(queries.startswith(b'1 queries'))
+        self.assertIn(b'FROM "example_organization"', queries)
+
+    def test_not_profiled(self):
+        report = self.create_report()
+        report.generate_document()
+        self.assertFalse(Report.objects.get(pk=report.pk).profile)
@@ -0,0 +1,96 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+from unittest.mock import patch
+
+from reports import metrics
+from reports.models import Report
+from reports.reconcile import reconcile, record_backlog
+from reports.runtests.example.models import Organization
+from reports.runtests.example.my_reports.example import ExampleReport
+from reports.tasks import generate_document
+
+
+class ReconcileTestCase(TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.org = Organization.objects.create(name='Org')
+        self.now = timezone.now()
+
+    def create_report(self, state=Report.STATE_PENDING, queued=None,
+                      started=None, attempts=0):
+        report = Report.objects.create(
+            report='example', typ='pdf', organization=self.org,
+            start_datetime='2017-01-01', end_datetime='2017-01-02')
+        Report.objects.filter(pk=report.pk).update(
+            generation_state=state, attempts=attempts,
+            queued_at=queued and self.now - timedelta(minutes=queued),
+            started_at=started and self.now - timedelta(minutes=started))
+        return report
+
+    def test_states(self):
+        report = self.create_report()
+        with patch('reports.tasks.generate_document.apply_async') as mApply:
+            report.schedule_document_generation()
+        self.assertEqual(mApply.call_args[1]['kwargs']['report_id'],
+                         report.pk)
+
+        report.refresh_from_db()
+        self.assertEqual(report.generation_state, Report.STATE_QUEUED)
+        self.assertIsNotNone(report.queued_at)
+
+        report.generate_document()
+        report.refresh_from_db()
+        self.assertEqual(report.generation_state, Report.STATE_DONE)
+        self.assertEqual(report.attempts, 1)
+        self.assertIsNotNone(report.started_at)
+
+        with patch.object(ExampleReport, 'generate', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                report.generate_document()
+        report.refresh_from_db()
+        self.assertEqual(report.generation_state, Report.STATE_FAILED)
+        self.assertEqual(report.attempts, 2)
+
+    def test_stuck(self):
+        lost = self.create_report(Report.STATE_QUEUED, queued=60)
+        died = self.create_report(Report.STATE_RUNNING, queued=200,
+                                  started=180)
+        self.create_report(Report.STATE_QUEUED, queued=5)
+        self.create_report(Report.STATE_RUNNING, queued=60, started=50)
+        self.create_report(Report.STATE_FAILED, queued=200, started=180)
+        self.create_report(Report.STATE_DONE, queued=200, started=180)
+
+        self.assertEqual(set(Report.objects.stuck(self.now)), {lost, died})
+
+    @patch('reports.tasks.generate_document.apply_async')
+    def test_reconcile(self, mApply):
+        stuck = [self.create_report(Report.STATE_QUEUED, queued=60 + i)
+                 for i in range(5)]
+        given_up = self.create_report(Report.STATE_RUNNING, queued=300,
+                                      started=300, attempts=5)
+
+        self.assertEqual(record_backlog(self.now), (5, 64 * 60))
+        self.assertEqual(reconcile(self.now, batch_size=2, max_batches=2),
+                         (3, 1))
+        self.assertEqual(mApply.call_count, 3)
+        self.assertEqual(
+            set(call[1]['kwargs']['report_id']
+                for call in mApply.call_args_list),
+            set(report.pk for report in stuck[2:]))
+        given_up.refresh_from_db()
+        self.assertEqual(given_up.generation_state, Report.STATE_FAILED)
+        self.assertEqual(metrics.get('reports.reconcile.backlog_age'),
+                         64 * 60)
+
+        # Requeued reports are not stuck anymore
+        self.assertEqual(reconcile(self.now), (2, 0))
+        self.assertEqual(reconcile(self.now), (0, 0))
+
+    def test_duplicate_task(self):
+        report = self.create_report(Report.STATE_DONE)
+        generate_document(report_id=report.pk)
+        report.refresh_from_db()
+        self.assertEqual(report.attempts, 0)
@@ -0,0 +1,116 @@
+from datetime import datetime
+from unittest.mock import patch
+
+from django.core.files.base import ContentFile
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from reports import metrics, routing
+from reports.models import REPORTS, Report
+from reports.runtests.example.models import Organization
+
+
+@patch('reports.routing.REPLICA_DATABASE', 'replica')
+@patch('reports.routing.REPLICA_MAX_LAG', None)
+class RoutingTestCase(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        routing.clear()
+        metrics.reset()
+        self.org = Organization.objects.create(name=u'Org')
+        self.report = Report.objects.create(
+            report=u'example', organization=self.org, typ=u'pdf',
+            start_datetime=datetime(2017, 1, 1),
+            end_datetime=datetime(2017, 1, 2))
+
+    def test_router(self):
+        with routing.use_replica('replica'):
+            self.assertEqual(routing.current(), 'replica')
+            org = Organization.objects.get(pk=self.org.pk)
+            report = Report.objects.get(pk=self.report.pk)
+        self.assertIsNone(routing.current())
+
+        self.assertEqual(org._state.db, 'replica')
+        self.assertEqual(report._state.db, 'default')
+        self.assertEqual(Organization.objects.get(pk=self.org.pk)._state.db,
+                         'default')
+        # Rows read from the replica can be assigned to primary ones
+        report.organization = org
+
+    def test_writes(self):
+        router = routing.ReportRouter()
+        with routing.use_replica('replica'):
+            org = Organization.objects.get(pk=self.org.pk)
+            self.assertEqual(router.db_for_write(Organization, instance=org),
+                             'default')
+            # Reports of a replica instance are read from the primary
+            self.assertEqual(org.report_set.all().db, 'default')
+
+            org.name = u'Renamed'
+            with self.assertNumQueries(0, using='replica'), \
+                    self.assertNumQueries(1, using='default'):
+                org.save()
+        self.assertEqual(org._state.db, 'default')
+
+        # Also after the block
+        with routing.use_replica('replica'):
+            org = Organization.objects.get(pk=self.org.pk)
+        self.assertEqual(router.db_for_write(Organization, instance=org),
+                         'default')
+        self.assertEqual(router.db_for_read(Organization, instance=org),
+                         'default')
+
+        # Other models are left to the next router
+        self.assertIsNone(router.db_for_read(Organization))
+        self.assertIsNone(router.db_for_write(Organization))
+        self.assertEqual(router.db_for_read(Report), 'default')
+        self.assertEqual(router.db_for_write(Report), 'default')
+
+    def test_generate_document(self):
+        used = []
+
+        def generate(instance, **kwargs):
+            used.append(Organization.objects.get(pk=self.org.pk)._state.db)
+            return ContentFile(b'data')
+
+        with patch.object(REPORTS['example'], 'generate', generate):
+            self.report.generate_document()
+
+        self.assertEqual(used, ['replica'])
+        report = Report.objects.get(pk=self.report.pk)
+        self.assertEqual(report.generation_state, Report.STATE_DONE)
+        self.assertEqual(metrics.get('reports.replica.used',
+                                     report='example'), 1)
+
+    def test_replica_lag(self):
+        # The test replica is the primary itself
+        self.assertEqual(routing.replica_lag('replica'), 0)
+        with self.assertNumQueries(0, using='replica'):
+            self.assertEqual(routing.replica_lag('replica'), 0)
+        self.assertEqual(metrics.get('reports.replica.lag',
+                                     alias='replica'), 0)
+
+    @patch('reports.routing.replica_lag')
+    def test_fallback(self, mLag):
+        mLag.return_value = 120
+        self.assertEqual(routing.choose_replica(self.report), 'replica')
+
+        # The lag reaches into the window
+        self.report.end_datetime = timezone.now()
+        self.assertIsNone(routing.choose_replica(self.report))
+        self.report.end_datetime = datetime(2017, 1, 2)
+
+        with patch('reports.routing.REPLICA_MAX_LAG', 60):
+            self.assertIsNone(routing.choose_replica(self.report))
+
+        mLag.return_value = None
+        self.assertIsNone(routing.choose_replica(self.report))
+        self.assertEqual(metrics.get('reports.replica.fallback',
+                                     report='example'), 3)
+
+        mLag.return_value = 0
+        with patch.object(REPORTS['example'], 'read_replica', False):
+            self.assertIsNone(routing.choose_replica(self.report))
+        with patch('reports.routing.REPLICA_DATABASE', None):
+            self.assertIsNone(routing.choose_replica(self.report))
@@ -0,0 +1,103 @@
+import os
+from datetime import datetime
+from unittest import skipIf
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+from unittest.mock import patch
+
+from reports import metrics
+from reports.models import Report
+from reports.runtests.example.models import Organization
+from reports.runtests.example.my_reports.example import ExampleReport
+from reports.storage import report_storage
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:
+    boto3 = mock_aws = None
+else:
+    from reports import s3
+
+PART_SIZE = 5 * 1024 * 1024
+
+
+@skipIf(mock_aws is None, 'boto3 and moto are not installed')
+class S3StorageTestCase(TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        self.mock = mock_aws()
+        self.mock.start()
+        self.addCleanup(self.mock.stop)
+        boto3.client('s3').create_bucket(Bucket='reports')
+        self.storage = s3.S3Storage(bucket='reports', location='docs',
+                                    part_size=PART_SIZE, concurrency=2)
+        self.data = os.urandom(PART_SIZE * 2 + 1024)
+
+    def test_multipart(self):
+        name = self.storage.save('report.pdf', ContentFile(self.data))
+
+        head = self.storage.client.head_object(Bucket='reports',
+                                               Key='docs/report.pdf')
+        self.assertTrue(head['ETag'].endswith('-3"'))
+        self.assertEqual(self.storage.size(name), len(self.data))
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(metrics.get('reports.upload.parts'), 3)
+        self.assertEqual(metrics.get('reports.upload.part')['count'], 3)
+
+        self.assertTrue(self.storage.exists(name))
+        self.assertIn('docs/report.pdf', self.storage.url(name))
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+
+    def test_small(self):
+        name = self.storage.save('report.pdf', ContentFile(b'Some data'))
+        head = self.storage.client.head_object(Bucket='reports',
+                                               Key='docs/report.pdf')
+        self.assertNotIn('-', head['ETag'])
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), b'Some data')
+
+    def test_abort(self):
+        upload = self.storage.open_upload('report.pdf')
+        with patch.object(upload, 'client', wraps=upload.client) as mClient:
+            mClient.complete_multipart_upload.side_effect = ValueError
+            with self.assertRaises(ValueError):
+                with upload:
+                    upload.write(self.data)
+        self.assertTrue(mClient.abort_multipart_upload.called)
+        self.assertFalse(self.storage.exists('report.pdf'))
+        uploads = self.storage.client.list_multipart_uploads(
+            Bucket='reports')
+        self.assertFalse(uploads.get('Uploads'))
+
+    def test_compressed(self):
+        storage = s3.CompressedS3Storage(
+            bucket='reports', part_size=PART_SIZE, concurrency=2)
+        name = storage.save('report.pdf', ContentFile(self.data))
+
+        self.assertGreater(storage.size(name), len(self.data))
+        with storage.open(name) as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_throughput(self):
+        org = Organization.objects.create(name='Org')
+        report = Report.objects.create(
+            report='example', typ='pdf', organization=org,
+            start_datetime=datetime(2017, 1, 1),
+            end_datetime=datetime(2017, 1, 2))
+
+        with patch.object(report_storage, '_wrapped', self.storage), \
+                patch.object(ExampleReport, 'generate',
+                             return_value=ContentFile(self.data)):
+            report.generate_document()
+
+        self.assertEqual(report.stored_size, len(self.data))
+        self.assertGreater(
+            metrics.get('reports.upload.throughput', report='example'), 0)
+        self.assertEqual(
+            metrics.get('reports.upload', report='example')['count'], 1)
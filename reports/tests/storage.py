@@ -0,0 +1,55 @@
+import shutil
+import tempfile
+from datetime import datetime
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+
+from reports.models import Report
+from reports.runtests.example.models import Organization
+from reports.storage import CODECS, CompressedFileSystemStorage
+
+
+class CompressedStorageTestCase(TestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.data = b'<td>Some repetitive report data</td>' * 1000
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_roundtrip(self):
+        for codec in CODECS:
+            storage = CompressedFileSystemStorage(codec=codec,
+                                                  location=self.location)
+            name = storage.save('report.html', ContentFile(self.data))
+
+            self.assertLess(storage.size(name), len(self.data))
+            with storage.open(name) as document:
+                self.assertEqual(document.read(), self.data)
+
+    def test_uncompressed_file(self):
+        storage = CompressedFileSystemStorage(location=self.location)
+        with open('{0}/legacy.html'.format(self.location), 'wb') as legacy:
+            legacy.write(self.data)
+
+        with storage.open('legacy.html') as document:
+            self.assertEqual(document.read(), self.data)
+
+    def test_document_sizes(self):
+        start = datetime(2017, 1, 1, 12, 33)
+        end = datetime(2017, 1, 2, 12, 33)
+        org = Organization.objects.create(name=u'Org')
+        report = Report.objects.create(report=u'example', organization=org,
+                                       start_datetime=start, end_datetime=end,
+                                       typ=u'pdf')
+        report.generate_document()
+
+        report = Report.objects.get(pk=report.pk)
+        self.assertEqual(report.document_size, 9)
+        self.assertEqual(report.stored_size, 9)
+
+        summary = list(Report.objects.storage_summary())
+        self.assertEqual(summary, [{'report': u'example', 'documents': 1,
+                                    'document_size': 9, 'stored_size': 9}])
@@ -0,0 +1,116 @@
+import shutil
+import tempfile
+from datetime import datetime
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.http import Http404
+from django.test import RequestFactory, TestCase
+
+from reports.models import Report
+from reports.storage import CompressedFileSystemStorage, report_storage
+from reports.runtests.example.models import Organization
+from reports.views import (ReportDownloadView, content_disposition,
+                           parse_range)
+
+
+class ReportDownloadViewTestCase(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.user = User.objects.create(username='user')
+        org = Organization.objects.create(name=u'Org')
+        self.report = Report.objects.create(
+            report=u'example', organization=org, typ=u'pdf',
+            start_datetime=datetime(2017, 1, 1, 12, 33),
+            end_datetime=datetime(2017, 1, 2, 12, 33), created_by=self.user,
+        )
+        self.report.document.save('report.pdf', ContentFile(b'0123456789'))
+
+    def get(self, view=None, **headers):
+        request = self.factory.get('/', **headers)
+        request.user = self.user
+        view = view or ReportDownloadView.as_view()
+        return view(request, pk=self.report.pk)
+
+    def test_download(self):
+        response = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertIn('Org Example Report', response['Content-Disposition'])
+
+        response = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_other_users_report(self):
+        self.user = User.objects.create(username='other')
+        with self.assertRaises(Http404):
+            self.get()
+
+    def test_range(self):
+        response = self.get(HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+
+        response = self.get(HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+
+        # Full document if it changed since the range was requested
+        response = self.get(HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_content_disposition(self):
+        self.assertEqual(
+            content_disposition(u'Caf\xe9 "Q1"\r\n.pdf'),
+            'attachment; filename="Cafe \\"Q1\\".pdf"; '
+            "filename*=UTF-8''Caf%C3%A9%20%22Q1%22%0D%0A.pdf")
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-', 10), (0, 9))
+        self.assertEqual(parse_range('bytes=-3', 10), (7, 9))
+        self.assertEqual(parse_range('bytes=5-100', 10), (5, 9))
+        self.assertIsNone(parse_range('bytes=0-1,4-5', 10))
+        self.assertFalse(parse_range('bytes=10-', 10))
+
+    def test_offload(self):
+        view = ReportDownloadView.as_view(backend='x-accel-redirect')
+        response = self.get(view)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected/' + self.report.document.name)
+
+        view = ReportDownloadView.as_view(backend='url')
+        response = self.get(view)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], self.report.document.url)
+
+    def test_compressed(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        data = b'0123456789' * 100
+        with patch.object(report_storage, '_wrapped',
+                          CompressedFileSystemStorage(location=location)):
+            self.report.document.save('report.pdf', ContentFile(data))
+            self.report.profile.save('profile.zip', ContentFile(data))
+            self.assertLess(self.report.document.size, len(data))
+
+            # Sizes were not recorded for older reports
+            response = self.get(HTTP_RANGE='bytes=995-')
+            self.assertEqual(response['Content-Range'], 'bytes 995-999/1000')
+            self.assertEqual(b''.join(response.streaming_content), b'56789')
+
+            Report.objects.update(profile_size=len(data))
+            view = ReportDownloadView.as_view(field='profile')
+            response = self.get(view)
+            self.assertEqual(response['Content-Length'], '1000')
+            self.assertEqual(b''.join(response.streaming_content), data)
+
+            # Streamed as the web server would send it compressed
+            view = ReportDownloadView.as_view(backend='x-accel-redirect')
+            response = self.get(view)
+            self.assertNotIn('X-Accel-Redirect', response)
+            self.assertEqual(b''.join(response.streaming_content), data)
@@ -0,0 +1,32 @@
+from django.test import SimpleTestCase
+from unittest.mock import patch
+
+from reports import warmup
+
+
+@patch('reports.warmup._connect_chrome')
+@patch('reports.warmup.pypandoc.get_pandoc_version')
+class WarmUpTestCase(SimpleTestCase):
+
+    def test_warm_up(self, mVersion, mConnect):
+        self.assertTrue(warmup.warm_up())
+
+        self.assertTrue(warmup.is_ready())
+        self.assertEqual(list(warmup.results()),
+                         ['reports', 'pandoc', 'chrome'])
+        mVersion.assert_called_once_with()
+        mConnect.assert_called_once_with()
+
+    def test_failed_step(self, mVersion, mConnect):
+        mVersion.side_effect = OSError('No pandoc was found')
+
+        self.assertFalse(warmup.warm_up())
+
+        self.assertFalse(warmup.is_ready())
+        self.assertFalse(warmup.results()['pandoc']['ok'])
+        self.assertTrue(warmup.results()['chrome']['ok'])
+
+    @patch('reports.warmup._render')
+    def test_render(self, mRender, mVersion, mConnect):
+        warmup.warm_up(render=True)
+        mRender.assert_called_once_with()
@@ -0,0 +1,14 @@
+from django.urls import path
+
+from .views import ReportDownloadView, ReportPreviewView
+
+app_name = 'reports'
+
+urlpatterns = [
+    path('<int:pk>/download/', ReportDownloadView.as_view(),
+         name='report_download'),
+    path('<int:pk>/profile/', ReportDownloadView.as_view(field='profile'),
+         name='report_profile'),
+    path('<int:pk>/preview/', ReportPreviewView.as_view(),
+         name='report_preview'),
+]
@@ -1,6 +1,9 @@
 import os
+import threading
+from collections import OrderedDict
 from random import choice
 from string import ascii_uppercase, ascii_lowercase, digits
+from time import time
 
 from django.template.defaultfilters import slugify
 
@@ -15,3 +18,68 @@ def hashed_upload_to(prefix, fileattr, filename):
     options = ascii_uppercase + ascii_lowercase + digits
     rand = ''.join(choice(options) for _ in range(10))
     return '%s/%s/%s%s' % (prefix, rand, slugify(base), ext)
+
+
+class LRUCache(object):
+    """
+    Thread safe LRU cache bounded by the total size of its values. Values
+    stored with a timeout expire after that many seconds.
+    """
+
+    def __init__(self, max_size, sizeof=len):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, size, expires = self._data.pop(key)
+            except KeyError:
+                return default
+            if expires is not None and expires <= time():
+                self.size -= size
+                return default
+            self._data[key] = (value, size, expires)
+            return value
+
+    def set(self, key, value, size=None, timeout=None):
+        """
+        Stores the value, evicting the least recently used ones to make
+        room. Values larger than the whole cache are not stored.
+        :return: True if the value was stored
+        """
+
+        size = self.sizeof(value) if size is None else size
+        if size > self.max_size:
+            return False
+        expires = time() + timeout if timeout is not None else None
+
+        with self._lock:
+            if key in self._data:
+                self.size -= self._data.pop(key)[1]
+            while self._data and self.size + size > self.max_size:
+                __, (__, evicted, __) = self._data.popitem(last=False)
+                self.size -= evicted
+            self._data[key] = (value, size, expires)
+            self.size += size
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self.size -= self._data.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
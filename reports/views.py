@@ -0,0 +1,262 @@
+import hashlib
+import mimetypes
+import os
+import re
+import unicodedata
+from urllib.parse import quote
+
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db.models import Q
+from django.http import (Http404, HttpResponse, HttpResponseRedirect,
+                         StreamingHttpResponse)
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import (add_never_cache_headers,
+                                get_conditional_response)
+from django.utils.http import http_date, quote_etag
+from django.views.generic import View
+
+from .conf import (DOWNLOAD_ACCEL_PREFIX, DOWNLOAD_BACKEND,
+                   DOWNLOAD_CHUNK_SIZE)
+from .models import Report
+from .storage import CompressedStorageMixin
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+BACKEND_ACCEL = 'x-accel-redirect'
+BACKEND_SENDFILE = 'x-sendfile'
+BACKEND_URL = 'url'
+
+
+def content_disposition(filename):
+    """
+    :return: ``Content-Disposition`` header of an attachment, with an ASCII
+        fallback and the UTF-8 filename of RFC 5987
+    """
+
+    fallback = unicodedata.normalize('NFKD', filename) \
+        .encode('ascii', 'ignore').decode('ascii')
+    fallback = ''.join(c for c in fallback if c.isprintable()) \
+        .replace('\\', '\\\\').replace('"', '\\"')
+    return 'attachment; filename="{0}"; filename*=UTF-8\'\'{1}'.format(
+        fallback, quote(filename, safe=''))
+
+
+def parse_range(header, size):
+    """
+    Parses a single byte range of a ``Range`` header
+    :return: (start, end) inclusive, None if the header is not usable or
+        False if the range can not be satisfied
+    """
+
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+
+    start, end = match.groups()
+    if not start:
+        # Suffix range, the last n bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+class ReportDownloadView(LoginRequiredMixin, View):
+    """
+    Serves ``Report.document`` or ``Report.profile``. The file is either
+    streamed in chunks, with support for conditional and range requests, or
+    handed over to the web server or storage depending on
+    ``REPORT_DOWNLOAD_BACKEND``. Files of compressed storages are always
+    streamed, the web server would send them compressed.
+    """
+
+    backend = DOWNLOAD_BACKEND
+    accel_prefix = DOWNLOAD_ACCEL_PREFIX
+    chunk_size = DOWNLOAD_CHUNK_SIZE
+    # File field to serve, ``document`` or ``profile``
+    field = 'document'
+
+    def get_queryset(self):
+        """
+        Staff users can download every report, others only their own ones
+        """
+
+        empty = Q(**{self.field: ''}) | Q(**{self.field: None})
+        qs = Report.objects.exclude(empty)
+        if self.request.user.is_staff:
+            return qs
+        return qs.filter(created_by=self.request.user)
+
+    def get_file(self, report):
+        return getattr(report, self.field)
+
+    def get_filename(self, report):
+        if self.field == 'document':
+            return report._run_instance_method('get_report_filename')
+        return os.path.basename(self.get_file(report).name)
+
+    def get_etag(self, report):
+        # File names contain a random part, so they change on every
+        # generation of the report.
+        name = self.get_file(report).name.encode('utf-8')
+        return quote_etag(hashlib.md5(name).hexdigest())
+
+    def get_last_modified(self, report):
+        fieldfile = self.get_file(report)
+        try:
+            return fieldfile.storage.get_modified_time(fieldfile.name)
+        except NotImplementedError:
+            return report.created_at
+
+    def get(self, request, pk):
+        report = get_object_or_404(self.get_queryset(), pk=pk)
+        filename = self.get_filename(report)
+
+        etag = self.get_etag(report)
+        last_modified = self.get_last_modified(report)
+        timestamp = int(last_modified.timestamp())
+        response = get_conditional_response(request, etag=etag,
+                                            last_modified=timestamp)
+        if response is None:
+            if self.backend and self.can_offload(report):
+                response = self.offload(report)
+            else:
+                response = self.stream(request, report, etag, timestamp)
+
+        if response.status_code != 302:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(timestamp)
+            response['Content-Disposition'] = content_disposition(filename)
+        return response
+
+    def can_offload(self, report):
+        storage = self.get_file(report).storage
+        return not isinstance(storage, CompressedStorageMixin)
+
+    def offload(self, report):
+        fieldfile = self.get_file(report)
+        if self.backend == BACKEND_URL:
+            return HttpResponseRedirect(fieldfile.url)
+
+        response = HttpResponse(content_type=self.content_type(report))
+        if self.backend == BACKEND_ACCEL:
+            response['X-Accel-Redirect'] = self.accel_prefix.rstrip('/') + \
+                '/' + fieldfile.name
+        elif self.backend == BACKEND_SENDFILE:
+            response['X-Sendfile'] = fieldfile.path
+        else:
+            raise ValueError('Unknown download backend "{0}"'.format(
+                self.backend))
+        return response
+
+    def content_type(self, report):
+        content_type, __ = mimetypes.guess_type(self.get_file(report).name)
+        return content_type or 'application/octet-stream'
+
+    def get_size(self, report):
+        """
+        :return: size of the file as it is downloaded, the stored size
+            differs for compressed storages
+        """
+
+        size = getattr(report, '{0}_size'.format(self.field), None)
+        if size is not None:
+            return size
+        fieldfile = self.get_file(report)
+        if not isinstance(fieldfile.storage, CompressedStorageMixin):
+            return fieldfile.size
+
+        # Files stored before their size was recorded
+        size = 0
+        stored = fieldfile.storage.open(fieldfile.name, 'rb')
+        try:
+            for chunk in iter(lambda: stored.read(self.chunk_size), b''):
+                size += len(chunk)
+        finally:
+            stored.close()
+        return size
+
+    def stream(self, request, report, etag, timestamp):
+        size = self.get_size(report)
+        start, end = 0, size - 1
+        status = 200
+
+        header = request.META.get('HTTP_RANGE')
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range and if_range not in (etag, http_date(timestamp)):
+            # The document changed, send all of it
+            header = None
+        if header:
+            byte_range = parse_range(header, size)
+            if byte_range is False:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */{0}'.format(size)
+                return response
+            if byte_range:
+                start, end = byte_range
+                status = 206
+
+        response = StreamingHttpResponse(
+            self.read_chunks(report, start, end - start + 1),
+            status=status, content_type=self.content_type(report))
+        response['Content-Length'] = str(end - start + 1)
+        response['Accept-Ranges'] = 'bytes'
+        if status == 206:
+            response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(
+                start, end, size)
+        return response
+
+    def read_chunks(self, report, offset, length):
+        fieldfile = self.get_file(report)
+        stored = fieldfile.storage.open(fieldfile.name, 'rb')
+        try:
+            if offset:
+                stored.seek(offset)
+            while length > 0:
+                chunk = stored.read(min(self.chunk_size, length))
+                if not chunk:
+                    break
+                length -= len(chunk)
+                yield chunk
+        finally:
+            stored.close()
+
+
+class ReportPreviewView(LoginRequiredMixin, View):
+    """
+    Serves a preview of a report whose document is not generated yet. A POST
+    also queues its generation, GET requests do not change anything.
+    Generated reports redirect to the download.
+    """
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return Report.objects.all()
+        return Report.objects.filter(created_by=self.request.user)
+
+    def get(self, request, pk):
+        return self.preview(pk, schedule=False)
+
+    def post(self, request, pk):
+        return self.preview(pk, schedule=True)
+
+    def preview(self, pk, schedule):
+        report = get_object_or_404(self.get_queryset(), pk=pk)
+        if report.generated:
+            return HttpResponseRedirect(
+                reverse('reports:report_download', args=(report.pk,)))
+
+        try:
+            html = report.generate_preview(schedule=schedule)
+        except NotImplementedError:
+            raise Http404('Report "{0}" does not support previews'.format(
+                report.report))
+        response = HttpResponse(html, content_type='text/html; charset=utf-8')
+        response['X-Report-State'] = report.generation_state
+        add_never_cache_headers(response)
+        return response
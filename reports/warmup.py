@@ -0,0 +1,120 @@
+"""
+Warm-up of new Celery worker processes.
+
+The first report rendered by a fresh process pays for importing the report
+modules, locating pandoc and connecting to Chrome. ``warm_up`` does that work
+when the process starts instead.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from timeit import default_timer
+
+import pypandoc
+from celery.signals import worker_process_init
+
+from . import metrics
+from .conf import WARMUP, WARMUP_RENDER
+
+logger = logging.getLogger(__name__)
+
+_ready = threading.Event()
+_results = OrderedDict()
+
+
+def is_ready():
+    """
+    :return: True once warm-up finished without errors
+    """
+
+    return _ready.is_set()
+
+
+def results():
+    """
+    :return: duration and status of each warm-up step
+    """
+
+    return dict(_results)
+
+
+def _load_reports():
+    from .models import REPORTS
+
+    for cls in REPORTS.values():
+        cls()
+
+
+def _check_pandoc():
+    pypandoc.get_pandoc_version()
+
+
+def _connect_chrome():
+    from .chrome import get_pool
+
+    pool = get_pool()
+    pool.check_health(force=True)
+    if not any(endpoint.healthy for endpoint in pool.endpoints):
+        raise RuntimeError('No healthy Chrome endpoints')
+
+
+def _render():
+    from .base import BaseReport
+
+    report = BaseReport()
+    report.markdown_to_doc('# Warm-up', 'docx')
+    report.html_to_pdf(b'<p>Warm-up</p>', delay=0)
+
+
+def warm_up(render=WARMUP_RENDER):
+    """
+    Runs the warm-up steps, failing steps are logged and do not stop the
+    following ones.
+    :param render: render a tiny docx and pdf document as well
+    :return: True if every step succeeded
+    """
+
+    steps = [
+        ('reports', _load_reports),
+        ('pandoc', _check_pandoc),
+        ('chrome', _connect_chrome),
+    ]
+    if render:
+        steps.append(('render', _render))
+
+    _ready.clear()
+    _results.clear()
+    start = default_timer()
+    ok = True
+    for name, func in steps:
+        step_start = default_timer()
+        try:
+            func()
+        except Exception as exc:
+            logger.warning('Warm-up step %s failed: %s', name, exc)
+            ok = False
+            _results[name] = {'ok': False, 'error': str(exc)}
+        else:
+            _results[name] = {'ok': True}
+        duration = default_timer() - step_start
+        _results[name]['duration'] = duration
+        metrics.timing('reports.warmup.step', duration, step=name)
+
+    duration = default_timer() - start
+    metrics.timing('reports.warmup', duration)
+    metrics.gauge('reports.warmup.ready', int(ok))
+    logger.info('Warm-up finished in %.2fs (%s)', duration,
+                'ready' if ok else 'with errors')
+    if ok:
+        _ready.set()
+    return ok
+
+
+@worker_process_init.connect
+def on_worker_process_init(**kwargs):
+    # Celery expects this signal's handlers to return within a few seconds,
+    # so the warm-up runs in the background.
+    if WARMUP:
+        thread = threading.Thread(target=warm_up, name='reports-warmup')
+        thread.daemon = True
+        thread.start()
@@ -68,8 +68,16 @@ setup(
         'django-celery-beat',
         'jsonfield',
         'pypandoc',
-        'pychrome'
+        'pychrome',
+        'requests',
     ],
+    extras_require={
+        'data': ['numpy'],
+        'xlsx': ['openpyxl'],
+        'charts': ['matplotlib'],
+        's3': ['boto3'],
+        'pdf': ['pikepdf', 'Pillow'],
+    },
     classifiers=[
         'Development Status :: 4 - Beta',
         'Environment :: Web Environment',